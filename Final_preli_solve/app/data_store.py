@@ -1,55 +1,1069 @@
 
 from __future__ import annotations
 import json
+import os
+import re
+import secrets
+import sys
 import threading
 import time
-from typing import Dict, List, Any, Optional
+import numpy as np
+from contextlib import ExitStack, contextmanager, nullcontext
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Set, Tuple
 from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+from .services.journal import Journal, read_journal
+from .services.vote_log import VoteLog, epoch_us
+from .services.key_order import KeyOrder
+from .services.rwlock import RWLock, WouldBlock, blocking_allowed, nonblocking
+from .shared_store import STORE_METHODS
+from .services import schulze as schulze_engine
+from .services import telemetry
+from .services import fastjson
+from .services import snapshot
+from .services import privacy
+from .models.voter import VoterOut
+from .models.candidate import CandidateOut
+from .services.encryption import MODULUS
+
+VOTER_FIELDS = tuple(VoterOut.__fields__)
+CANDIDATE_FIELDS = tuple(CandidateOut.__fields__)
+
+_NO_KEYS = KeyOrder()  # stands in for an empty index bucket
+SNAPSHOT_FORMATS = ("json", "binary")
+
+class StoreError(Exception):
+    """A store operation was rejected; mapped to an HTTP error response by the app."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
 
 class InMemoryStore:
     """
     Simple, thread-safe in-memory store with optional JSON persistence.
+
+    Every mutation is a small record (``{"seq", "op", ...}``) that is appended to a
+    write-ahead journal next to the snapshot and then applied in memory. ``save()``
+    compacts: it writes a snapshot tagged with the last journal seq and truncates the
+    journal. Startup loads the snapshot and replays the journal records after that seq.
+
+    Concurrency: each collection has its own readers-writer lock, so lookups don't
+    queue behind vote scans, snapshots or writes to other collections. Locks are
+    always taken in this order, never the reverse:
+
+        voters -> candidates -> votes -> ballots -> contests -> journal
+
+    - Writes to one collection are serialized, and its journal order is its apply order.
+    - A vote (or ballot) commits while its voter and candidate are read-locked, so it is
+      journaled before any later delete of either.
+    - Single-record reads (get_voter, voter_exists, get_candidate, has_standard_vote)
+      take no lock: records are replaced, never mutated in place, so a reader sees the
+      old or the new record.
+    - save() copies a consistent cut of every collection under read locks and writes
+      the snapshot after releasing them.
     """
-    def __init__(self, persist_path: Optional[str] = None):
-        self._lock = threading.RLock()
+    def __init__(
+        self,
+        persist_path: Optional[str] = None,
+        fsync: str = "interval",
+        snapshot_every: int = 100_000,
+        snapshot_format: str = "json",
+        dp_budget: Optional[float] = None,
+    ):
+        self._voters_lock = RWLock("voters", telemetry.lock_waited)
+        self._candidates_lock = RWLock("candidates", telemetry.lock_waited)
+        self._votes_lock = RWLock("votes", telemetry.lock_waited)  # votes and everything derived from them
+        self._ballots_lock = RWLock("ballots", telemetry.lock_waited)  # encrypted ballots and their running aggregate
+        self._contests_lock = RWLock("contests", telemetry.lock_waited)
+        self._journal_lock = threading.Lock()  # seq + journal appends
+        self._metrics_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saving = False
+        self._reloading = False
+        self._last_load: Optional[dict] = None
+        self._collection_locks = (
+            self._voters_lock, self._candidates_lock, self._votes_lock, self._ballots_lock, self._contests_lock,
+        )
+        # the collection each journal op writes to
+        self._op_locks = {
+            "put_voter": (self._voters_lock,), "del_voter": (self._voters_lock,),
+            "put_candidate": (self._candidates_lock,), "del_candidate": (self._candidates_lock,),
+            "vote": (self._votes_lock,), "ballot": (self._ballots_lock,),
+            "put_contest": (self._contests_lock,), "contest_ballots": (self._contests_lock,),
+            "reset": self._collection_locks,
+        }
         self.voters: Dict[str, dict] = {}
         self.candidates: Dict[str, dict] = {}
-        self.votes: List[dict] = []
+        # columnar log; rows read back as dicts (see services/vote_log.py)
+        self.votes = VoteLog()
         self.encrypted_ballots: List[dict] = []
+        # ranked-choice contests: candidates, ballot count, running pairwise matrix d[a][b]
+        # and the cached Schulze result (dropped whenever a ballot arrives)
+        self.contests: Dict[str, dict] = {}
+        # running homomorphic aggregate of accepted encrypted ballots (sum mod MODULUS),
+        # overall and per metadata key -> value label
+        self._ballot_agg: Dict[str, int] = {"ballots": 0, "skipped": 0, "sum": 0}
+        self._ballot_groups: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # voter_ids that already cast a standard (non-weighted) vote
+        self._standard_voters: Set[str] = set()
+        # running per-candidate totals: weighted (standard votes count 1.0) and raw vote counts.
+        # Keyed by candidate_id for every vote ever cast; reads filter by the current roster so
+        # a deleted candidate drops off the board and a re-registered one gets its votes back.
+        self.tallies: Dict[str, float] = {}
+        self.vote_counts: Dict[str, int] = {}
+        # time index: epoch-us keys kept sorted, with the matching positions in self.votes
+        self._ts_keys = array("q")
+        self._ts_order = array("q")
+        # insertion order of voter/candidate ids with stable cursors for paging
+        self._voter_order = KeyOrder()
+        self._candidate_order = KeyOrder()
+        # secondary indexes: field value -> ids in insertion order, sharing the seqs (and
+        # so the page cursors) of _voter_order/_candidate_order; empty values aren't indexed
+        self._voters_by_district: Dict[str, KeyOrder] = {}
+        self._candidates_by_party: Dict[str, KeyOrder] = {}
+        # serialized records for the JSON read paths: id -> (record, bytes). A hit only
+        # counts if the record object is still the stored one (records are replaced on
+        # update), so lock-free readers never serve a stale encoding.
+        self._voter_json: Dict[str, Tuple[dict, bytes]] = {}
+        self._candidate_json: Dict[str, Tuple[dict, bytes]] = {}
+        # mutation generation per collection, bumped after each commit is applied (under
+        # the collection's write lock); the epoch tells this instance's counts from another's
+        self._generations: Dict[str, int] = {lock.name: 0 for lock in self._collection_locks}
+        self._epoch = secrets.token_hex(4)
+        # DP releases of results, cached per version; epsilon spent per metric (in memory only)
+        self._dp = privacy.Releases(dp_budget)
         self.metrics: Dict[str, Any] = {"start_time": time.time(), "requests": 0}
         self.persist_path = Path(persist_path) if persist_path else None
-        if self.persist_path and self.persist_path.exists():
-            self._load()
+        self.journal_path = self.persist_path.with_suffix(".wal") if self.persist_path else None
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        # "binary" writes <persist_path>.snap (see services/snapshot.py); JSON stays available via save("json")
+        self.snapshot_format = snapshot_format
+        self._journal: Optional[Journal] = None
+        self._seq = 0
+        if self.persist_path and self.persist_path.parent.is_dir():
+            good_offset = self._load()
+            self._journal = Journal(self.journal_path, fsync=fsync, truncate_at=good_offset)
+
+    # collection lock order (attribute _<name>_lock); see the class docstring
+    _LOCK_ORDER = ("voters", "candidates", "votes", "ballots", "contests")
+
+    # everything a snapshot load + journal replay rebuilds; reload() swaps it in as a unit
+    _STATE = (
+        "voters", "candidates", "votes", "encrypted_ballots", "contests",
+        "_ballot_agg", "_ballot_groups", "_standard_voters", "tallies", "vote_counts",
+        "_ts_keys", "_ts_order", "_voter_order", "_candidate_order",
+        "_voters_by_district", "_candidates_by_party", "_voter_json", "_candidate_json", "_seq",
+    )
+
+    def _load(self) -> int:
+        """Load the snapshot, replay the journal tail; returns the journal's last good offset."""
+        with self._hold(self._collection_locks, write=True):
+            self._load_snapshot()
+            records, good_offset = read_journal(self.journal_path)
+            self._replay(records)
+            return good_offset
+
+    def _snapshot_file(self, fmt: str) -> Path:
+        return self.persist_path if fmt == "json" else self.persist_path.with_suffix(".snap")
+
+    def _load_snapshot(self):
+        """
+        Load the snapshot, JSON or binary, that covers the most journal records (the
+        newer file if both cover the same), and its derived indexes.
+        """
+        files = [
+            (self._snapshot_seq(fmt, p), p.stat().st_mtime_ns, fmt, p)
+            for fmt in SNAPSHOT_FORMATS if (p := self._snapshot_file(fmt)).exists()
+        ]
+        if not files:
+            return
+        *_, fmt, path = max(files)
+        if fmt == "binary":
+            self._load_binary(path)
+        else:
+            self._load_json(path)
+            self._reindex()
+
+    @staticmethod
+    def _snapshot_seq(fmt: str, path: Path) -> int:
+        """The journal_seq a snapshot file was taken at; -1 if it can't be read."""
+        try:
+            if fmt == "binary":
+                return snapshot.Snapshot(path).header["journal_seq"]
+            # save() writes journal_seq as the last key: read the tail, not the whole file
+            with path.open("rb") as f:
+                f.seek(max(0, f.seek(0, os.SEEK_END) - 64))
+                m = re.search(rb'"journal_seq":\s*(\d+)\s*}\s*$', f.read())
+            if m:
+                return int(m.group(1))
+            with path.open("r", encoding="utf-8") as f:
+                return json.load(f).get("journal_seq", 0)
+        except Exception:
+            return -1
 
-    def _load(self):
+    def _load_json(self, path: Path):
         try:
-            with self._lock, self.persist_path.open("r", encoding="utf-8") as f:
+            with path.open("r", encoding="utf-8") as f:
                 blob = json.load(f)
-                self.voters = blob.get("voters", {})
-                self.candidates = blob.get("candidates", {})
-                self.votes = blob.get("votes", [])
-                self.encrypted_ballots = blob.get("encrypted_ballots", [])
+            self.voters = blob.get("voters", {})
+            self.candidates = blob.get("candidates", {})
+            self.votes = VoteLog(blob.get("votes", []))
+            self.encrypted_ballots = blob.get("encrypted_ballots", [])
+            self.contests = self._contests_from(blob.get("contests", {}))
+            self._seq = blob.get("journal_seq", 0)
         except Exception:
             # ignore load errors (start clean)
             pass
 
-    def save(self):
-        if not self.persist_path:
+    def _load_binary(self, path: Path):
+        """
+        Map a binary snapshot: typed columns are copied out (a memcpy each), records and
+        ids stay in the map until touched, and the derived indexes are read back rather
+        than rebuilt, so startup doesn't grow with the number of records.
+        """
+        snap = snapshot.Snapshot(path)
+        h = snap.header
+        for name, field, index in (("voters", "_voter_order", "_voters_by_district"), ("candidates", "_candidate_order", "_candidates_by_party")):
+            section = snapshot.RecordSection(snap, name)
+            setattr(self, name, section.mapping())
+            # seqs are row numbers, as a JSON load would number them
+            setattr(self, field, KeyOrder.mapped(section.ids, np.arange(len(section.ids), dtype=np.int64)))
+            setattr(self, index, {value: KeyOrder.mapped(ids, rows) for value, ids, rows in section.groups()})
+        self.votes = VoteLog.mapped(snap, "votes")
+        self._ts_keys, self._ts_order = array("q"), array("q")
+        self._ts_keys.frombytes(snap.section("votes.ts_keys"))
+        self._ts_order.frombytes(snap.section("votes.ts_order"))
+        self._standard_voters = snapshot.MappedSet(snap.strings("standard_voters"))
+        self.encrypted_ballots = snapshot.MappedList(snap.strings("ballots", decode=fastjson.loads))
+        self.contests = self._contests_from(h["contests"])
+        self.tallies = h["tallies"]
+        self.vote_counts = h["vote_counts"]
+        self._ballot_agg = h["ballot_agg"]
+        self._ballot_groups = h["ballot_groups"]
+        self._voter_json = {}
+        self._candidate_json = {}
+        self._seq = h["journal_seq"]
+
+    @staticmethod
+    def _contests_from(blob: dict) -> Dict[str, dict]:
+        return {
+            cid: {
+                **c,
+                "pairwise": np.array(c["pairwise"], dtype=np.int64).reshape(len(c["candidates"]), len(c["candidates"])),
+                "result": None,
+            }
+            for cid, c in blob.items()
+        }
+
+    def _replay(self, records: List[dict]):
+        for rec in records:
+            # records at or below the snapshot's seq are already in it
+            if rec.get("seq", 0) > self._seq:
+                self._apply(rec)
+                self._seq = rec["seq"]
+
+    def _apply(self, rec: dict):
+        """Apply one mutation record to the in-memory state (live or during replay)."""
+        op = rec["op"]
+        if op == "put_voter":
+            vid = rec["data"]["voter_id"]
+            old = self.voters.get(vid)
+            self.voters[vid] = rec["data"]
+            self._voter_order.add(vid)
+            self._voter_json.pop(vid, None)
+            self._reindex_field(self._voters_by_district, self._voter_order, vid, old, rec["data"], "district")
+        elif op == "del_voter":
+            old = self.voters.pop(rec["id"], None)
+            self._reindex_field(self._voters_by_district, self._voter_order, rec["id"], old, None, "district")
+            self._voter_order.remove(rec["id"])
+            self._voter_json.pop(rec["id"], None)
+        elif op == "put_candidate":
+            cid = rec["data"]["candidate_id"]
+            old = self.candidates.get(cid)
+            self.candidates[cid] = rec["data"]
+            self._candidate_order.add(cid)
+            self._candidate_json.pop(cid, None)
+            self._reindex_field(self._candidates_by_party, self._candidate_order, cid, old, rec["data"], "party")
+        elif op == "del_candidate":
+            old = self.candidates.pop(rec["id"], None)
+            self._reindex_field(self._candidates_by_party, self._candidate_order, rec["id"], old, None, "party")
+            self._candidate_order.remove(rec["id"])
+            self._candidate_json.pop(rec["id"], None)
+        elif op == "vote":
+            self._append_vote(rec["data"])
+        elif op == "ballot":
+            self.encrypted_ballots.append(rec["data"])
+            self._aggregate_ballot(rec["data"])
+        elif op == "put_contest":
+            n = len(rec["data"]["candidates"])
+            self.contests[rec["data"]["contest_id"]] = {
+                **rec["data"], "ballots": 0, "pairwise": np.zeros((n, n), dtype=np.int64), "result": None,
+            }
+        elif op == "contest_ballots":
+            c = self.contests[rec["id"]]
+            c["pairwise"] = c["pairwise"] + schulze_engine.pairwise_matrix(c["candidates"], rec["ballots"])
+            c["ballots"] += len(rec["ballots"])
+            c["result"] = None
+        elif op == "reset":
+            self._clear()
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+
+    def _hold(self, locks, write: bool):
+        """Take several collection locks in the documented order."""
+        if len(locks) == 1:
+            return locks[0].write() if write else locks[0].read()
+        with ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock.write() if write else lock.read())
+            return stack.pop_all()  # released by the caller; a WouldBlock above releases them here
+
+    def _commit(self, op: str, **fields):
+        """Journal a mutation (write-ahead), then apply it, under its collection's write lock."""
+        with self._hold(self._op_locks[op], write=True):
+            if not blocking_allowed() and self._journal and self.fsync == "always":
+                raise WouldBlock()  # a per-record fsync doesn't belong on the event loop
+            if not self._journal_lock.acquire(False):
+                if not blocking_allowed():
+                    raise WouldBlock()
+                started = time.perf_counter()
+                self._journal_lock.acquire()
+                telemetry.lock_waited("journal", "write", time.perf_counter() - started)
+            try:
+                rec = {"seq": self._seq + 1, "op": op, **fields}
+                if self._journal:
+                    started = time.perf_counter()
+                    self._journal.append(rec)
+                    telemetry.journal_append.observe(time.perf_counter() - started)
+                self._seq = rec["seq"]
+                compact = bool(self._journal) and self._journal.records >= self.snapshot_every and not self._saving
+                self._saving = self._saving or compact
+            finally:
+                self._journal_lock.release()
+            self._apply(rec)
+            for lock in self._op_locks[op]:
+                self._generations[lock.name] += 1
+        if compact:
+            # snapshot in the background; save() only needs read locks
+            threading.Thread(target=self._background_save, daemon=True).start()
+
+    def _background_save(self):
+        try:
+            self.save()
+        finally:
+            self._saving = False
+
+    @staticmethod
+    def _reindex_field(index: Dict[str, KeyOrder], order: KeyOrder, key: str, old: Optional[dict], new: Optional[dict], field: str):
+        """Move `key` between the buckets of a secondary index when `field` changes."""
+        before = (old or {}).get(field) or None
+        after = (new or {}).get(field) or None
+        if before == after:
             return
-        blob = {
-            "voters": self.voters,
-            "candidates": self.candidates,
-            "votes": self.votes,
-            "encrypted_ballots": self.encrypted_ballots,
+        if before is not None:
+            bucket = index[before]
+            bucket.remove(key)
+            if not len(bucket):
+                del index[before]
+        if after is not None:
+            index.setdefault(after, KeyOrder()).add(key, order.seq(key))
+
+    def _reindex(self):
+        """Rebuild the derived indexes from the voters, candidates and votes collections."""
+        self._voter_order = KeyOrder(self.voters)
+        self._candidate_order = KeyOrder(self.candidates)
+        self._voters_by_district = {}
+        for vid in self._voter_order:
+            self._reindex_field(self._voters_by_district, self._voter_order, vid, None, self.voters[vid], "district")
+        self._candidates_by_party = {}
+        for cid in self._candidate_order:
+            self._reindex_field(self._candidates_by_party, self._candidate_order, cid, None, self.candidates[cid], "party")
+        self._voter_json = {}
+        self._candidate_json = {}
+        self._ballot_agg = {"ballots": 0, "skipped": 0, "sum": 0}
+        self._ballot_groups = {}
+        for b in self.encrypted_ballots:
+            self._aggregate_ballot(b)
+        self._standard_voters = self.votes.standard_voters()
+        self.tallies, self.vote_counts = self.votes.tallies()
+        ts = self.votes.ts_us
+        # stable sort: equal timestamps stay in append order
+        self._ts_order = array("q", sorted(range(len(ts)), key=ts.__getitem__))
+        self._ts_keys = array("q", (ts[i] for i in self._ts_order))
+
+    def _aggregate_ballot(self, data: dict):
+        try:
+            c = int(data["ciphertext"], 16)
+        except ValueError:
+            self._ballot_agg["skipped"] += 1  # not a hex ciphertext; can't be summed
+            return
+        self._ballot_agg["ballots"] += 1
+        self._ballot_agg["sum"] = (self._ballot_agg["sum"] + c) % MODULUS
+        for key, value in (data.get("metadata") or {}).items():
+            label = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+            g = self._ballot_groups.setdefault(key, {}).setdefault(label, {"ballots": 0, "sum": 0})
+            g["ballots"] += 1
+            g["sum"] = (g["sum"] + c) % MODULUS
+
+    def _index_time(self, key: int, pos: int):
+        if not self._ts_keys or key >= self._ts_keys[-1]:
+            self._ts_keys.append(key)
+            self._ts_order.append(pos)
+        else:
+            # client-supplied timestamps may arrive out of order
+            at = bisect_right(self._ts_keys, key)
+            self._ts_keys.insert(at, key)
+            self._ts_order.insert(at, pos)
+
+    def _count_vote(self, v: dict):
+        w = float(v.get("weight", 1.0)) if v.get("weighted") else 1.0
+        cid = v["candidate_id"]
+        self.tallies[cid] = self.tallies.get(cid, 0.0) + w
+        self.vote_counts[cid] = self.vote_counts.get(cid, 0) + 1
+
+    def _append_vote(self, payload: dict):
+        self.votes.append(payload)
+        if not payload.get("weighted", False):
+            self._standard_voters.add(payload["voter_id"])
+        self._count_vote(payload)
+        self._index_time(self.votes.ts_us[-1], len(self.votes) - 1)
+
+    # Mutations
+    def put_voter(self, data: dict):
+        self._commit("put_voter", data=data)
+
+    def remove_voter(self, voter_id: str):
+        self._commit("del_voter", id=voter_id)
+
+    def put_candidate(self, data: dict):
+        self._commit("put_candidate", data=data)
+
+    def remove_candidate(self, candidate_id: str):
+        self._commit("del_candidate", id=candidate_id)
+
+    def add_vote(self, payload: dict):
+        """Append a vote record and keep the derived indexes in sync."""
+        self._commit("vote", data=payload)
+
+    def add_encrypted_ballot(self, data: dict) -> int:
+        with self._ballots_lock.write():
+            self._commit("ballot", data=data)
+            return len(self.encrypted_ballots) - 1
+
+    # Checked operations: validate and mutate under one hold of the collection's write lock
+    def register_voter(self, data: dict) -> dict:
+        with self._voters_lock.write():
+            if data["voter_id"] in self.voters:
+                raise StoreError(409, "Duplicate voter_id")
+            self.put_voter(data)
+            return data
+
+    def update_voter(self, voter_id: str, changes: dict) -> dict:
+        with self._voters_lock.write():
+            v = self.voters.get(voter_id)
+            if not v:
+                raise StoreError(404, "Voter not found")
+            data = v.copy()
+            data.update(changes)
+            self.put_voter(data)
+            return data
+
+    def delete_voter(self, voter_id: str):
+        with self._voters_lock.write():
+            if voter_id not in self.voters:
+                raise StoreError(404, "Voter not found")
+            self.remove_voter(voter_id)
+
+    def register_candidate(self, data: dict) -> dict:
+        with self._candidates_lock.write():
+            if data["candidate_id"] in self.candidates:
+                raise StoreError(409, "Duplicate candidate_id")
+            self.put_candidate(data)
+            return data
+
+    def update_candidate(self, candidate_id: str, changes: dict) -> dict:
+        with self._candidates_lock.write():
+            c = self.candidates.get(candidate_id)
+            if not c:
+                raise StoreError(404, "Candidate not found")
+            data = c.copy()
+            data.update(changes)
+            self.put_candidate(data)
+            return data
+
+    def delete_candidate(self, candidate_id: str):
+        with self._candidates_lock.write():
+            if candidate_id not in self.candidates:
+                raise StoreError(404, "Candidate not found")
+            self.remove_candidate(candidate_id)
+
+    @contextmanager
+    def _casting(self):
+        # the voter and candidate can't be deleted while their vote commits
+        with self._voters_lock.read(), self._candidates_lock.read(), self._votes_lock.write():
+            yield
+
+    def cast_vote(self, payload: dict):
+        """Check and record a vote atomically; a voter gets one standard (non-weighted) vote."""
+        with self._casting():
+            if payload["voter_id"] not in self.voters:
+                raise StoreError(404, "Voter does not exist")
+            if payload["candidate_id"] not in self.candidates:
+                raise StoreError(404, "Candidate does not exist")
+            if payload["weighted"]:
+                if payload.get("weight") is None or payload["weight"] <= 0:
+                    raise StoreError(422, "Weight must be > 0")
+            elif self.has_standard_vote(payload["voter_id"]):
+                raise StoreError(409, "Duplicate vote from this voter")
+            self.add_vote(payload)
+
+    def submit_encrypted_ballot(self, data: dict) -> int:
+        with self._voters_lock.read(), self._ballots_lock.write():
+            if data["voter_id"] not in self.voters:
+                raise StoreError(404, "Voter does not exist")
+            return self.add_encrypted_ballot(data)
+
+    # Ranked-choice contests
+    def create_contest(self, data: dict) -> dict:
+        with self._contests_lock.write():
+            if data["contest_id"] in self.contests:
+                raise StoreError(409, "Duplicate contest_id")
+            self._commit("put_contest", data=data)
+            return data
+
+    def add_contest_ballots(self, contest_id: str, ballots: List[List[str]]) -> int:
+        """Fold new ranked ballots into the contest's pairwise matrix; returns the ballot total."""
+        with self._contests_lock.write():
+            if contest_id not in self.contests:
+                raise StoreError(404, "Contest not found")
+            self._commit("contest_ballots", id=contest_id, ballots=ballots)
+            return self.contests[contest_id]["ballots"]
+
+    def contest_result(self, contest_id: str) -> dict:
+        """Schulze result from the running matrix (path-strength phase only), cached per ballot count."""
+        with self._contests_lock.read():
+            c = self.contests.get(contest_id)
+            if c is None:
+                raise StoreError(404, "Contest not found")
+            if c["result"] is not None:
+                return c["result"]
+            d, candidates, ballots = c["pairwise"], c["candidates"], c["ballots"]
+        p = schulze_engine.strongest_paths(d)
+        result = {
+            "contest_id": contest_id,
+            "ballots": ballots,
+            "winners": schulze_engine.winners(candidates, p),
+            "matrix": p.tolist(),
+        }
+        with self._contests_lock.read():
+            # only cache if no ballot arrived while we were computing (a lone reference
+            # store, so the read lock is enough to keep it consistent with "ballots")
+            if self.contests.get(contest_id) is c and c["ballots"] == ballots:
+                c["result"] = result
+        return result
+
+    # Batched checked operations: one lock hold (and one journal sync) per batch
+    def _journal_batch(self):
+        return self._journal.batch() if self._journal else nullcontext()
+
+    def _apply_batch(self, op, items: List[dict], hold) -> List[dict]:
+        results = []
+        with hold(), self._journal_batch():
+            for item in items:
+                try:
+                    op(item)
+                    results.append({"status_code": 218})
+                except StoreError as e:
+                    results.append({"status_code": e.status_code, "detail": e.detail})
+        return results
+
+    def register_voters(self, rows: List[dict]) -> List[dict]:
+        return self._apply_batch(self.register_voter, rows, self._voters_lock.write)
+
+    def register_candidates(self, rows: List[dict]) -> List[dict]:
+        return self._apply_batch(self.register_candidate, rows, self._candidates_lock.write)
+
+    def cast_votes(self, payloads: List[dict]) -> List[dict]:
+        return self._apply_batch(self.cast_vote, payloads, self._casting)
+
+    def submit_encrypted_ballots(self, ballots: List[dict], verified: List[bool]) -> List[dict]:
+        """Commit a batch whose proofs were checked outside the lock; one result per ballot."""
+        results = []
+        with self._voters_lock.read(), self._ballots_lock.write(), self._journal_batch():
+            for data, ok in zip(ballots, verified):
+                if data["voter_id"] not in self.voters:
+                    results.append({"status_code": 404, "detail": "Voter does not exist"})
+                elif not ok:
+                    results.append({"status_code": 400, "detail": "Invalid zero-knowledge proof"})
+                else:
+                    results.append({"status_code": 200, "ballot_index": self.add_encrypted_ballot(data)})
+        return results
+
+    # Reads (point lookups are lock-free, see the class docstring)
+    def get_voter(self, voter_id: str) -> Optional[dict]:
+        return self.voters.get(voter_id)
+
+    def voter_exists(self, voter_id: str) -> bool:
+        return voter_id in self.voters
+
+    def _voter_keys(self, district: Optional[str]) -> KeyOrder:
+        # call with the voters lock held
+        return self._voters_by_district.get(district, _NO_KEYS) if district else self._voter_order
+
+    def _candidate_keys(self, party: Optional[str]) -> KeyOrder:
+        # call with the candidates lock held
+        return self._candidates_by_party.get(party, _NO_KEYS) if party else self._candidate_order
+
+    def list_voters(self, district: Optional[str] = None) -> List[dict]:
+        with self._voters_lock.read():
+            if not district:
+                return list(self.voters.values())
+            return [self.voters[k] for k in self._voter_keys(district)]
+
+    def voters_page(self, after: Optional[int], limit: int, district: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        """One page of voters in insertion order after cursor `after`, plus the next cursor."""
+        with self._voters_lock.read():
+            ids, cursor = self._voter_keys(district).page(after, limit)
+            return [self.voters[k] for k in ids], cursor
+
+    def district_counts(self) -> Dict[str, int]:
+        """Registered voters per district, O(districts)."""
+        with self._voters_lock.read():
+            return {d: len(ids) for d, ids in self._voters_by_district.items()}
+
+    def get_candidate(self, candidate_id: str) -> Optional[dict]:
+        return self.candidates.get(candidate_id)
+
+    def list_candidates(self, party: Optional[str] = None) -> List[dict]:
+        with self._candidates_lock.read():
+            if not party:
+                return list(self.candidates.values())
+            return [self.candidates[k] for k in self._candidate_keys(party)]
+
+    def candidates_page(
+        self, after: Optional[int], limit: int, party: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[int]]:
+        with self._candidates_lock.read():
+            ids, cursor = self._candidate_keys(party).page(after, limit)
+            return [self.candidates[k] for k in ids], cursor
+
+    # Serialized reads: records encoded once (projected onto the Out model's fields)
+    # and cached, so list endpoints just join bytes
+    @staticmethod
+    def _record_json(cache: Dict[str, Tuple[dict, bytes]], key: str, rec: dict, fields: Tuple[str, ...]) -> bytes:
+        hit = cache.get(key)
+        if hit is not None and hit[0] is rec:
+            return hit[1]
+        raw = fastjson.dumps({f: rec.get(f) for f in fields})
+        cache[key] = (rec, raw)
+        return raw
+
+    def get_voter_json(self, voter_id: str) -> Optional[bytes]:
+        rec = self.voters.get(voter_id)
+        return None if rec is None else self._record_json(self._voter_json, voter_id, rec, VOTER_FIELDS)
+
+    def voters_json_page(
+        self, after: Optional[int] = None, limit: Optional[int] = None, district: Optional[str] = None
+    ) -> Tuple[List[bytes], Optional[int]]:
+        """Like voters_page, as encoded records; limit=None returns everything after the cursor."""
+        with self._voters_lock.read():
+            ids, cursor = self._voter_keys(district).page(after, sys.maxsize if limit is None else limit)
+            return [self._record_json(self._voter_json, k, self.voters[k], VOTER_FIELDS) for k in ids], cursor
+
+    def get_candidate_json(self, candidate_id: str) -> Optional[bytes]:
+        rec = self.candidates.get(candidate_id)
+        return None if rec is None else self._record_json(self._candidate_json, candidate_id, rec, CANDIDATE_FIELDS)
+
+    def candidates_json_page(
+        self, after: Optional[int] = None, limit: Optional[int] = None, party: Optional[str] = None
+    ) -> Tuple[List[bytes], Optional[int]]:
+        with self._candidates_lock.read():
+            ids, cursor = self._candidate_keys(party).page(after, sys.maxsize if limit is None else limit)
+            return [self._record_json(self._candidate_json, k, self.candidates[k], CANDIDATE_FIELDS) for k in ids], cursor
+
+    def has_standard_vote(self, voter_id: str) -> bool:
+        return voter_id in self._standard_voters
+
+    def turnout(self) -> int:
+        with self._votes_lock.read():
+            return self.votes.distinct_voters()
+
+    def votes_in_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[int, List[dict], Optional[Tuple[int, int]]]:
+        """
+        Votes with start <= timestamp <= end in time order, as (total matches, page, next cursor).
+        The cursor is the (epoch_us, position) of the last vote returned; `after` resumes past it.
+        """
+        total, page, more = self._votes_range(start, end, limit, offset, after)
+        cursor = page[-1][:2] if page and more else None
+        return total, [row for _, _, row in page], cursor
+
+    def _votes_range(
+        self,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        limit: Optional[int],
+        offset: int,
+        after: Optional[Tuple[int, int]],
+    ) -> Tuple[int, List[Tuple[int, int, dict]], bool]:
+        """votes_in_range() as (total, [(epoch_us, position, row)], whether more follow)."""
+        with self._votes_lock.read():
+            keys = self._ts_keys
+            lo = bisect_left(keys, epoch_us(start)) if start else 0
+            hi = bisect_right(keys, epoch_us(end)) if end else len(keys)
+            total = max(hi - lo, 0)
+            first = lo
+            if after is not None:
+                # equal timestamps are ordered by position, so resume inside the tie run
+                key, pos = after
+                tie_lo = max(lo, bisect_left(keys, key))
+                tie_hi = max(tie_lo, bisect_right(keys, key, tie_lo))
+                first = bisect_right(self._ts_order, pos, tie_lo, tie_hi)
+                first = max(first, lo)
+            first += offset
+            last = hi if limit is None else min(hi, first + limit)
+            page = [(keys[i], self._ts_order[i], self.votes[self._ts_order[i]]) for i in range(first, last)]
+            return total, page, last < hi
+
+    def encrypted_tally(self, group_by: Optional[str] = None) -> dict:
+        """The running ciphertext sum, optionally per value of one metadata key; O(groups)."""
+        with self._ballots_lock.read():
+            out = dict(self._ballot_agg)
+            if group_by is not None:
+                out["groups"] = {label: dict(g) for label, g in self._ballot_groups.get(group_by, {}).items()}
+            return out
+
+    def candidate_totals(self) -> Dict[str, float]:
+        """Weighted totals for the currently registered candidates, O(candidates)."""
+        with self._candidates_lock.read(), self._votes_lock.read():
+            return {cid: self.tallies.get(cid, 0.0) for cid in self.candidates}
+
+    def leaderboard(self) -> List[dict]:
+        return self._ranked(self.candidate_totals())
+
+    @staticmethod
+    def _ranked(totals: Dict[str, float]) -> List[dict]:
+        return sorted(
+            [{"candidate_id": cid, "votes": totals[cid]} for cid in totals],
+            key=lambda x: (-x["votes"], x["candidate_id"]),
+        )
+
+    def generation(self, *collections: str) -> int:
+        """
+        Mutations committed to `collections` (all of them if none are given). Sums of
+        monotonic counters, so the value changes whenever any of those collections does.
+        """
+        gens = self._generations
+        return sum(gens[c] for c in collections) if collections else sum(gens.values())
+
+    def version(self, *collections: str) -> str:
+        """generation() tagged with this store instance, e.g. for ETags (lock-free)."""
+        return f"{self._epoch}-{self.generation(*collections)}"
+
+    def versioned_leaderboard(self) -> Tuple[str, List[dict]]:
+        """leaderboard() with the version of candidates + votes it was computed at."""
+        with self._candidates_lock.read(), self._votes_lock.read():
+            return self.version("candidates", "votes"), self.leaderboard()
+
+    def versioned_results(self) -> Tuple[str, dict]:
+        """Leaderboard and turnout from one consistent cut, with their version."""
+        with self._candidates_lock.read(), self._votes_lock.read():
+            return self.version("candidates", "votes"), {"leaderboard": self.leaderboard(), "turnout": self.turnout()}
+
+    def dp_release(self, metric: str, epsilon: float, sensitivity: float) -> dict:
+        """A Laplace-noised metric (privacy.METRICS), re-served free until its collections change."""
+        if metric not in privacy.METRICS:
+            raise StoreError(422, "Unknown metric")
+        method, collections = privacy.METRICS[metric]
+        locks = tuple(getattr(self, f"_{name}_lock") for name in self._LOCK_ORDER if name in collections)
+
+        def measure():
+            with self._hold(locks, write=False):
+                return self.version(*collections), getattr(self, method)()
+        try:
+            return self._dp.release(metric, epsilon, sensitivity, lambda: self.version(*collections), measure)
+        except privacy.BudgetExhausted as e:
+            raise StoreError(403, str(e))
+
+    def count_request(self, n: int = 1):
+        with self._metrics_lock:
+            self.metrics["requests"] += n
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return dict(self.metrics)
+
+    def collection_sizes(self) -> Dict[str, int]:
+        """Row counts per collection (lock-free len() reads)."""
+        return {
+            "voters": len(self.voters),
+            "candidates": len(self.candidates),
+            "votes": len(self.votes),
+            "encrypted_ballots": len(self.encrypted_ballots),
+            "contests": len(self.contests),
+            "journal_records": self._journal.records if self._journal else 0,
+        }
+
+    def metrics_exposition(self) -> str:
+        """Store-side metrics (lock waits, persistence timings, collection sizes) in text format."""
+        sizes = telemetry.Gauge("store_collection_size", "Rows per store collection.", ("collection",))
+        for name, n in self.collection_sizes().items():
+            sizes.set(n, name)
+        return telemetry.render(telemetry.STORE_FAMILIES + (sizes,))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "persist_enabled": bool(self.persist_path),
+            "persist_path": str(self.persist_path) if self.persist_path else None,
+            "journal_path": str(self.journal_path) if self._journal else None,
+            "fsync": self.fsync,
+            "snapshot_every": self.snapshot_every,
+            "snapshot_format": self.snapshot_format,
+            "dp_epsilon_budget": self._dp.budget,
         }
-        with self._lock, self.persist_path.open("w", encoding="utf-8") as f:
-            json.dump(blob, f, indent=2)
+
+    def call_nowait(self, method: str, *args, **kwargs):
+        """
+        Run a store method only if it can take its locks without waiting; raises
+        WouldBlock (before anything is changed) otherwise. Lets AsyncStore run
+        uncontended calls directly on the event loop.
+        """
+        with nonblocking():
+            return getattr(self, method)(*args, **kwargs)
+
+    def save(self, fmt: Optional[str] = None):
+        """
+        Write a snapshot atomically and truncate the journal it covers. `fmt` is
+        "json" or "binary" (default: the store's snapshot_format); the loader picks
+        whichever snapshot file was written last.
+        """
+        if not self.persist_path:
+            return
+        fmt = fmt or self.snapshot_format
+        if fmt not in SNAPSHOT_FORMATS:
+            raise StoreError(422, f"Unknown snapshot format: {fmt}")
+        with self._save_lock:
+            started = time.perf_counter()
+            # copy a consistent cut (no commit is half-applied while every collection is
+            # read-locked), then serialize without blocking writers
+            with self._hold(self._collection_locks, write=False):
+                seq = self._seq
+                voters = self.voters.copy()
+                candidates = self.candidates.copy()
+                votes = self.votes.copy()
+                ballots = self.encrypted_ballots.copy()
+                # pairwise matrices are replaced, not updated in place, on every ballot batch
+                contests = [(cid, c["candidates"], c["ballots"], c["pairwise"]) for cid, c in self.contests.items()]
+                if fmt == "binary":
+                    derived = {
+                        "tallies": dict(self.tallies),
+                        "vote_counts": dict(self.vote_counts),
+                        "ballot_agg": dict(self._ballot_agg),
+                        "ballot_groups": {k: {label: dict(g) for label, g in groups.items()} for k, groups in self._ballot_groups.items()},
+                        "ts_keys": self._ts_keys[:],
+                        "ts_order": self._ts_order[:],
+                    }
+            contests = {
+                cid: {"contest_id": cid, "candidates": names, "ballots": n, "pairwise": d.tolist()}
+                for cid, names, n, d in contests
+            }
+            path = self._snapshot_file(fmt)
+            tmp = self.persist_path.with_suffix(".tmp")
+            with (tmp.open("wb") if fmt == "binary" else tmp.open("w", encoding="utf-8")) as f:
+                if fmt == "binary":
+                    self._write_binary(f, seq, voters, candidates, votes, ballots, contests, derived)
+                else:
+                    blob = {
+                        "voters": dict(voters),
+                        "candidates": dict(candidates),
+                        "votes": list(votes),
+                        "encrypted_ballots": list(ballots),
+                        "contests": contests,
+                        "journal_seq": seq,
+                    }
+                    json.dump(blob, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            with self._journal_lock:
+                if self._journal:
+                    # records committed since the copy stay in the journal
+                    self._journal.truncate(None if self._seq == seq else seq)
+            telemetry.snapshot_duration.observe(time.perf_counter() - started)
+            telemetry.snapshot_bytes.set(path.stat().st_size)
+
+    @staticmethod
+    def _write_binary(f, seq: int, voters, candidates, votes: VoteLog, ballots, contests: dict, derived: dict):
+        writer = snapshot.SnapshotWriter(f)
+        header = {"journal_seq": seq, "contests": contests}
+        snapshot.write_records(writer, header, "voters", voters, "district")
+        snapshot.write_records(writer, header, "candidates", candidates, "party")
+        votes.write(writer, "votes")
+        writer.array("votes.ts_keys", derived.pop("ts_keys"), np.int64)
+        writer.array("votes.ts_order", derived.pop("ts_order"), np.int64)
+        # a duplicate-vote lookup is a binary search here instead of a set built at startup
+        writer.strings("standard_voters", [v.encode("utf-8") for v in votes.standard_voter_ids()], indexed=True)
+        encoded = ballots.encoded(fastjson.dumps) if isinstance(ballots, snapshot.MappedList) else map(fastjson.dumps, ballots)
+        writer.strings("ballots", list(encoded))
+        writer.close({**header, **derived})
+
+    def reload(self) -> bool:
+        """
+        Reload from the snapshot + journal (as a restart would) in a background thread;
+        False if a reload is already running. See _background_reload().
+        """
+        with self._metrics_lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+        threading.Thread(target=self._background_reload, daemon=True).start()
+        return True
+
+    def _background_reload(self):
+        """
+        Parse and index the snapshot into a private store while this one keeps serving,
+        then take every lock once to replay the journal records appended meanwhile and
+        swap the state in. Readers see the old state or the new one, never a mix of
+        collections; the new epoch changes every version(), so result caches, ETags and
+        live frames move over too. Snapshots wait, as they would truncate the journal
+        between the two reads.
+        """
+        started = time.time()
+        try:
+            with self._save_lock:
+                fresh, offset = self._load_fresh()
+                with self._exclusive():
+                    self._swap_in(fresh, offset)
+            self._last_load = {"ok": True, "started": started, "seconds": time.time() - started}
+        except Exception as e:
+            self._last_load = {"ok": False, "started": started, "seconds": time.time() - started, "error": str(e)}
+        finally:
+            self._reloading = False
+
+    def _load_fresh(self) -> Tuple["InMemoryStore", int]:
+        """Snapshot + journal loaded into a private store; returns it and the journal offset read up to."""
+        fresh = InMemoryStore()
+        fresh.persist_path, fresh.journal_path = self.persist_path, self.journal_path
+        if fresh.persist_path:
+            fresh._load_snapshot()
+        offset = 0
+        if fresh.journal_path:
+            records, offset = read_journal(fresh.journal_path)
+            fresh._replay(records)
+        return fresh, offset
+
+    @contextmanager
+    def _exclusive(self):
+        """Every collection lock and the journal lock: nothing commits or reads a collection."""
+        with self._hold(self._collection_locks, write=True), self._journal_lock:
+            yield
+
+    def _swap_in(self, fresh: "InMemoryStore", offset: int):
+        """Catch `fresh` up on the journal past `offset` and take over its state (under _exclusive())."""
+        if fresh.journal_path:
+            fresh._replay(read_journal(fresh.journal_path, start=offset)[0])
+        for name in self._STATE:
+            setattr(self, name, getattr(fresh, name))
+        self._epoch = secrets.token_hex(4)
+        for name in self._generations:
+            self._generations[name] += 1
+
+    def load_status(self) -> dict:
+        """"loading" while a reload runs, else "ready"; plus the outcome of the last reload."""
+        return {"state": "loading" if self._reloading else "ready", "last_load": self._last_load}
+
+    def _clear(self):
+        self.voters.clear()
+        self.candidates.clear()
+        self.votes.clear()
+        self.encrypted_ballots.clear()
+        self.contests.clear()
+        self._ballot_agg = {"ballots": 0, "skipped": 0, "sum": 0}
+        self._ballot_groups = {}
+        self._standard_voters.clear()
+        self.tallies.clear()
+        self.vote_counts.clear()
+        self._ts_keys = array("q")
+        self._ts_order = array("q")
+        self._voter_order.clear()
+        self._candidate_order.clear()
+        self._voters_by_district = {}
+        self._candidates_by_party = {}
+        self._voter_json.clear()
+        self._candidate_json.clear()
 
     def reset(self):
-        with self._lock:
-            self.voters.clear()
-            self.candidates.clear()
-            self.votes.clear()
-            self.encrypted_ballots.clear()
+        self._commit("reset")
+
+    def close(self):
+        with self._journal_lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+class AsyncStore:
+    """
+    asyncio face of a store for `async def` routes: every STORE_METHODS name is an
+    awaitable with the same arguments and errors.
+
+    On the local store a call runs inline on the event loop when its locks are free
+    (the common case: no threadpool hop, no thread switch) and moves to the threadpool
+    only when it would have to wait. Shared-store calls are socket round trips, so
+    they always run in the threadpool.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+        self._nowait = getattr(backend, "call_nowait", None)
+
+    def __getattr__(self, name):
+        if name not in STORE_METHODS:
+            raise AttributeError(name)
+        backend, nowait = self._backend, self._nowait
+
+        async def call(*args, **kwargs):
+            if nowait is not None:
+                try:
+                    return nowait(name, *args, **kwargs)
+                except WouldBlock:
+                    pass
+            return await run_in_threadpool(getattr(backend, name), *args, **kwargs)
+
+        call.__name__ = name
+        setattr(self, name, call)  # later lookups skip __getattr__
+        return call
+
+def local_store():
+    options = dict(
+        persist_path=os.environ.get("STATE_PATH", "/data/state.json"),
+        fsync=os.environ.get("STATE_FSYNC", "interval"),
+        snapshot_every=int(os.environ.get("STATE_SNAPSHOT_EVERY", "100000")),
+        snapshot_format=os.environ.get("STATE_FORMAT", "json"),
+        dp_budget=float(os.environ["DP_EPSILON_BUDGET"]) if os.environ.get("DP_EPSILON_BUDGET") else None,
+    )
+    # STORE_SHARDS=N: voters and their votes partitioned over N stores (see sharded_store.py)
+    shards = int(os.environ.get("STORE_SHARDS", "1"))
+    if shards > 1:
+        from .sharded_store import ShardedStore
+        return ShardedStore(shards, **options)
+    return InMemoryStore(**options)
+
+def _make_store():
+    # STORE_MODE=shared: every worker talks to one store daemon (see shared_store.py)
+    if os.environ.get("STORE_MODE", "memory") == "shared":
+        from .shared_store import SharedStoreClient
+        return SharedStoreClient()
+    return local_store()
 
-store = InMemoryStore(persist_path="/data/state.json")
+store = _make_store()
+astore = AsyncStore(store)
@@ -1,11 +1,13 @@
 
 from __future__ import annotations
 import time
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from typing import Optional
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .data_store import store
+from .data_store import store, astore, StoreError
 from .routes import voters, candidates, votes, results
+from .services import telemetry
 
 app = FastAPI(
     title="Election Management API",
@@ -23,14 +25,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Request metrics middleware
-@app.middleware("http")
-async def add_metrics(request: Request, call_next):
-    start = time.perf_counter()
-    response = await call_next(request)
-    store.metrics["requests"] += 1
-    response.headers["X-Response-Time"] = str((time.perf_counter() - start) * 1000.0)
-    return response
+@app.exception_handler(StoreError)
+async def store_error_handler(request: Request, exc: StoreError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+# Request metrics (pure ASGI; also sets X-Response-Time)
+app.add_middleware(telemetry.MetricsMiddleware, on_request=lambda: store.count_request())
 
 app.include_router(voters.router)
 app.include_router(candidates.router)
@@ -38,30 +38,37 @@ app.include_router(votes.router)
 app.include_router(results.router)
 
 @app.get("/health", tags=["System"])
-def health():
-    return {"status": "ok"}
+async def health():
+    # "state" is "loading" while POST /api/state/load runs; the old state keeps serving until then
+    return {"status": "ok", **(await astore.load_status())}
 
 @app.get("/api/metrics", tags=["System"])
 def metrics():
-    uptime = time.time() - store.metrics["start_time"]
-    return {"requests": store.metrics["requests"], "uptime_sec": uptime}
+    m = store.metrics_snapshot()
+    uptime = time.time() - m["start_time"]
+    return {"requests": m["requests"], "uptime_sec": uptime}
+
+@app.get("/metrics", tags=["System"], response_class=PlainTextResponse, summary="Prometheus text exposition")
+def prometheus_metrics():
+    quantiles = telemetry.quantile_lines(
+        telemetry.http_duration, "http_request_duration_quantile_seconds", "p50/p95/p99 request latency estimated from the histogram.",
+    )
+    body = telemetry.render(telemetry.HTTP_FAMILIES) + "\n".join(quantiles) + "\n" + store.metrics_exposition()
+    return PlainTextResponse(body, media_type=telemetry.CONTENT_TYPE)
 
 @app.get("/api/config", tags=["System"])
 def config():
-    return {"persist_enabled": bool(store.persist_path), "persist_path": str(store.persist_path) if store.persist_path else None}
+    return store.config()
 
 @app.post("/api/state/save", tags=["System"])
-def save_state():
-    store.save()
+def save_state(format: Optional[str] = Query(None, pattern="^(json|binary)$", description="Snapshot format; defaults to STATE_FORMAT")):
+    store.save(format)
     return {"detail": "saved"}
 
-@app.post("/api/state/load", tags=["System"])
+@app.post("/api/state/load", status_code=202, tags=["System"], summary="Reload snapshot + journal in the background (see /health)")
 def load_state():
-    # re-init store (simple approach)
-    from .data_store import InMemoryStore
-    global store
-    store = InMemoryStore(persist_path="/data/state.json")
-    return {"detail": "loaded"}
+    started = store.reload()
+    return {"detail": "loading" if started else "already loading"}
 
 @app.delete("/api/state/reset", tags=["System"])
 def reset_state():
@@ -10,6 +10,9 @@ class VoteCreate(BaseModel):
     weight: Optional[float] = Field(1.0, ge=0.0)
     timestamp: Optional[datetime] = None
 
+class BulkVote(VoteCreate):
+    weighted: bool = False
+
 class EncryptedBallot(BaseModel):
     voter_id: str
     ciphertext: str
@@ -20,15 +23,26 @@ class TallyRequest(BaseModel):
     ciphertexts: List[str]
     secret: Optional[str] = None  # placeholder "key"
 
+class StoredTallyRequest(BaseModel):
+    group_by: Optional[str] = Field(None, description="metadata key to group the running sums by")
+    secret: Optional[str] = None  # placeholder "key"
+
 class TimeRangeQuery(BaseModel):
     start: Optional[datetime] = None
     end: Optional[datetime] = None
 
 class DPAnalyticsRequest(BaseModel):
-    metric: str = Field(..., description="one of: turnout, per_candidate")
+    metric: str = Field(..., description="one of: turnout, per_candidate, per_district")
     epsilon: float = Field(1.0, gt=0.0)
     sensitivity: float = Field(1.0, gt=0.0)
 
 class RCVSchulzeRequest(BaseModel):
     candidates: List[str]
     ballots: List[List[str]]  # each ballot is ranking like ["A","C","B"]
+
+class RCVContestCreate(BaseModel):
+    contest_id: str = Field(..., description="Unique ID for the ranked-choice contest")
+    candidates: List[str]
+
+class RCVBallots(BaseModel):
+    ballots: List[List[str]]  # rankings appended to a stored contest
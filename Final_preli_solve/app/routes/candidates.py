@@ -1,52 +1,55 @@
 
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from ..data_store import store
+from ..data_store import store, astore
 from ..models.candidate import CandidateCreate, CandidateUpdate, CandidateOut
+from ..services.bulk import bulk_openapi, ingest
+from ..services.fastjson import FastJSONResponse, array
+from ..services.streaming import PAGE_SIZE, MAX_PAGE_SIZE, parse_cursor, format_cursor, ndjson_pages
 
 router = APIRouter(prefix="/api/candidates", tags=["Candidates"])
 
 @router.post("", response_model=CandidateOut, status_code=218, summary="Register a candidate")
 def register_candidate(c: CandidateCreate):
-    with store._lock:
-        if c.candidate_id in store.candidates:
-            raise HTTPException(status_code=409, detail="Duplicate candidate_id")
-        store.candidates[c.candidate_id] = c.dict()
-        return c
+    store.register_candidate(c.dict())
+    return c
+
+@router.post("/bulk", summary="Bulk-register candidates (JSON array or NDJSON)", openapi_extra=bulk_openapi(CandidateCreate))
+async def register_candidates_bulk(request: Request):
+    return await ingest(request, CandidateCreate, lambda c: c.dict(), store.register_candidates)
 
 @router.get("", response_model=List[CandidateOut], summary="List candidates (filter by party)")
-def list_candidates(party: Optional[str] = Query(None)):
-    with store._lock:
-        items = list(store.candidates.values())
-        if party:
-            items = [x for x in items if (x.get("party") or "") == party]
-        return items
+def list_candidates(
+    party: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    stream: bool = Query(False, description="Stream matching candidates as NDJSON"),
+):
+    # stored candidates already match CandidateOut: send their cached encodings without revalidating
+    fetch_page = lambda after, n: store.candidates_json_page(after, n, party)
+    if stream:
+        return StreamingResponse(ndjson_pages(fetch_page, parse_cursor(cursor)), media_type="application/x-ndjson")
+    if limit is None and cursor is None:
+        items, next_cursor = fetch_page(None, None)
+    else:
+        items, next_cursor = fetch_page(parse_cursor(cursor), limit or PAGE_SIZE)
+    headers = {"X-Next-Cursor": format_cursor(next_cursor)} if next_cursor is not None else None
+    return FastJSONResponse(array(items), headers=headers)
 
 @router.get("/{candidate_id}", response_model=CandidateOut, summary="Get candidate by ID")
-def get_candidate(candidate_id: str):
-    with store._lock:
-        c = store.candidates.get(candidate_id)
-        if not c:
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        return c
+async def get_candidate(candidate_id: str):
+    raw = await astore.get_candidate_json(candidate_id)
+    if raw is None:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    return FastJSONResponse(raw)
 
 @router.put("/{candidate_id}", response_model=CandidateOut, summary="Update candidate")
 def update_candidate(candidate_id: str, upd: CandidateUpdate):
-    with store._lock:
-        c = store.candidates.get(candidate_id)
-        if not c:
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        data = c.copy()
-        for k, val in upd.dict(exclude_unset=True).items():
-            data[k] = val
-        store.candidates[candidate_id] = data
-        return data
+    return store.update_candidate(candidate_id, upd.dict(exclude_unset=True))
 
 @router.delete("/{candidate_id}", summary="Delete candidate")
 def delete_candidate(candidate_id: str):
-    with store._lock:
-        if candidate_id not in store.candidates:
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        del store.candidates[candidate_id]
-        return {"detail": "deleted"}
+    store.delete_candidate(candidate_id)
+    return {"detail": "deleted"}
@@ -1,30 +1,50 @@
-
 from __future__ import annotations
-from fastapi import APIRouter
-from typing import Dict
-from ..data_store import store
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from ..data_store import astore
+from ..services.conditional import VersionedBodies
+from ..services.live import SSE_HEADERS, Broadcaster
 
 router = APIRouter(prefix="/api/results", tags=["Results"])
 
-@router.get("/leaderboard", summary="Leaderboard sorted by votes")
-def leaderboard():
-    totals: Dict[str, float] = {cid: 0.0 for cid in store.candidates}
-    for v in store.votes:
-        w = float(v.get("weight", 1.0)) if v.get("weighted") else 1.0
-        cid = v["candidate_id"]
-        if cid in totals:
-            totals[cid] += w
-    board = sorted(
-        [{"candidate_id": cid, "votes": totals[cid]} for cid in totals],
-        key=lambda x: (-x["votes"], x["candidate_id"]),
-    )
-    return {"leaderboard": board}
+# results only depend on the roster and the votes
+RESULT_COLLECTIONS = ("candidates", "votes")
+bodies = VersionedBodies()
 
-@router.get("/winner", summary="Winner with tie handling")
-def winner():
-    board = leaderboard()["leaderboard"]
+async def _leaderboard_body():
+    version, board = await astore.versioned_leaderboard()
+    return version, {"leaderboard": board}
+
+async def _winner_body():
+    version, board = await astore.versioned_leaderboard()
     if not board:
-        return {"winner": None, "tie": False}
+        return version, {"winner": None, "tie": False}
     top = board[0]["votes"]
     winners = [x["candidate_id"] for x in board if x["votes"] == top]
-    return {"winner": winners[0] if len(winners)==1 else None, "tie": len(winners)>1, "tied": winners if len(winners)>1 else None}
+    return version, {"winner": winners[0] if len(winners)==1 else None, "tie": len(winners)>1, "tied": winners if len(winners)>1 else None}
+
+async def _version():
+    return await astore.version(*RESULT_COLLECTIONS)
+
+live = Broadcaster("results", _version, astore.versioned_results)
+
+async def leaderboard_response(request: Request):
+    """The leaderboard with ETag / If-None-Match handling (also serves /api/votes/summary)."""
+    return await bodies.respond(request, "leaderboard", await astore.version(*RESULT_COLLECTIONS), _leaderboard_body)
+
+@router.get("/leaderboard", summary="Leaderboard sorted by votes")
+async def leaderboard(request: Request):
+    return await leaderboard_response(request)
+
+@router.get("/winner", summary="Winner with tie handling")
+async def winner(request: Request):
+    return await bodies.respond(request, "winner", await astore.version(*RESULT_COLLECTIONS), _winner_body)
+
+@router.get("/districts", summary="Registered voters per district")
+async def district_counts():
+    # under /results rather than /voters, where it would shadow a voter with voter_id "districts"
+    return {"districts": await astore.district_counts()}
+
+@router.get("/live", summary="Live leaderboard and turnout (Server-Sent Events)")
+async def live_results():
+    return StreamingResponse(live.subscribe(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,49 +1,55 @@
 
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from ..data_store import store
+from ..data_store import store, astore
 from ..models.voter import VoterCreate, VoterUpdate, VoterOut
+from ..services.bulk import bulk_openapi, ingest
+from ..services.fastjson import FastJSONResponse, array
+from ..services.streaming import PAGE_SIZE, MAX_PAGE_SIZE, parse_cursor, format_cursor, ndjson_pages
 
 router = APIRouter(prefix="/api/voters", tags=["Voters"])
 
 @router.post("", response_model=VoterOut, status_code=218, summary="Register a voter")
-def register_voter(v: VoterCreate):
-    with store._lock:
-        if v.voter_id in store.voters:
-            raise HTTPException(status_code=409, detail="Duplicate voter_id")
-        store.voters[v.voter_id] = v.dict()
-        return v
-
-@router.get("", response_model=List[VoterOut], summary="List voters")
-def list_voters():
-    with store._lock:
-        return list(store.voters.values())
+async def register_voter(v: VoterCreate):
+    await astore.register_voter(v.dict())
+    return v
+
+@router.post("/bulk", summary="Bulk-register voters (JSON array or NDJSON)", openapi_extra=bulk_openapi(VoterCreate))
+async def register_voters_bulk(request: Request):
+    return await ingest(request, VoterCreate, lambda v: v.dict(), store.register_voters)
+
+@router.get("", response_model=List[VoterOut], summary="List voters (filter by district; cursor pagination or NDJSON stream)")
+def list_voters(
+    district: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    stream: bool = Query(False, description="Stream every voter as NDJSON"),
+):
+    # stored voters already match VoterOut: send their cached encodings without revalidating
+    fetch_page = lambda after, n: store.voters_json_page(after, n, district)
+    if stream:
+        return StreamingResponse(ndjson_pages(fetch_page, parse_cursor(cursor)), media_type="application/x-ndjson")
+    if limit is None and cursor is None:
+        items, next_cursor = fetch_page(None, None)
+    else:
+        items, next_cursor = fetch_page(parse_cursor(cursor), limit or PAGE_SIZE)
+    headers = {"X-Next-Cursor": format_cursor(next_cursor)} if next_cursor is not None else None
+    return FastJSONResponse(array(items), headers=headers)
 
 @router.get("/{voter_id}", response_model=VoterOut, summary="Get voter by ID")
-def get_voter(voter_id: str):
-    with store._lock:
-        v = store.voters.get(voter_id)
-        if not v:
-            raise HTTPException(status_code=404, detail="Voter not found")
-        return v
+async def get_voter(voter_id: str):
+    raw = await astore.get_voter_json(voter_id)
+    if raw is None:
+        raise HTTPException(status_code=404, detail="Voter not found")
+    return FastJSONResponse(raw)
 
 @router.put("/{voter_id}", response_model=VoterOut, summary="Update voter")
 def update_voter(voter_id: str, upd: VoterUpdate):
-    with store._lock:
-        v = store.voters.get(voter_id)
-        if not v:
-            raise HTTPException(status_code=404, detail="Voter not found")
-        data = v.copy()
-        for k, val in upd.dict(exclude_unset=True).items():
-            data[k] = val
-        store.voters[voter_id] = data
-        return data
+    return store.update_voter(voter_id, upd.dict(exclude_unset=True))
 
 @router.delete("/{voter_id}", status_code=200, summary="Delete voter")
 def delete_voter(voter_id: str):
-    with store._lock:
-        if voter_id not in store.voters:
-            raise HTTPException(status_code=404, detail="Voter not found")
-        del store.voters[voter_id]
-        return {"detail": "deleted"}
+    store.delete_voter(voter_id)
+    return {"detail": "deleted"}
@@ -1,93 +1,135 @@
 
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional, Dict
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from datetime import datetime
-from ..data_store import store
-from ..models.vote import VoteCreate, EncryptedBallot, TallyRequest, TimeRangeQuery, DPAnalyticsRequest, RCVSchulzeRequest
+from ..data_store import store, astore
+from ..models.vote import VoteCreate, BulkVote, EncryptedBallot, TallyRequest, StoredTallyRequest, TimeRangeQuery, DPAnalyticsRequest, RCVSchulzeRequest, RCVContestCreate, RCVBallots
 from ..services import encryption
+from ..services import schulze as schulze_engine
+from ..services.bulk import bulk_openapi, ingest
+from ..services.fastjson import FastJSONResponse
+from ..services.streaming import parse_cursor, format_cursor, ndjson_pages
+from .results import leaderboard_response
 
 router = APIRouter(prefix="/api/votes", tags=["Votes"])
 
 def _now_iso():
     return datetime.utcnow().isoformat()
 
+def _vote_payload(v: VoteCreate, weighted: bool) -> dict:
+    payload = v.dict()
+    payload["timestamp"] = (v.timestamp or datetime.utcnow()).isoformat()
+    payload["weighted"] = weighted
+    return payload
+
 @router.post("", status_code=218, summary="Cast a vote (prevents duplicate voting)")
-def cast_vote(v: VoteCreate):
-    with store._lock:
-        if v.voter_id not in store.voters:
-            raise HTTPException(status_code=404, detail="Voter does not exist")
-        if v.candidate_id not in store.candidates:
-            raise HTTPException(status_code=404, detail="Candidate does not exist")
-        # duplicate prevention: a voter may only cast one standard vote
-        if any(x.get("voter_id")==v.voter_id and not x.get("weighted", False) for x in store.votes):
-            raise HTTPException(status_code=409, detail="Duplicate vote from this voter")
-        payload = v.dict()
-        payload["timestamp"] = (v.timestamp or datetime.utcnow()).isoformat()
-        payload["weighted"] = False
-        store.votes.append(payload)
-        return {"detail": "vote accepted", "ts": payload["timestamp"]}
+async def cast_vote(v: VoteCreate):
+    payload = _vote_payload(v, weighted=False)
+    # existence and duplicate checks run atomically inside the store
+    await astore.cast_vote(payload)
+    return {"detail": "vote accepted", "ts": payload["timestamp"]}
 
 @router.post("/weighted", status_code=218, summary="Cast a weighted vote")
-def cast_weighted_vote(v: VoteCreate):
-    with store._lock:
-        if v.voter_id not in store.voters:
-            raise HTTPException(status_code=404, detail="Voter does not exist")
-        if v.candidate_id not in store.candidates:
-            raise HTTPException(status_code=404, detail="Candidate does not exist")
-        if v.weight is None or v.weight <= 0:
-            raise HTTPException(status_code=422, detail="Weight must be > 0")
-        payload = v.dict()
-        payload["timestamp"] = (v.timestamp or datetime.utcnow()).isoformat()
-        payload["weighted"] = True
-        store.votes.append(payload)
-        return {"detail": "weighted vote accepted", "ts": payload["timestamp"]}
+async def cast_weighted_vote(v: VoteCreate):
+    payload = _vote_payload(v, weighted=True)
+    await astore.cast_vote(payload)
+    return {"detail": "weighted vote accepted", "ts": payload["timestamp"]}
+
+@router.post("/bulk", summary="Bulk-cast votes (JSON array or NDJSON; set weighted per row)", openapi_extra=bulk_openapi(BulkVote))
+async def cast_votes_bulk(request: Request):
+    return await ingest(request, BulkVote, lambda v: _vote_payload(v, v.weighted), store.cast_votes)
 
 @router.get("", status_code=222, summary="Retrieve votes within a time range")
-def get_votes_in_range(start: Optional[datetime] = Query(None), end: Optional[datetime] = Query(None)):
-    with store._lock:
-        def in_range(ts):
-            t = datetime.fromisoformat(ts)
-            if start and t < start: return False
-            if end and t > end: return False
-            return True
-        items = [v for v in store.votes if in_range(v["timestamp"])]
-        return {"count": len(items), "votes": items}
+def get_votes_in_range(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    stream: bool = Query(False, description="Stream the matching votes as NDJSON"),
+):
+    after = parse_cursor(cursor, parts=2)
+    if stream:
+        def fetch_page(after, n):
+            _, items, next_after = store.votes_in_range(start, end, n, 0, after)
+            return items, next_after
+        return StreamingResponse(ndjson_pages(fetch_page, after), status_code=222, media_type="application/x-ndjson")
+    total, items, next_after = store.votes_in_range(start, end, limit, offset, after)
+    # plain JSON types straight from the vote log: skip jsonable_encoder
+    body = {"count": len(items), "total": total, "votes": items, "next_cursor": format_cursor(next_after)}
+    return FastJSONResponse(body, status_code=222)
 
 @router.get("/summary", summary="Vote totals per candidate")
-def vote_summary():
-    with store._lock:
-        totals: Dict[str, float] = {cid: 0.0 for cid in store.candidates}
-        for v in store.votes:
-            w = float(v.get("weight", 1.0)) if v.get("weighted") else 1.0
-            cid = v["candidate_id"]
-            if cid in totals:
-                totals[cid] += w
-        leaderboard = sorted(
-            [{"candidate_id": cid, "votes": totals[cid]} for cid in totals],
-            key=lambda x: (-x["votes"], x["candidate_id"]),
-        )
-        return {"leaderboard": leaderboard}
+async def vote_summary(request: Request):
+    return await leaderboard_response(request)
 
 # Encrypted ballots & homomorphic tally
 @router.post("/encrypted", summary="Submit an encrypted ballot with ZKP verification")
 def submit_encrypted_ballot(b: EncryptedBallot):
-    with store._lock:
-        if b.voter_id not in store.voters:
-            raise HTTPException(status_code=404, detail="Voter does not exist")
-        if not encryption.verify_zkp(b.ciphertext, b.proof, b.voter_id):
-            raise HTTPException(status_code=400, detail="Invalid zero-knowledge proof")
-        store.encrypted_ballots.append(b.dict())
-        return {"detail": "encrypted ballot accepted", "index": len(store.encrypted_ballots)-1}
+    if not store.voter_exists(b.voter_id):
+        raise HTTPException(status_code=404, detail="Voter does not exist")
+    if not encryption.verify_zkp(b.ciphertext, b.proof, b.voter_id):
+        raise HTTPException(status_code=400, detail="Invalid zero-knowledge proof")
+    # re-checks the voter under the store locks in case it was deleted meanwhile
+    index = store.submit_encrypted_ballot(b.dict())
+    return {"detail": "encrypted ballot accepted", "index": index}
+
+def _verify_and_submit(ballots: List[dict]) -> List[dict]:
+    # proofs are hashed in parallel before any store lock is taken; the locks only cover the commit
+    verified = encryption.verify_zkp_batch([(b["ciphertext"], b["proof"], b["voter_id"]) for b in ballots])
+    return store.submit_encrypted_ballots(ballots, verified)
+
+@router.post("/encrypted/batch", summary="Submit encrypted ballots in bulk (JSON array or NDJSON)", openapi_extra=bulk_openapi(EncryptedBallot))
+async def submit_encrypted_ballots(request: Request):
+    return await ingest(request, EncryptedBallot, lambda b: b.dict(), _verify_and_submit)
 
 @router.post("/homomorphic_tally", summary="Homomorphic tally for verifiable decryption")
-def homomorphic_tally(req: TallyRequest):
-    total_c = encryption.homomorphic_add(req.ciphertexts)
+async def homomorphic_tally(req: TallyRequest):
+    # big-int sum over the whole list: keep it off the event loop
+    total_c = await run_in_threadpool(encryption.homomorphic_add, req.ciphertexts)
     decrypted = None
     if req.secret:
         decrypted = encryption.decrypt_ciphertext(total_c, req.secret)
     return {"combined_ciphertext": total_c, "decrypted_sum_mod_p": decrypted}
 
+@router.post("/encrypted/tally", summary="Homomorphic tally of the stored encrypted ballots")
+def stored_encrypted_tally(req: StoredTallyRequest):
+    # reads the store's running sum; no ciphertexts are sent or rescanned
+    agg = store.encrypted_tally(req.group_by)
+    def present(total: int) -> dict:
+        decrypted = encryption.decrypt_ciphertext(hex(total), req.secret) if req.secret else None
+        return {"combined_ciphertext": hex(total), "decrypted_sum_mod_p": decrypted}
+    out = {"ballots": agg["ballots"], "skipped": agg["skipped"], **present(agg["sum"])}
+    if req.group_by is not None:
+        out["group_by"] = req.group_by
+        out["groups"] = {label: {"ballots": g["ballots"], **present(g["sum"])} for label, g in agg["groups"].items()}
+    return out
+
+@router.post(
+    "/homomorphic_tally/stream",
+    summary="Streaming homomorphic tally (newline-delimited hex or NDJSON strings)",
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/x-ndjson": {"schema": {"type": "string", "example": '"0x10"'}},
+        "text/plain": {"schema": {"type": "string", "example": "0x10\n0x20"}},
+    }}},
+)
+async def homomorphic_tally_stream(
+    request: Request,
+    parallel: bool = Query(True, description="Sum large inputs across a process pool"),
+    x_tally_secret: Optional[str] = Header(None, description="Decrypt the combined ciphertext with this secret"),
+):
+    try:
+        total, count = await encryption.tally_stream(request.stream(), parallel)
+    except encryption.LineTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid ciphertext in body")
+    decrypted = encryption.decrypt_ciphertext(hex(total), x_tally_secret) if x_tally_secret else None
+    return {"count": count, "combined_ciphertext": hex(total), "decrypted_sum_mod_p": decrypted}
+
 # Risk-Limiting Audit (Kaplan-Markov)
 @router.post("/rla/kaplan_markov", summary="Compute Kaplan-Markov P-value")
 def kaplan_markov(sampled_winner_votes: int, sampled_loser_votes: int, reported_margin: float):
@@ -106,60 +148,28 @@ def kaplan_markov(sampled_winner_votes: int, sampled_loser_votes: int, reported_
 
 # Differential Privacy Analytics
 @router.post("/analytics/dp", summary="Differential privacy analytics (Laplace mechanism)")
-def dp_analytics(req: DPAnalyticsRequest):
-    import random
-    def laplace(scale: float):
-        # Inverse CDF for Laplace(0, scale)
-        u = random.random() - 0.5
-        return -scale * (1 if u < 0 else -1) * math.log(1 - 2*abs(u))
-
-    import math
-    with store._lock:
-        if req.metric == "turnout":
-            count = len({v["voter_id"] for v in store.votes})
-            noisy = count + laplace(req.sensitivity / req.epsilon)
-            return {"metric": "turnout", "value": noisy}
-        elif req.metric == "per_candidate":
-            totals = {cid: 0.0 for cid in store.candidates}
-            for v in store.votes:
-                w = float(v.get("weight", 1.0)) if v.get("weighted") else 1.0
-                cid = v["candidate_id"]
-                if cid in totals:
-                    totals[cid] += w
-            noisy = {cid: val + laplace(req.sensitivity / req.epsilon) for cid, val in totals.items()}
-            return {"metric": "per_candidate", "value": noisy}
-        else:
-            raise HTTPException(status_code=422, detail="Unknown metric")
+async def dp_analytics(req: DPAnalyticsRequest):
+    # cached per data version and charged to the metric's epsilon budget (services/privacy.py)
+    return await astore.dp_release(req.metric, req.epsilon, req.sensitivity)
 
 # Ranked Choice Voting (Schulze method)
 @router.post("/rcv/schulze", summary="Compute Schulze winners from ranked ballots")
-def schulze(req: RCVSchulzeRequest):
-    C = req.candidates
-    idx = {c:i for i,c in enumerate(C)}
-    n = len(C)
-    # d[a][b] = number of voters who prefer a over b
-    d = [[0]*n for _ in range(n)]
-    for ballot in req.ballots:
-        # build rank index for the ballot
-        rank = {cand: i for i, cand in enumerate(ballot)}
-        for a in C:
-            for b in C:
-                if a==b: continue
-                if rank.get(a, 10**9) < rank.get(b, 10**9):
-                    d[idx[a]][idx[b]] += 1
-    # p[a][b] = strength of strongest path from a to b
-    p = [[0]*n for _ in range(n)]
-    for i in range(n):
-        for j in range(n):
-            if i!=j:
-                if d[i][j] > d[j][i]:
-                    p[i][j] = d[i][j]
-    for i in range(n):
-        for j in range(n):
-            if i==j: continue
-            for k in range(n):
-                if i==k or j==k: continue
-                p[j][k] = max(p[j][k], min(p[j][i], p[i][k]))
-    # winners where for all other j, p[i][j] >= p[j][i]
-    winners = [C[i] for i in range(n) if all(p[i][j] >= p[j][i] for j in range(n) if i!=j)]
-    return {"winners": winners, "matrix": p}
+async def schulze(req: RCVSchulzeRequest):
+    # identical rankings are collapsed and counted with vectorized NumPy passes, off the event loop
+    winners, matrix = await run_in_threadpool(schulze_engine.schulze, req.candidates, req.ballots)
+    return {"winners": winners, "matrix": matrix}
+
+# Stored ranked-choice contests: ballots are folded into a pairwise matrix as they arrive
+@router.post("/rcv/contests", status_code=218, summary="Create a stored ranked-choice contest")
+def create_contest(c: RCVContestCreate):
+    return store.create_contest(c.dict())
+
+@router.post("/rcv/contests/{contest_id}/ballots", summary="Append ranked ballots to a contest")
+def add_contest_ballots(contest_id: str, req: RCVBallots):
+    total = store.add_contest_ballots(contest_id, req.ballots)
+    return {"contest_id": contest_id, "accepted": len(req.ballots), "ballots": total}
+
+@router.get("/rcv/contests/{contest_id}/schulze", summary="Schulze winners for a stored contest")
+async def contest_schulze(contest_id: str):
+    # the O(n^3) path-strength pass runs outside the store lock; keep it off the event loop too
+    return await run_in_threadpool(store.contest_result, contest_id)
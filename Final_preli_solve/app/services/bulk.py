@@ -0,0 +1,97 @@
+from __future__ import annotations
+import json
+from typing import AsyncIterator, Callable, List, Tuple, Type
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+
+CHUNK_ROWS = 1000
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+def bulk_openapi(model: Type[BaseModel]) -> dict:
+    """requestBody docs for bulk endpoints, which read the body themselves."""
+    row = model.schema()
+    schema = {"type": "array", "items": row}
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        "application/x-ndjson": {"schema": row},
+    }}}
+
+async def iter_chunks(request: Request, chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[List[Tuple[int, object]]]:
+    """
+    Yield (row_index, parsed_json) pairs in chunks from a JSON array or NDJSON body.
+    NDJSON is parsed as it streams in; a line that isn't valid JSON yields a ValueError
+    in place of the row so the caller can report it per row.
+    """
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if ctype not in NDJSON_TYPES:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=422, detail="Body must be a JSON array or NDJSON")
+        for start in range(0, len(rows), chunk_rows):
+            yield list(enumerate(rows[start:start + chunk_rows], start))
+        return
+
+    chunk: List[Tuple[int, object]] = []
+    index = 0
+    buf = b""
+    async for data in request.stream():
+        buf += data
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            chunk.append((index, _parse_line(line)))
+            index += 1
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+    if buf.strip():
+        chunk.append((index, _parse_line(buf)))
+    if chunk:
+        yield chunk
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+def validate_chunk(model: Type[BaseModel], chunk: List[Tuple[int, object]]) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    """Split a chunk into valid (index, model) pairs and per-row 422 results."""
+    valid: List[Tuple[int, BaseModel]] = []
+    errors: List[dict] = []
+    for index, raw in chunk:
+        if isinstance(raw, ValueError):
+            errors.append({"index": index, "status_code": 422, "detail": "Invalid JSON"})
+            continue
+        try:
+            valid.append((index, model.parse_obj(raw)))
+        except ValidationError as e:
+            errors.append({"index": index, "status_code": 422, "detail": json.loads(e.json())})
+    return valid, errors
+
+async def ingest(
+    request: Request,
+    model: Type[BaseModel],
+    to_payload: Callable[[BaseModel], dict],
+    apply_batch: Callable[[List[dict]], List[dict]],
+) -> dict:
+    """
+    Validate the body chunk by chunk and hand each chunk's valid rows to a store batch
+    method (one lock hold per chunk). Returns per-row results in input order.
+    """
+    results: List[dict] = []
+    async for chunk in iter_chunks(request):
+        valid, errors = validate_chunk(model, chunk)
+        results.extend(errors)
+        if valid:
+            outcomes = await run_in_threadpool(apply_batch, [to_payload(m) for _, m in valid])
+            results.extend({"index": i, **o} for (i, _), o in zip(valid, outcomes))
+    results.sort(key=lambda r: r["index"])
+    accepted = sum(1 for r in results if r["status_code"] < 300)
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
@@ -0,0 +1,54 @@
+"""
+Conditional GETs for derived results: bodies are encoded once per store version and
+served with a strong ETag; a client whose If-None-Match still matches gets 304.
+"""
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .fastjson import FastJSONResponse, dumps
+
+# results may change on every vote: caches must revalidate, which is what makes 304s cheap
+CACHE_CONTROL = "no-cache"
+
+def etag(version: str) -> str:
+    return f'"{version}"'
+
+def etag_matches(header: Optional[str], tag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 prescribes for it)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == tag for t in header.split(","))
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+
+class VersionedBodies:
+    """
+    Encoded response bodies keyed by name, each tagged with the store version it was
+    built from. A poll costs one version() read: a matching If-None-Match is answered
+    304 without touching the store again, and an unchanged version reuses the cached
+    bytes. `build` returns its content together with the version it read it at, so a
+    write racing the poll can't leave new data cached under an old tag.
+    """
+    def __init__(self):
+        self._bodies: Dict[str, Tuple[str, bytes]] = {}
+
+    async def respond(
+        self,
+        request: Request,
+        name: str,
+        current: str,
+        build: Callable[[], Awaitable[Tuple[str, object]]],
+    ) -> Response:
+        if etag_matches(request.headers.get("if-none-match"), etag(current)):
+            return not_modified(etag(current))
+        cached = self._bodies.get(name)
+        if cached is None or cached[0] != current:
+            version, content = await build()
+            cached = self._bodies[name] = (version, dumps(content))
+        return FastJSONResponse(cached[1], headers={"ETag": etag(cached[0]), "Cache-Control": CACHE_CONTROL})
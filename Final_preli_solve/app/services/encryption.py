@@ -1,7 +1,13 @@
 
 from __future__ import annotations
+import asyncio
 import hashlib
-from typing import List, Tuple
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
 
 MODULUS = 2**61 - 1  # a big prime for toy homomorphic addition
 
@@ -15,19 +21,128 @@ def verify_zkp(ciphertext: str, proof: str, voter_id: str) -> bool:
     expected = hash_str(voter_id + "|" + ciphertext)[:16]
     return proof == expected
 
+_verify_pool: Optional[ThreadPoolExecutor] = None
+_verify_pool_lock = threading.Lock()
+VERIFY_SLICE = 256  # proofs per pool task
+
+def _pool() -> ThreadPoolExecutor:
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="zkp")
+        return _verify_pool
+
+def _verify_slice(items: Sequence[Tuple[str, str, str]]) -> List[bool]:
+    return [verify_zkp(c, p, v) for c, p, v in items]
+
+def verify_zkp_batch(items: Sequence[Tuple[str, str, str]]) -> List[bool]:
+    """
+    verify_zkp over many (ciphertext, proof, voter_id) triples, split across a thread
+    pool (hashlib releases the GIL while hashing large inputs). Results keep input order.
+    """
+    if len(items) <= VERIFY_SLICE:
+        return _verify_slice(items)
+    slices = [items[i:i + VERIFY_SLICE] for i in range(0, len(items), VERIFY_SLICE)]
+    return [ok for part in _pool().map(_verify_slice, slices) for ok in part]
+
+@lru_cache(maxsize=1024)
+def derive_key(secret: str) -> int:
+    """k = H(secret) mod P; bounded LRU so repeated tallies don't rehash the secret."""
+    return int(hash_str(secret), 16) % MODULUS
+
 def encrypt_plaintext(x: int, secret: str) -> str:
     # Toy "encryption": c = (x + H(secret)) mod P, encoded as hex
-    k = int(hash_str(secret), 16) % MODULUS
+    k = derive_key(secret)
     c = (x + k) % MODULUS
     return hex(c)
 
 def decrypt_ciphertext(c_hex: str, secret: str) -> int:
-    k = int(hash_str(secret), 16) % MODULUS
+    k = derive_key(secret)
     c = int(c_hex, 16) % MODULUS
     return (c - k) % MODULUS
 
 def homomorphic_add(ciphertexts: List[str]) -> str:
+    # one reduction at the end gives the same residue as reducing after every element
+    return hex(sum(int(ch, 16) for ch in ciphertexts) % MODULUS)
+
+# Streaming tally
+TALLY_BLOCK_BYTES = 4 << 20  # newline-aligned blocks handed to one summation task
+TALLY_MAX_LINE_BYTES = 64 << 10  # a ciphertext is < 2**61; anything this long is not one
+
+class LineTooLong(ValueError):
+    pass
+
+_tally_pool: Optional[ProcessPoolExecutor] = None
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _tally_pool
+    with _verify_pool_lock:
+        if _tally_pool is None:
+            # spawn: forking a threaded server process is unsafe
+            _tally_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2, mp_context=multiprocessing.get_context("spawn"))
+        return _tally_pool
+
+def sum_hex_block(block: bytes) -> Tuple[int, int]:
+    """
+    Sum the ciphertexts in a newline-delimited block, as bare hex or NDJSON strings
+    ("0x1f"). Returns (sum mod MODULUS, count) with a single reduction per block.
+    """
     total = 0
-    for ch in ciphertexts:
-        total = (total + int(ch, 16)) % MODULUS
-    return hex(total)
+    count = 0
+    for line in block.split(b"\n"):
+        if len(line) > TALLY_MAX_LINE_BYTES:
+            raise LineTooLong(f"line longer than {TALLY_MAX_LINE_BYTES} bytes")
+        line = line.strip().strip(b'"')
+        if line:
+            total += int(line, 16)
+            count += 1
+    return total % MODULUS, count
+
+async def tally_stream(chunks: AsyncIterator[bytes], parallel: bool = True) -> Tuple[int, int]:
+    """
+    Homomorphically add a streamed ciphertext list in bounded memory: the body is cut into
+    newline-aligned blocks, each summed with one modular reduction. With `parallel`, blocks
+    after the first go to a process pool, with at most two blocks in flight per core.
+    Raises ValueError on a malformed ciphertext, LineTooLong (one) on a line over
+    TALLY_MAX_LINE_BYTES, which also bounds the buffered partial line.
+    """
+    loop = asyncio.get_running_loop()
+    total, count = 0, 0
+    pending: List[asyncio.Future] = []
+    max_pending = 2 * (os.cpu_count() or 2)
+    first = True
+
+    async def settle(futures):
+        nonlocal total, count
+        for s, n in await asyncio.gather(*futures):
+            total = (total + s) % MODULUS
+            count += n
+
+    async def submit(block: bytes):
+        nonlocal first
+        if parallel and not first:
+            pending.append(loop.run_in_executor(_process_pool(), sum_hex_block, block))
+            if len(pending) >= max_pending:
+                await settle([pending.pop(0)])
+        else:
+            await settle([loop.run_in_executor(None, sum_hex_block, block)])
+        first = False
+
+    # consumed blocks are deleted from the front of one bytearray rather than re-sliced
+    buf = bytearray()
+    async for data in chunks:
+        buf += data
+        if len(buf) - buf.rfind(b"\n") - 1 > TALLY_MAX_LINE_BYTES:
+            raise LineTooLong(f"line longer than {TALLY_MAX_LINE_BYTES} bytes")
+        while len(buf) >= TALLY_BLOCK_BYTES:
+            cut = buf.rfind(b"\n", 0, TALLY_BLOCK_BYTES)
+            if cut < 0:
+                cut = buf.find(b"\n", TALLY_BLOCK_BYTES)
+                if cut < 0:
+                    break  # one long line (bounded by the check above); wait for its end
+            await submit(bytes(buf[:cut]))
+            del buf[:cut + 1]
+    if buf.strip():
+        await submit(bytes(buf))
+    await settle(pending)
+    return total, count
@@ -0,0 +1,34 @@
+from __future__ import annotations
+import json
+from typing import List
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder produces the same JSON, just slower
+    orjson = None
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON, as FastAPI's JSONResponse would write it."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def array(items: List[bytes]) -> bytes:
+    """A JSON array from already-serialized elements."""
+    return b"[" + b",".join(items) + b"]"
+
+class FastJSONResponse(Response):
+    """
+    JSON response that skips FastAPI's response_model validation and jsonable_encoder
+    (a Response returned from a route is sent as-is). For trusted store data only;
+    the route's response_model still documents the schema. Accepts pre-serialized bytes.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+def read_journal(path: Path, start: int = 0) -> Tuple[List[dict], int]:
+    """
+    Read every complete record from a journal file, from byte offset `start` on.
+    Returns (records, good_offset); a torn trailing line from a crash stops the scan.
+    """
+    records: List[dict] = []
+    good = start
+    if not path.exists():
+        return records, good
+    with path.open("rb") as f:
+        f.seek(start)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+    return records, good
+
+class Journal:
+    """
+    Append-only NDJSON write-ahead log of store mutations.
+
+    fsync policy:
+      - "always":   fsync after every record (per-mutation durability)
+      - "interval": fsync at most once every `fsync_interval` seconds, from a background
+                    flusher thread, so appends (possibly on the event loop) never wait on the disk
+      - "never":    leave it to the OS (records still survive a process crash)
+
+    The caller serializes append() and truncate(); batching is tracked per thread, so
+    one thread's batch never defers another thread's fsync.
+    """
+    def __init__(self, path: Path, fsync: str = "interval", fsync_interval: float = 1.0, truncate_at: Optional[int] = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}")
+        self.path = Path(path)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._f = self.path.open("ab")
+        if truncate_at is not None and truncate_at < self._f.tell():
+            # drop a torn tail so new records don't get glued onto it
+            self._f.truncate(truncate_at)
+        self._local = threading.local()
+        self._file_lock = threading.Lock()  # the flusher vs. truncate()/close() swapping self._f
+        self._dirty = False
+        self._closed = threading.Event()
+        if fsync == "interval":
+            threading.Thread(target=self._flusher, name=f"journal-flush:{self.path.name}", daemon=True).start()
+
+    def _flusher(self):
+        while not self._closed.wait(self.fsync_interval):
+            if self._dirty:
+                self._dirty = False
+                with self._file_lock:
+                    if not self._f.closed:
+                        os.fsync(self._f.fileno())
+
+    def append(self, record: dict):
+        self._f.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._f.flush()
+        self.records += 1
+        if self.fsync == "always":
+            if getattr(self._local, "batching", 0):
+                self._local.dirty = True
+            else:
+                os.fsync(self._f.fileno())
+        elif self.fsync == "interval":
+            self._dirty = True
+
+    @contextmanager
+    def batch(self):
+        """Group appends; with fsync="always" the whole group is synced once at the end."""
+        local = self._local
+        local.batching = getattr(local, "batching", 0) + 1
+        try:
+            yield
+        finally:
+            local.batching -= 1
+            if not local.batching and getattr(local, "dirty", False):
+                local.dirty = False
+                os.fsync(self._f.fileno())
+
+    def truncate(self, through: Optional[int] = None):
+        """
+        Discard records once a snapshot covers them: all of them, or only those with
+        seq <= `through` when mutations may have landed after the snapshot was taken.
+        """
+        keep: List[bytes] = []
+        if through is not None:
+            self._f.flush()
+            records, _ = read_journal(self.path)
+            keep = [json.dumps(r, separators=(",", ":")).encode("utf-8") + b"\n" for r in records if r.get("seq", 0) > through]
+        if keep:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("wb") as f:
+                f.writelines(keep)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._file_lock:
+                self._f.close()
+                os.replace(tmp, self.path)
+                self._f = self.path.open("ab")
+            self.records = len(keep)
+            return
+        self._f.seek(0)
+        self._f.truncate()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.records = 0
+
+    def close(self):
+        self._closed.set()
+        with self._file_lock:
+            if not self._f.closed:
+                self._f.flush()
+                if self.fsync != "never":
+                    os.fsync(self._f.fileno())
+                self._f.close()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .snapshot import MappedDict, MappedList
+
+class KeyOrder:
+    """
+    Insertion order of a dict's keys, addressable by stable integer cursors.
+
+    Each key gets an increasing seq when it is first added (re-adding after a delete
+    moves it to the end, like a dict). Deletes leave a tombstone that is compacted away
+    once tombstones outnumber live keys; seqs never change, so cursors stay valid.
+
+    A secondary index can reuse another KeyOrder's seqs by passing them to add(), so
+    a filtered page accepts and returns the same cursors as the unfiltered one.
+    """
+    def __init__(self, keys: Iterable[str] = ()):
+        self.clear()
+        for k in keys:
+            self.add(k)
+
+    @classmethod
+    def mapped(cls, keys: Sequence[str], seqs) -> "KeyOrder":
+        """
+        An order over a snapshot column without decoding it: keys[i] has seq seqs[i]
+        (ascending int64, e.g. a NumPy view) and `keys` must support find().
+        """
+        order = cls()
+        order._seqs = array("q", seqs.tobytes())
+        order._keys = MappedList(keys)
+        order._seq_of = MappedDict(keys, lambda i: int(seqs[i]))
+        order._next = int(seqs[-1]) + 1 if len(seqs) else 0
+        return order
+
+    def clear(self):
+        self._seqs = array("q")
+        self._keys: List[Optional[str]] = []
+        self._seq_of: Dict[str, int] = {}
+        self._next = 0
+        self._dead = 0
+
+    def add(self, key: str, seq: Optional[int] = None):
+        if key in self._seq_of:
+            return
+        if seq is None:
+            seq = self._next
+        self._seq_of[key] = seq
+        if not self._seqs or seq > self._seqs[-1]:
+            self._seqs.append(seq)
+            self._keys.append(key)
+        else:
+            # an older key moving into this index (e.g. a changed field value)
+            at = bisect_left(self._seqs, seq)
+            self._seqs.insert(at, seq)
+            self._keys.insert(at, key)
+        self._next = max(self._next, seq + 1)
+
+    def seq(self, key: str) -> Optional[int]:
+        return self._seq_of.get(key)
+
+    def __len__(self) -> int:
+        return len(self._seq_of)
+
+    def __iter__(self):
+        return (k for k in self._keys if k is not None)
+
+    def remove(self, key: str):
+        seq = self._seq_of.pop(key, None)
+        if seq is None:
+            return
+        self._keys[bisect_left(self._seqs, seq)] = None
+        self._dead += 1
+        if self._dead > len(self._seq_of):
+            live = [(s, k) for s, k in zip(self._seqs, self._keys) if k is not None]
+            self._seqs = array("q", (s for s, _ in live))
+            self._keys = [k for _, k in live]
+            self._dead = 0
+
+    def page(
+        self, after: Optional[int], limit: int, keep: Optional[Callable[[str], bool]] = None
+    ) -> Tuple[List[str], Optional[int]]:
+        """Up to `limit` keys after cursor `after`; returns (keys, next cursor or None at the end)."""
+        i = 0 if after is None else bisect_right(self._seqs, after)
+        out: List[str] = []
+        n = len(self._keys)
+        while i < n and len(out) < limit:
+            k = self._keys[i]
+            if k is not None and (keep is None or keep(k)):
+                out.append(k)
+            i += 1
+        return out, (self._seqs[i - 1] if i < n else None)
@@ -0,0 +1,111 @@
+"""
+Live results over Server-Sent Events.
+
+One Broadcaster per worker process runs a single ticker while anyone is subscribed.
+Each tick reads the store version (lock-free, or one round trip with STORE_MODE=shared);
+only when it moved does it build and encode one frame, which every subscriber then
+sends. A burst of mutations between ticks becomes one frame, and a subscriber that is
+slower than the tick skips straight to the latest frame: a connection holds no queue,
+just its place in the current wake-up event.
+"""
+from __future__ import annotations
+import asyncio
+import os
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from . import fastjson
+
+TICK_SECONDS = float(os.getenv("LIVE_TICK_MS", "250")) / 1000.0
+HEARTBEAT_SECONDS = 15.0  # keeps idle connections alive through proxies
+HEARTBEAT = b": keepalive\n\n"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, event_id: str, content) -> bytes:
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (event_id.encode(), event.encode(), fastjson.dumps(content))
+
+class Broadcaster:
+    """
+    Fans the latest frame of `build()` out to subscribers, at most once per tick.
+    `version()` must change whenever `build()` would return something new.
+    """
+    def __init__(
+        self,
+        event: str,
+        version: Callable[[], Awaitable[str]],
+        build: Callable[[], Awaitable[Tuple[str, object]]],
+        tick: float = TICK_SECONDS,
+        heartbeat: float = HEARTBEAT_SECONDS,
+    ):
+        self.event = event
+        self._version = version
+        self._build = build
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self.subscribers = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self):
+        # asyncio primitives belong to one loop; a new loop (a fresh test client) starts over
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._task: Optional[asyncio.Task] = None
+        self._refreshing = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._frame: Tuple[int, bytes] = (0, b"")  # (seq, encoded event); seq 0 = nothing yet
+        self._sent_version: Optional[str] = None
+
+    def _publish(self, frame: Optional[bytes]):
+        """Wake every subscriber; with a frame they send it, without one a heartbeat."""
+        if frame is not None:
+            self._frame = (self._frame[0] + 1, frame)
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+    async def _refresh(self) -> bool:
+        """Publish a frame if the store moved on since the last one."""
+        async with self._refreshing:
+            if await self._version() == self._sent_version:
+                return False
+            version, content = await self._build()
+            self._sent_version = version
+            self._publish(sse_event(self.event, version, content))
+            return True
+
+    async def _run(self):
+        quiet = 0.0
+        try:
+            while self.subscribers:
+                await asyncio.sleep(self.tick)
+                if await self._refresh():
+                    quiet = 0.0
+                else:
+                    quiet += self.tick
+                    if quiet >= self.heartbeat:
+                        self._publish(None)
+                        quiet = 0.0
+        finally:
+            self._task = None
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """SSE byte stream: the current frame right away, then one per change."""
+        self._bind()
+        self.subscribers += 1
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            await self._refresh()
+            seen = 0
+            while True:
+                # read the frame and the next wake-up together: anything published while
+                # we're blocked in send() sets `wake`, and we then pick up the latest frame
+                (seq, frame), wake = self._frame, self._wake
+                if seq != seen:
+                    seen = seq
+                    yield frame
+                elif seen:
+                    yield HEARTBEAT
+                await wake.wait()
+        finally:
+            self.subscribers -= 1
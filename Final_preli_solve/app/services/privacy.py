@@ -0,0 +1,98 @@
+"""
+Differentially private releases of store aggregates (Laplace mechanism).
+
+Every fresh release of a metric spends its epsilon from that metric's budget. A
+release is cached with the store version of the collections it was measured from
+and served again, free, until one of them changes: repeating a noisy answer
+reveals nothing new, while drawing fresh noise over the same data would let a
+client average it away. Noise for keyed metrics (per candidate, per district) is
+drawn in one NumPy batch.
+"""
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .rwlock import WouldBlock, blocking_allowed
+
+# metric -> (store method measured, collections whose version keys the cache)
+METRICS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "turnout": ("turnout", ("votes",)),
+    "per_candidate": ("candidate_totals", ("candidates", "votes")),
+    "per_district": ("district_counts", ("voters",)),
+}
+
+CACHE_PER_METRIC = 64  # releases kept per metric (one per epsilon/sensitivity pair)
+
+Value = Union[float, Dict[str, float]]
+
+class BudgetExhausted(Exception):
+    pass
+
+def laplace_noise(values: List[float], scale: float, rng: np.random.Generator) -> np.ndarray:
+    """values + Laplace(0, scale) noise, one independent draw per value."""
+    return np.asarray(values, dtype=np.float64) + rng.laplace(0.0, scale, len(values))
+
+class Releases:
+    """
+    Cached noisy releases and the epsilon spent per metric. `budget` caps the total
+    epsilon per metric (None: unlimited, spending is still tracked).
+    """
+    def __init__(self, budget: Optional[float] = None, rng: Optional[np.random.Generator] = None):
+        self.budget = budget
+        self._rng = rng or np.random.default_rng()
+        self._lock = threading.Lock()  # one release at a time: no double spend, and Generators aren't thread-safe
+        self._spent: Dict[str, float] = {}
+        self._cache: Dict[str, Dict[Tuple[float, float], Tuple[str, dict]]] = {}
+
+    def _acquire(self):
+        if not self._lock.acquire(False):
+            if not blocking_allowed():
+                raise WouldBlock()
+            self._lock.acquire()
+
+    def spent(self) -> Dict[str, float]:
+        return dict(self._spent)
+
+    def release(
+        self,
+        metric: str,
+        epsilon: float,
+        sensitivity: float,
+        version: Callable[[], str],
+        measure: Callable[[], Tuple[str, Value]],
+    ) -> dict:
+        """
+        The cached release for (metric, epsilon, sensitivity) if `version()` still
+        matches it; otherwise `measure()` (-> (version, exact value)) is noised, cached
+        and charged to the metric's budget. Raises BudgetExhausted instead of overspending.
+        """
+        self._acquire()
+        try:
+            cached = self._cache.setdefault(metric, {})
+            hit = cached.get((epsilon, sensitivity))
+            if hit is not None and hit[0] == version():
+                return {**hit[1], "cached": True, "epsilon_spent": self._spent[metric]}
+            spent = self._spent.get(metric, 0.0)
+            if self.budget is not None and spent + epsilon > self.budget:
+                raise BudgetExhausted(f"Privacy budget for {metric} exhausted ({spent:g} of {self.budget:g} spent)")
+            current, exact = measure()
+            if isinstance(exact, dict):
+                keys = list(exact)
+                noisy = laplace_noise([exact[k] for k in keys], sensitivity / epsilon, self._rng)
+                value: Value = dict(zip(keys, noisy.tolist()))
+            else:
+                value = float(laplace_noise([exact], sensitivity / epsilon, self._rng)[0])
+            self._spent[metric] = spent + epsilon
+            out = {"metric": metric, "value": value, "epsilon": epsilon, "released_at": time.time()}
+            # older versions can't be served again; past that, drop the oldest pairs
+            for key in [k for k, (v, _) in cached.items() if v != current]:
+                del cached[key]
+            cached[(epsilon, sensitivity)] = (current, out)
+            while len(cached) > CACHE_PER_METRIC:
+                del cached[next(iter(cached))]
+            return {**out, "cached": False, "epsilon_spent": self._spent[metric]}
+        finally:
+            self._lock.release()
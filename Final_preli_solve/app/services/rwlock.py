@@ -0,0 +1,123 @@
+from __future__ import annotations
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+class WouldBlock(Exception):
+    """A lock was contended while the thread was inside nonblocking()."""
+
+_mode = threading.local()
+
+@contextmanager
+def nonblocking():
+    """Inside this block, lock acquisitions that would have to wait raise WouldBlock."""
+    prev = getattr(_mode, "on", False)
+    _mode.on = True
+    try:
+        yield
+    finally:
+        _mode.on = prev
+
+def blocking_allowed() -> bool:
+    return not getattr(_mode, "on", False)
+
+class RWLock:
+    """
+    Readers-writer lock: any number of readers, or one writer.
+
+    Writer-preferring: once a writer is waiting, new readers queue behind it, so a
+    steady stream of lookups can't starve mutations. Both sides are re-entrant per
+    thread and the writing thread may also take the read side; upgrading a held read
+    lock to a write lock would deadlock and raises RuntimeError instead.
+    `on_wait(name, mode, seconds)` is called after every acquisition that had to wait.
+    """
+    def __init__(self, name: str = "", on_wait: Optional[Callable[[str, str, float], None]] = None):
+        self.name = name
+        self._on_wait = on_wait
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None  # ident of the owning thread
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth or self._writer == threading.get_ident():
+            # nested read, or a read inside our own write: nothing to wait for
+            if not depth:
+                self._local.shared = False
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            waited = None
+            if self._writer is not None or self._writers_waiting:
+                if not blocking_allowed():
+                    raise WouldBlock()
+                started = time.perf_counter()
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+                waited = time.perf_counter() - started
+            self._readers += 1
+        if waited is not None and self._on_wait:
+            self._on_wait(self.name, "read", waited)
+        self._local.shared = True
+        self._local.depth = 1
+
+    def release_read(self):
+        self._local.depth -= 1
+        if self._local.depth or not self._local.shared:
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if getattr(self._local, "depth", 0):
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            waited = None
+            if self._writer is not None or self._readers:
+                if not blocking_allowed():
+                    raise WouldBlock()
+                started = time.perf_counter()
+                self._writers_waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._writers_waiting -= 1
+                waited = time.perf_counter() - started
+            self._writer = me
+            self._write_depth = 1
+        if waited is not None and self._on_wait:
+            self._on_wait(self.name, "write", waited)
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+from collections import Counter
+from itertools import chain
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+CMP_BLOCK = 1 << 22  # max elements in one (ballots x n x n) comparison block
+
+def _compress(candidates: Sequence[str], ballots: Sequence[Sequence[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Collapse identical ballots into weighted unique rankings.
+    Returns (order, lengths, weights): order[u, t] is the column of the candidate ranked
+    t-th on unique ballot u (-1 past its length), rows sorted by length, longest first.
+    Unknown names are dropped and, as before, a name listed twice counts at its last position.
+    """
+    col = {c: i for i, c in enumerate(candidates)}
+    rankings: Counter = Counter()
+    for ballot, count in Counter(map(tuple, ballots)).items():
+        try:
+            cols = tuple(map(col.__getitem__, ballot))
+        except KeyError:
+            cols = None
+        if cols is None or len(set(cols)) != len(cols):
+            rank = {c: r for r, c in enumerate(ballot) if c in col}
+            cols = tuple(col[c] for c in sorted(rank, key=rank.get))
+        rankings[cols] += count
+    ranked = sorted(rankings.items(), key=lambda kv: -len(kv[0]))
+    lengths = np.fromiter((len(cols) for cols, _ in ranked), dtype=np.int64, count=len(ranked))
+    weights = np.fromiter((w for _, w in ranked), dtype=np.float64, count=len(ranked))
+    width = int(lengths[0]) if len(ranked) else 0
+    order = np.full((len(ranked), width), -1, dtype=np.int64)
+    rows = np.repeat(np.arange(len(ranked)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    pos = np.arange(len(rows)) - np.repeat(starts, lengths)
+    order[rows, pos] = np.fromiter(chain.from_iterable(cols for cols, _ in ranked), dtype=np.int64, count=len(rows))
+    return order, lengths, weights
+
+def _pairs_by_position(order: np.ndarray, lengths: np.ndarray, weights: np.ndarray, n: int) -> np.ndarray:
+    """Short ballots: count ranked-over-ranked pairs directly, ranked-over-unranked with one matmul."""
+    ranked = np.zeros((len(weights), n), dtype=np.float64)
+    ranked[np.repeat(np.arange(len(weights)), lengths), order[order >= 0]] = 1.0
+    d = (ranked * weights[:, None]).T @ (1.0 - ranked)
+    flat = np.zeros(n * n, dtype=np.float64)
+    for t in range(1, order.shape[1]):
+        live = int(np.count_nonzero(lengths > t))  # rows are sorted longest first
+        keys = order[:live, :t] * n + order[:live, t, None]
+        flat += np.bincount(keys.ravel(), weights=np.repeat(weights[:live], t), minlength=n * n)
+    return d + flat.reshape(n, n)
+
+def _pairs_by_rank(order: np.ndarray, lengths: np.ndarray, weights: np.ndarray, n: int) -> np.ndarray:
+    """Long ballots: compare full rank rows, one vectorized block of ballots at a time."""
+    ranks = np.full((len(weights), n), n, dtype=np.int64)  # unranked ties after every ranked
+    rows = np.repeat(np.arange(len(weights)), lengths)
+    ranks[rows, order[order >= 0]] = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    d = np.zeros(n * n, dtype=np.float64)
+    block = max(1, CMP_BLOCK // (n * n))
+    for s in range(0, len(weights), block):
+        r = ranks[s:s + block]
+        prefers = (r[:, :, None] < r[:, None, :]).reshape(len(r), n * n)
+        d += weights[s:s + block] @ prefers.astype(np.float64)
+    return d.reshape(n, n)
+
+def pairwise_matrix(candidates: Sequence[str], ballots: Sequence[Sequence[str]]) -> np.ndarray:
+    """d[a][b] = number of ballots ranking a above b (an unranked candidate loses to every ranked one)."""
+    n = len(candidates)
+    if n == 0 or not ballots:
+        return np.zeros((n, n), dtype=np.int64)
+    order, lengths, weights = _compress(candidates, ballots)
+    # direct pair counting costs ~sum(L^2/2) per ballot, rank comparison ~n^2 but much cheaper per element
+    if 8 * int((lengths * (lengths - 1) // 2).sum()) < len(weights) * n * n:
+        d = _pairs_by_position(order, lengths, weights, n)
+    else:
+        d = _pairs_by_rank(order, lengths, weights, n)
+    d = np.rint(d).astype(np.int64)
+    last = {c: i for i, c in enumerate(candidates)}
+    if len(last) != n:
+        # only a duplicated name's last position carries counts, once per occurrence
+        # of each name (the old pairwise loop visited duplicates repeatedly)
+        shadowed = np.array([last[c] != i for i, c in enumerate(candidates)])
+        d[shadowed, :] = 0
+        d[:, shadowed] = 0
+        mult = np.array([list(candidates).count(c) for c in candidates], dtype=np.int64)
+        d *= mult[:, None] * mult[None, :]
+    return d
+
+def strongest_paths(d: np.ndarray) -> np.ndarray:
+    """Widest-path strengths p[a][b] via a vectorized Floyd-Warshall."""
+    n = d.shape[0]
+    p = np.where(d > d.T, d, 0)
+    diag = np.arange(n)
+    for i in range(n):
+        # row/column i don't change in step i, so the whole step can run at once
+        np.maximum(p, np.minimum(p[:, i, None], p[None, i, :]), out=p)
+        p[diag, diag] = 0
+    return p
+
+def winners(candidates: Sequence[str], p: np.ndarray) -> List[str]:
+    beats = (p >= p.T).all(axis=1)
+    return [candidates[i] for i in np.flatnonzero(beats)]
+
+def schulze(candidates: Sequence[str], ballots: Sequence[Sequence[str]]) -> Tuple[List[str], List[List[int]]]:
+    """Schulze winners and the strongest-path matrix (as nested lists)."""
+    p = strongest_paths(pairwise_matrix(candidates, ballots))
+    return winners(candidates, p), p.tolist()
@@ -0,0 +1,405 @@
+"""
+Binary snapshot format, read through a memory map.
+
+Layout: MAGIC, then sections (each an 8-byte little-endian length followed by the
+payload, padded to 8 bytes), then a JSON header naming every section's offset and
+length plus the small aggregates, then the header's length in the last 8 bytes.
+
+Columns are typed arrays (read as zero-copy NumPy views of the map) or string
+columns: an offsets array plus the concatenated UTF-8 bytes, optionally with a
+permutation that sorts the values so a key is found by binary search without
+building a dict. Records are stored as one JSON document per row and decoded when
+first accessed; everything in memory only covers what changed since the load.
+"""
+from __future__ import annotations
+import json
+import mmap
+import struct
+import sys
+from collections.abc import MutableMapping, MutableSequence, Sequence
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import fastjson
+
+MAGIC = b"ELSNAP01"
+_LEN = struct.Struct("<Q")
+_MISSING = object()
+
+def sort_order(values: List[bytes]) -> np.ndarray:
+    """Permutation that sorts `values` bytewise (UTF-8 byte order is code point order)."""
+    if not values:
+        return np.zeros(0, dtype=np.int64)
+    if any(b"\0" in v for v in values):
+        # fixed-width "S" arrays drop trailing NULs; fall back to a Python sort
+        return np.array(sorted(range(len(values)), key=values.__getitem__), dtype=np.int64)
+    return np.argsort(np.array(values, dtype="S"), kind="stable").astype(np.int64)
+
+class SnapshotWriter:
+    """Writes sections in order; close() appends the header."""
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self._pos = len(MAGIC)
+        self._sections: Dict[str, Tuple[int, int]] = {}
+        f.write(MAGIC)
+
+    def section(self, name: str, data) -> None:
+        data = memoryview(data).cast("B")
+        self._f.write(_LEN.pack(len(data)))
+        self._f.write(data)
+        self._sections[name] = (self._pos + _LEN.size, len(data))
+        pad = -(len(data)) % 8
+        self._f.write(b"\0" * pad)
+        self._pos += _LEN.size + len(data) + pad
+
+    def array(self, name: str, values, dtype) -> None:
+        self.section(name, np.ascontiguousarray(values, dtype=dtype))
+
+    def strings(self, name: str, values: List[bytes], indexed: bool = False) -> None:
+        offsets = np.zeros(len(values) + 1, dtype=np.uint64)
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        self.array(name + ".offsets", offsets, np.uint64)
+        self.section(name + ".data", b"".join(values))
+        if indexed:
+            self.array(name + ".sorted", sort_order(values), np.int64)
+
+    def close(self, header: dict) -> None:
+        body = json.dumps({**header, "byteorder": sys.byteorder, "sections": self._sections}, separators=(",", ":")).encode("utf-8")
+        self._f.write(body)
+        self._f.write(_LEN.pack(len(body)))
+
+class Snapshot:
+    """A mapped snapshot file. Views keep the map alive; replacing the file on disk doesn't disturb it."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a binary snapshot")
+        (n,) = _LEN.unpack_from(self._mm, len(self._mm) - _LEN.size)
+        end = len(self._mm) - _LEN.size
+        self.header = json.loads(self._mm[end - n:end])
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.header['byteorder']}-endian machine")
+        self._sections = self.header.pop("sections")
+
+    @staticmethod
+    def is_binary(path) -> bool:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def section(self, name: str) -> memoryview:
+        offset, length = self._sections[name]
+        return memoryview(self._mm)[offset:offset + length]
+
+    def array(self, name: str, dtype) -> np.ndarray:
+        offset, length = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mm, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def strings(self, name: str, decode: Callable[[bytes], Any] = bytes.decode) -> "MappedStrings":
+        order = self.array(name + ".sorted", np.int64) if name + ".sorted" in self._sections else None
+        return MappedStrings(self.array(name + ".offsets", np.uint64), self.section(name + ".data"), order, decode)
+
+class MappedStrings(Sequence):
+    """Read-only string (or JSON, with decode=fastjson.loads) column of a snapshot."""
+    def __init__(self, offsets: np.ndarray, data, order: Optional[np.ndarray] = None, decode: Callable[[bytes], Any] = bytes.decode):
+        self._offsets = offsets
+        self._data = data
+        self._order = order
+        self._decode = decode
+
+    @classmethod
+    def empty(cls) -> "MappedStrings":
+        return cls(np.zeros(1, dtype=np.uint64), b"", np.zeros(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("column index out of range")
+        return self._decode(self.raw(i))
+
+    def find(self, value: str) -> int:
+        """Row holding `value`, or -1; a binary search over the sorted permutation."""
+        key = value.encode("utf-8")
+        order = self._order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw(order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self.raw(order[lo]) == key:
+            return int(order[lo])
+        return -1
+
+class MappedSubset(Sequence):
+    """The rows `rows` (ascending) of a MappedStrings column, e.g. the ids in one district."""
+    def __init__(self, column: MappedStrings, rows: np.ndarray):
+        self._column = column
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._column[int(self._rows[i])]
+
+    def find(self, value: str) -> int:
+        row = self._column.find(value)
+        if row < 0:
+            return -1
+        j = int(np.searchsorted(self._rows, row))
+        return j if j < len(self._rows) and self._rows[j] == row else -1
+
+class MappedList(MutableSequence):
+    """
+    A snapshot column plus what happened since: appends, and replaced positions
+    (KeyOrder blanks deleted keys with None). insert() anywhere but the end copies
+    the column into memory first.
+    """
+    def __init__(self, base: Sequence):
+        self._base = base
+        self._n = len(base)
+        self._replaced: Dict[int, Any] = {}
+        self._extra: List[Any] = []
+
+    def __len__(self) -> int:
+        return self._n + len(self._extra)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i >= self._n:
+            return self._extra[i - self._n]
+        if i < 0:
+            raise IndexError("list index out of range")
+        v = self._replaced.get(i, _MISSING)
+        return self._base[i] if v is _MISSING else v
+
+    def __setitem__(self, i, value):
+        if i < 0:
+            i += len(self)
+        if i >= self._n:
+            self._extra[i - self._n] = value
+        elif i >= 0:
+            self._replaced[i] = value
+        else:
+            raise IndexError("list assignment index out of range")
+
+    def __delitem__(self, i):
+        self._materialize()
+        del self._extra[i]
+
+    def __iter__(self) -> Iterator[Any]:
+        replaced, base = self._replaced, self._base
+        for i in range(self._n):
+            v = replaced.get(i, _MISSING)
+            yield base[i] if v is _MISSING else v
+        yield from list(self._extra)
+
+    def append(self, value):
+        self._extra.append(value)
+
+    def insert(self, i, value):
+        if i >= len(self):
+            self._extra.append(value)
+            return
+        self._materialize()
+        self._extra.insert(i, value)
+
+    def _materialize(self):
+        if self._n:
+            self._extra = list(self)
+            self._base, self._n, self._replaced = (), 0, {}
+
+    def clear(self):
+        self._base, self._n, self._replaced, self._extra = (), 0, {}, []
+
+    def copy(self) -> "MappedList":
+        other = MappedList(self._base)
+        other._n = self._n
+        other._replaced = dict(self._replaced)
+        other._extra = list(self._extra)
+        return other
+
+    def encoded(self, encode: Callable[[Any], bytes]) -> Iterator[bytes]:
+        """Each element as bytes: the column's own for untouched rows, else encode(value)."""
+        raw = getattr(self._base, "raw", None)
+        for i in range(self._n):
+            v = self._replaced.get(i, _MISSING)
+            yield raw(i) if v is _MISSING and raw else encode(self[i])
+        for v in list(self._extra):
+            yield encode(v)
+
+class MappedDict(MutableMapping):
+    """
+    dict over a snapshot: keys are a sorted-indexed column and value(row) builds a
+    row's value, on first access, after which it is kept. Updates, deletes and new keys
+    live in memory. Iteration order is a dict's: snapshot rows first, then keys added
+    (or re-added after a delete) since. Safe for the store's lock-free readers: a value
+    materialized while a writer replaces it never overwrites the new one.
+    `source` is the RecordSection the rows come from, if any (see write_records()).
+    """
+    def __init__(self, keys, value: Callable[[int], Any], source: Optional["RecordSection"] = None):
+        self._keys = keys
+        self._value = value
+        self.source = source
+        self._live: Dict[str, Any] = {}  # snapshot keys: decoded or updated values
+        self._gone: set = set()  # snapshot keys deleted since the load
+        self._tail: Dict[str, Any] = {}  # keys added since the load
+
+    def _in_base(self, key: str) -> bool:
+        return key not in self._gone and (key in self._live or self._keys.find(key) >= 0)
+
+    def get(self, key, default=None):
+        v = self._tail.get(key, _MISSING)
+        if v is not _MISSING:
+            return v
+        if key in self._gone:
+            return default
+        v = self._live.get(key, _MISSING)
+        if v is not _MISSING:
+            return v
+        row = self._keys.find(key)
+        if row < 0:
+            return default
+        return self._live.setdefault(key, self._value(row))
+
+    def __getitem__(self, key):
+        v = self.get(key, _MISSING)
+        if v is _MISSING:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key) -> bool:
+        return key in self._tail or self._in_base(key)
+
+    def __setitem__(self, key, value):
+        if key in self._tail or key in self._gone or not self._in_base(key):
+            self._tail[key] = value
+        else:
+            self._live[key] = value
+
+    def __delitem__(self, key):
+        if key in self._tail:
+            del self._tail[key]
+        elif self._in_base(key):
+            self._gone.add(key)
+            self._live.pop(key, None)
+        else:
+            raise KeyError(key)
+
+    def __len__(self) -> int:
+        return len(self._keys) - len(self._gone) + len(self._tail)
+
+    def __iter__(self) -> Iterator[str]:
+        keys, gone = self._keys, self._gone
+        for i in range(len(keys)):
+            k = keys[i]
+            if k not in gone:
+                yield k
+        yield from list(self._tail)
+
+    def clear(self):
+        self._keys, self.source = MappedStrings.empty(), None
+        self._live, self._gone, self._tail = {}, set(), {}
+
+    def copy(self) -> "MappedDict":
+        other = MappedDict(self._keys, self._value, self.source)
+        other._live, other._gone, other._tail = dict(self._live), set(self._gone), dict(self._tail)
+        return other
+
+    def entries(self) -> Iterator[Tuple[str, int, Any]]:
+        """(key, snapshot row or -1, value or None if untouched since the load), in order."""
+        keys, gone, live = self._keys, self._gone, self._live
+        for i in range(len(keys)):
+            k = keys[i]
+            if k not in gone:
+                yield k, i, live.get(k)
+        for k, v in list(self._tail.items()):
+            yield k, -1, v
+
+class MappedSet:
+    """Set of strings over a sorted-indexed column plus additions (in / add / clear)."""
+    def __init__(self, base: MappedStrings):
+        self._base = base
+        self._added: set = set()
+
+    def __contains__(self, value) -> bool:
+        return value in self._added or self._base.find(value) >= 0
+
+    def add(self, value):
+        self._added.add(value)
+
+    def clear(self):
+        self._base = MappedStrings.empty()
+        self._added.clear()
+
+class RecordSection:
+    """
+    A records section: ids in insertion order (sorted-indexed), one JSON document per
+    row, and one indexed field (district, party) as per-row codes plus the rows grouped
+    by code, so the secondary index is slices of one array.
+    """
+    def __init__(self, snap: Snapshot, name: str):
+        self.ids = snap.strings(name + ".ids")
+        self.records = snap.strings(name + ".records", decode=fastjson.loads)
+        meta = snap.header[name]
+        self.field_values: List[str] = meta["field_values"]
+        self.field_bounds: List[int] = meta["field_bounds"]
+        self.field_codes = snap.array(name + ".field", np.int32)
+        self.by_field = snap.array(name + ".by_field", np.int64)
+
+    def mapping(self) -> MappedDict:
+        return MappedDict(self.ids, self.records.__getitem__, self)
+
+    def groups(self) -> Iterator[Tuple[str, MappedSubset, np.ndarray]]:
+        """(field value, its ids, their rows) per indexed value."""
+        for code, value in enumerate(self.field_values):
+            rows = self.by_field[self.field_bounds[code]:self.field_bounds[code + 1]]
+            yield value, MappedSubset(self.ids, rows), rows
+
+def write_records(writer: SnapshotWriter, header: dict, name: str, records, field: str) -> None:
+    """Write a dict (or MappedDict) of records; untouched snapshot rows are copied, not re-encoded."""
+    base: Optional[RecordSection] = getattr(records, "source", None)
+    entries: Iterable[Tuple[str, int, Any]] = (
+        records.entries() if isinstance(records, MappedDict) else ((k, -1, v) for k, v in records.items())
+    )
+    ids: List[bytes] = []
+    rows: List[bytes] = []
+    codes: List[int] = []
+    values: Dict[str, int] = {}
+    for key, row, rec in entries:
+        ids.append(key.encode("utf-8"))
+        if rec is None:
+            rows.append(base.records.raw(row))
+            code = int(base.field_codes[row])
+            value = base.field_values[code] if code >= 0 else None
+        else:
+            rows.append(fastjson.dumps(rec))
+            value = rec.get(field) or None
+        codes.append(-1 if value is None else values.setdefault(value, len(values)))
+    writer.strings(name + ".ids", ids, indexed=True)
+    writer.strings(name + ".records", rows)
+    code_arr = np.array(codes, dtype=np.int32)
+    order = np.argsort(code_arr, kind="stable")
+    order = order[code_arr[order] >= 0]
+    writer.array(name + ".field", code_arr, np.int32)
+    writer.array(name + ".by_field", order, np.int64)
+    bounds = np.searchsorted(code_arr[order], np.arange(len(values) + 1)).tolist()
+    header[name] = {"field": field, "field_values": list(values), "field_bounds": bounds}
@@ -0,0 +1,39 @@
+from __future__ import annotations
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from . import fastjson
+
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+def parse_cursor(cursor: Optional[str], parts: int = 1):
+    """Decode an opaque cursor ("12" or "1704067200000000:12"); 422 if malformed."""
+    if cursor is None:
+        return None
+    try:
+        values = tuple(int(x) for x in cursor.split(":"))
+    except ValueError:
+        values = ()
+    if len(values) != parts:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return values[0] if parts == 1 else values
+
+def format_cursor(cursor) -> Optional[str]:
+    if cursor is None:
+        return None
+    return ":".join(str(x) for x in cursor) if isinstance(cursor, (tuple, list)) else str(cursor)
+
+def ndjson_pages(fetch_page: Callable[[object, int], Tuple[List, object]], after=None, page_size: int = PAGE_SIZE) -> Iterator[bytes]:
+    """
+    Stream rows as NDJSON one page at a time. Each page is one short store call, so
+    memory and lock hold time are bounded by page_size rather than the collection size.
+    Rows may be dicts or already-encoded JSON bytes.
+    """
+    while True:
+        items, after = fetch_page(after, page_size)
+        if items:
+            yield b"".join((x if isinstance(x, bytes) else fastjson.dumps(x)) + b"\n" for x in items)
+        if after is None:
+            return
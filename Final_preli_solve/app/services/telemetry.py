@@ -0,0 +1,214 @@
+"""
+Prometheus-style instrumentation: counters, gauges and bucketed histograms rendered
+in the text exposition format, plus the pure-ASGI middleware that feeds the HTTP ones.
+
+Families are split by where they are observed: HTTP_FAMILIES in the web worker,
+STORE_FAMILIES wherever the store runs (the same process, or the store daemon with
+STORE_MODE=shared, which renders its own through store.metrics_exposition()).
+"""
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Store-lock wait of the request being handled, in seconds. A one-item list, so the
+# copies of the context that threadpool calls run in all add to the same total.
+request_lock_wait: ContextVar[Optional[List[float]]] = ContextVar("request_lock_wait", default=None)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(x: float) -> str:
+    return repr(float(x)) if x != int(x) else str(int(x))
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Family):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+class Histogram(_Family):
+    """Cumulative-bucket histogram; quantile() estimates from the buckets like histogram_quantile()."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        with self._lock:
+            s = self._series.get(labels)
+            counts, total = (list(s[0]), s[2]) if s else ([], 0)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # beyond the last bound: report the bound
+                lo = self.buckets[i - 1] if i else 0.0
+                return lo + (self.buckets[i] - lo) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def label_sets(self) -> List[Tuple[str, ...]]:
+        with self._lock:
+            return sorted(self._series)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._series.items())
+        lines = self.header()
+        for labels, (counts, total_sum, count) in items:
+            cum = 0
+            for bound, n in zip(self.buckets, counts):
+                cum += n
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cum}")
+            inf = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total_sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+def quantile_lines(hist: Histogram, name: str, help: str) -> List[str]:
+    """p50/p95/p99 per label set of `hist`, as a gauge family with a quantile label."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels in hist.label_sets():
+        for q in QUANTILES:
+            v = hist.quantile(q, *labels)
+            if v is not None:
+                ql = _labels(hist.labelnames, labels, 'quantile="%s"' % q)
+                lines.append(f"{name}{ql} {_num(v)}")
+    return lines
+
+def render(families: Iterable[_Family]) -> str:
+    return "\n".join(line for f in families for line in f.render()) + "\n"
+
+# HTTP (observed by MetricsMiddleware)
+http_requests = Counter("http_requests_total", "Requests by route and status code.", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "Request latency, first byte of the request to the end of the response.", ("method", "route"))
+http_lock_wait = Counter("http_request_lock_wait_seconds_total", "Time requests spent waiting on store locks.", ("method", "route"))
+http_handler = Counter("http_request_handler_seconds_total", "Time requests spent outside store-lock waits (handler, validation, serialization).", ("method", "route"))
+HTTP_FAMILIES = (http_requests, http_duration, http_lock_wait, http_handler)
+
+# Store (observed by the store and its locks)
+lock_wait = Histogram("store_lock_wait_seconds", "Wait time of contended store-lock acquisitions.", ("lock", "mode"))
+journal_append = Histogram("store_journal_append_seconds", "Time to append (and fsync, per the policy) one journal record.")
+snapshot_duration = Histogram("store_snapshot_seconds", "Time to write a snapshot (copy, serialize, fsync, truncate the journal).", buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+snapshot_bytes = Gauge("store_snapshot_bytes", "Size of the last snapshot written.")
+STORE_FAMILIES = (lock_wait, journal_append, snapshot_duration, snapshot_bytes)
+
+def lock_waited(lock: str, mode: str, seconds: float):
+    """Record a contended lock acquisition, globally and against the current request."""
+    lock_wait.observe(seconds, lock, mode)
+    acc = request_lock_wait.get()
+    if acc is not None:
+        acc[0] += seconds
+
+def route_label(scope: dict) -> str:
+    # the route template keeps label cardinality bounded; unmatched paths share one label
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    Pure-ASGI request instrumentation (no BaseHTTPMiddleware task/stream wrapping):
+    per-route latency, status counts, lock wait vs handler time, X-Response-Time.
+    """
+    def __init__(self, app, on_request: Optional[Callable[[], None]] = None):
+        self.app = app
+        self.on_request = on_request
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        waited = [0.0]
+        token = request_lock_wait.set(waited)
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                ms = str((time.perf_counter() - start) * 1000.0).encode("latin-1")
+                message["headers"] = [*message.get("headers", ()), (b"x-response-time", ms)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            request_lock_wait.reset(token)
+            elapsed = time.perf_counter() - start
+            method, route = scope["method"], route_label(scope)
+            http_requests.inc(method, route, str(status))
+            http_duration.observe(elapsed, method, route)
+            http_lock_wait.inc(method, route, amount=waited[0])
+            http_handler.inc(method, route, amount=max(elapsed - waited[0], 0.0))
+            if self.on_request is not None:
+                self.on_request()
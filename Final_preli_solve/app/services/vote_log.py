@@ -0,0 +1,177 @@
+from __future__ import annotations
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .snapshot import MappedList, MappedStrings, Snapshot, SnapshotWriter
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_NAIVE = -(2 ** 31)  # tz-offset sentinel for timestamps stored without a timezone
+
+def epoch_us(ts: datetime) -> int:
+    """Microseconds since the Unix epoch; naive datetimes are taken as UTC."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+class _Interner:
+    """
+    Maps strings to dense int codes and back. Loaded from a binary snapshot, the
+    values start as the mapped column and codes as an empty memo: a code is found by
+    binary search the first time it's needed.
+    """
+    def __init__(self, base: Optional[MappedStrings] = None):
+        self._base = base
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = [] if base is None else MappedList(base)
+
+    def find(self, s: str) -> Optional[int]:
+        c = self.codes.get(s)
+        if c is None and self._base is not None:
+            row = self._base.find(s)
+            if row >= 0:
+                c = self.codes[s] = row
+        return c
+
+    def code(self, s: str) -> int:
+        c = self.find(s)
+        if c is None:
+            c = self.codes[s] = len(self.values)
+            self.values.append(s)
+        return c
+
+    def copy(self) -> "_Interner":
+        other = _Interner(self._base)
+        other.codes = dict(self.codes)
+        other.values = self.values.copy()
+        return other
+
+class VoteLog:
+    """
+    Columnar, append-only vote storage.
+
+    voter and candidate ids are interned to int32 codes; timestamps (epoch us + tz
+    offset), weights and the weighted flag live in typed arrays, ~29 bytes per vote
+    instead of a dict per row. Indexing and iteration yield the same dict rows the
+    routes and the JSON snapshot have always used:
+    {"voter_id", "candidate_id", "weight", "timestamp", "weighted"}.
+    """
+    def __init__(self, rows: Iterable[dict] = ()):
+        self.clear()
+        for row in rows:
+            self.append(row)
+
+    def clear(self):
+        self.voters = _Interner()
+        self.candidates = _Interner()
+        self.voter = array("i")
+        self.candidate = array("i")
+        self.ts_us = array("q")
+        self.tz_offset = array("i")
+        self.weight = array("d")  # NaN stands for a null weight
+        self.weighted = array("b")
+
+    def append(self, row: dict):
+        ts = row["timestamp"]
+        if isinstance(ts, str):
+            ts = datetime.fromisoformat(ts)
+        off = ts.utcoffset()
+        w = row.get("weight", 1.0)
+        self.voter.append(self.voters.code(row["voter_id"]))
+        self.candidate.append(self.candidates.code(row["candidate_id"]))
+        self.ts_us.append(epoch_us(ts))
+        self.tz_offset.append(_NAIVE if off is None else int(off.total_seconds()))
+        self.weight.append(math.nan if w is None else float(w))
+        self.weighted.append(1 if row.get("weighted", False) else 0)
+
+    _COLUMNS = (("voter", "i"), ("candidate", "i"), ("ts_us", "q"), ("tz_offset", "i"), ("weight", "d"), ("weighted", "b"))
+
+    @classmethod
+    def mapped(cls, snap: Snapshot, name: str) -> "VoteLog":
+        """A log over a binary snapshot: the columns are copied out of the map, ids stay there."""
+        log = cls()
+        log.voters = _Interner(snap.strings(name + ".voters"))
+        log.candidates = _Interner(snap.strings(name + ".candidates"))
+        for col, typecode in cls._COLUMNS:
+            values = array(typecode)
+            values.frombytes(snap.section(f"{name}.{col}"))
+            setattr(log, col, values)
+        return log
+
+    def write(self, writer: SnapshotWriter, name: str):
+        writer.strings(name + ".voters", [v.encode("utf-8") for v in self.voters.values], indexed=True)
+        writer.strings(name + ".candidates", [c.encode("utf-8") for c in self.candidates.values], indexed=True)
+        for col, _ in self._COLUMNS:
+            writer.section(f"{name}.{col}", getattr(self, col))
+
+    def copy(self) -> "VoteLog":
+        """A point-in-time copy; the columns are flat arrays, so this is a few memcpys."""
+        other = VoteLog()
+        other.voters = self.voters.copy()
+        other.candidates = self.candidates.copy()
+        for col, _ in self._COLUMNS:
+            setattr(other, col, getattr(self, col)[:])
+        return other
+
+    def __len__(self) -> int:
+        return len(self.ts_us)
+
+    def timestamp(self, i: int) -> str:
+        us, off = self.ts_us[i], self.tz_offset[i]
+        if off == _NAIVE:
+            return (_EPOCH_NAIVE + timedelta(microseconds=us)).isoformat()
+        tz = timezone(timedelta(seconds=off))
+        return (_EPOCH + timedelta(microseconds=us)).astimezone(tz).isoformat()
+
+    def row(self, i: int) -> dict:
+        w = self.weight[i]
+        return {
+            "voter_id": self.voters.values[self.voter[i]],
+            "candidate_id": self.candidates.values[self.candidate[i]],
+            "weight": None if w != w else w,
+            "timestamp": self.timestamp(i),
+            "weighted": bool(self.weighted[i]),
+        }
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("vote index out of range")
+        return self.row(i)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    # Column scans (no per-row dicts)
+    def tallies(self) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """(weighted totals, vote counts) per candidate_id, summed in append order."""
+        totals: Dict[int, float] = {}
+        counts: Dict[int, int] = {}
+        for c, w, flag in zip(self.candidate, self.weight, self.weighted):
+            totals[c] = totals.get(c, 0.0) + (w if flag else 1.0)
+            counts[c] = counts.get(c, 0) + 1
+        names = self.candidates.values
+        return {names[c]: t for c, t in totals.items()}, {names[c]: n for c, n in counts.items()}
+
+    def standard_voters(self) -> set:
+        names = self.voters.values
+        return {names[v] for v, flag in zip(self.voter, self.weighted) if not flag}
+
+    def standard_voter_ids(self) -> List[str]:
+        """standard_voters() through NumPy: distinct codes first, then only those names."""
+        voter = np.frombuffer(self.voter, dtype=np.int32)
+        weighted = np.frombuffer(self.weighted, dtype=np.int8)
+        names = self.voters.values
+        return [names[int(c)] for c in np.unique(voter[weighted == 0])]
+
+    def distinct_voters(self) -> int:
+        # a voter id is interned by its first vote and never dropped, so this is O(1)
+        return len(self.voters.values)
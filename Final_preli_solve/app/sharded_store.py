@@ -0,0 +1,471 @@
+"""
+Hash-sharded store (STORE_SHARDS=N).
+
+Voters, and everything keyed by a voter (votes, duplicate-vote checks, encrypted
+ballots), are partitioned by crc32(voter_id) % N over N InMemoryStores, each with its
+own locks, journal, snapshot and running tallies. Registering, updating or deleting
+a voter, casting a vote and submitting an encrypted ballot touch one shard only, so
+writes for different voters don't queue on one votes lock. Global reads (leaderboard,
+turnout, vote ranges, ballot tallies) merge the per-shard aggregates.
+
+Candidates are small and every vote checks one, so each shard holds a full replica:
+candidate writes take every shard's candidates lock (in shard order) and commit to
+each, candidate reads go to shard 0. Contests and request metrics live on shard 0.
+
+Locks across shards are taken collection by collection in the usual order
+(voters -> candidates -> votes -> ballots -> contests -> journal), and within one
+collection in shard order.
+"""
+from __future__ import annotations
+import heapq
+import secrets
+import threading
+import time
+import zlib
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .data_store import InMemoryStore, StoreError
+from .services import privacy, telemetry
+from .services.encryption import MODULUS
+from .services.rwlock import WouldBlock, nonblocking
+
+CURSOR_SPAN = 1 << 40  # voter/candidate cursors: shard * CURSOR_SPAN + local cursor + 1
+
+class ShardedStore:
+    """
+    Same interface as InMemoryStore (every STORE_METHODS name), over `n` shards.
+    Shard i persists to <stem>.shard<i><suffix> (+ .wal / .snap) next to `persist_path`,
+    and <stem>.shards records n: restarting with a different STORE_SHARDS is refused.
+    """
+    # calls that write to several shards: never run inline on the event loop, where a
+    # WouldBlock halfway through would leave some shards written
+    _SPANNING_WRITES = {
+        "put_candidate", "remove_candidate", "register_candidate", "update_candidate", "delete_candidate",
+        "register_voters", "register_candidates", "cast_votes", "submit_encrypted_ballots",
+        "save", "reset",
+    }
+
+    def __init__(
+        self,
+        n: int,
+        persist_path: Optional[str] = None,
+        fsync: str = "interval",
+        snapshot_every: int = 100_000,
+        snapshot_format: str = "json",
+        dp_budget: Optional[float] = None,
+    ):
+        self.n = n
+        self.persist_path = Path(persist_path) if persist_path else None
+        if self.persist_path and self.persist_path.parent.is_dir():
+            self._check_layout()
+        self._shards = [
+            InMemoryStore(
+                persist_path=str(self._shard_path(i)) if self.persist_path else None,
+                fsync=fsync,
+                snapshot_every=snapshot_every,
+                snapshot_format=snapshot_format,
+            )
+            for i in range(n)
+        ]
+        self._primary = self._shards[0]
+        self._status_lock = threading.Lock()
+        self._reloading = False
+        self._last_load: Optional[dict] = None
+        self._epoch = secrets.token_hex(4)
+        self._dp = privacy.Releases(dp_budget)
+        self._sync_candidates()
+
+    def _shard_path(self, i: int) -> Path:
+        return self.persist_path.with_name(f"{self.persist_path.stem}.shard{i}{self.persist_path.suffix}")
+
+    def _check_layout(self):
+        marker = self.persist_path.with_suffix(".shards")
+        if marker.exists():
+            found = int(marker.read_text().strip() or 0)
+            if found != self.n:
+                raise ValueError(f"{marker} holds state for {found} shards, not STORE_SHARDS={self.n}")
+            return
+        unsharded = [self.persist_path, self.persist_path.with_suffix(".snap"), self.persist_path.with_suffix(".wal")]
+        if any(p.exists() and p.stat().st_size for p in unsharded):
+            raise ValueError(f"{self.persist_path} holds unsharded state; it isn't split automatically")
+        marker.write_text(f"{self.n}\n")
+
+    def _sync_candidates(self):
+        """Repair candidate replicas that a crash left half-written; shard 0 is authoritative."""
+        with self._hold("candidates", write=True):
+            truth = {cid: self._primary.candidates.get(cid) for cid in self._primary.candidates}
+            for shard in self._shards[1:]:
+                for cid in [cid for cid in shard.candidates if cid not in truth]:
+                    shard.remove_candidate(cid)
+                for cid, data in truth.items():
+                    if shard.candidates.get(cid) != data:
+                        shard.put_candidate(data)
+
+    # Routing
+    def _index(self, voter_id: str) -> int:
+        return zlib.crc32(voter_id.encode("utf-8")) % self.n
+
+    def _shard(self, voter_id: str) -> InMemoryStore:
+        return self._shards[self._index(voter_id)]
+
+    def _hold(self, *collections: str, write: bool = False) -> ExitStack:
+        """The named collection locks of every shard, in the documented order."""
+        with ExitStack() as stack:
+            for name in InMemoryStore._LOCK_ORDER:
+                if name in collections:
+                    for shard in self._shards:
+                        lock = getattr(shard, f"_{name}_lock")
+                        stack.enter_context(lock.write() if write else lock.read())
+            return stack.pop_all()  # released by the caller; a WouldBlock above releases them here
+
+    def _grouped(self, items: List[dict], run: Callable[[InMemoryStore, int, List[dict], List[int]], List[dict]]) -> List[dict]:
+        """Split a batch by shard, run each part, and return the results in input order."""
+        parts: Dict[int, List[int]] = {}
+        for i, item in enumerate(items):
+            parts.setdefault(self._index(item["voter_id"]), []).append(i)
+        results: List[Optional[dict]] = [None] * len(items)
+        for s, idx in sorted(parts.items()):
+            for i, result in zip(idx, run(self._shards[s], s, [items[i] for i in idx], idx)):
+                results[i] = result
+        return results
+
+    def _ballot_index(self, s: int, local: int) -> int:
+        return local * self.n + s
+
+    # Mutations
+    def put_voter(self, data: dict):
+        self._shard(data["voter_id"]).put_voter(data)
+
+    def remove_voter(self, voter_id: str):
+        self._shard(voter_id).remove_voter(voter_id)
+
+    def put_candidate(self, data: dict):
+        with self._hold("candidates", write=True):
+            for shard in self._shards:
+                shard.put_candidate(data)
+
+    def remove_candidate(self, candidate_id: str):
+        with self._hold("candidates", write=True):
+            for shard in self._shards:
+                shard.remove_candidate(candidate_id)
+
+    def add_vote(self, payload: dict):
+        self._shard(payload["voter_id"]).add_vote(payload)
+
+    def add_encrypted_ballot(self, data: dict) -> int:
+        s = self._index(data["voter_id"])
+        return self._ballot_index(s, self._shards[s].add_encrypted_ballot(data))
+
+    def register_voter(self, data: dict) -> dict:
+        return self._shard(data["voter_id"]).register_voter(data)
+
+    def update_voter(self, voter_id: str, changes: dict) -> dict:
+        return self._shard(voter_id).update_voter(voter_id, changes)
+
+    def delete_voter(self, voter_id: str):
+        self._shard(voter_id).delete_voter(voter_id)
+
+    def register_candidate(self, data: dict) -> dict:
+        with self._hold("candidates", write=True):
+            if data["candidate_id"] in self._primary.candidates:
+                raise StoreError(409, "Duplicate candidate_id")
+            self.put_candidate(data)
+            return data
+
+    def update_candidate(self, candidate_id: str, changes: dict) -> dict:
+        with self._hold("candidates", write=True):
+            c = self._primary.candidates.get(candidate_id)
+            if not c:
+                raise StoreError(404, "Candidate not found")
+            data = c.copy()
+            data.update(changes)
+            self.put_candidate(data)
+            return data
+
+    def delete_candidate(self, candidate_id: str):
+        with self._hold("candidates", write=True):
+            if candidate_id not in self._primary.candidates:
+                raise StoreError(404, "Candidate not found")
+            self.remove_candidate(candidate_id)
+
+    def cast_vote(self, payload: dict):
+        self._shard(payload["voter_id"]).cast_vote(payload)
+
+    def submit_encrypted_ballot(self, data: dict) -> int:
+        s = self._index(data["voter_id"])
+        return self._ballot_index(s, self._shards[s].submit_encrypted_ballot(data))
+
+    def create_contest(self, data: dict) -> dict:
+        return self._primary.create_contest(data)
+
+    def add_contest_ballots(self, contest_id: str, ballots: List[List[str]]) -> int:
+        return self._primary.add_contest_ballots(contest_id, ballots)
+
+    def contest_result(self, contest_id: str) -> dict:
+        return self._primary.contest_result(contest_id)
+
+    # Batches: one lock hold and journal sync per shard
+    def register_voters(self, rows: List[dict]) -> List[dict]:
+        return self._grouped(rows, lambda shard, s, part, idx: shard.register_voters(part))
+
+    def register_candidates(self, rows: List[dict]) -> List[dict]:
+        results = []
+        with self._hold("candidates", write=True):
+            for row in rows:
+                try:
+                    self.register_candidate(row)
+                    results.append({"status_code": 218})
+                except StoreError as e:
+                    results.append({"status_code": e.status_code, "detail": e.detail})
+        return results
+
+    def cast_votes(self, payloads: List[dict]) -> List[dict]:
+        return self._grouped(payloads, lambda shard, s, part, idx: shard.cast_votes(part))
+
+    def submit_encrypted_ballots(self, ballots: List[dict], verified: List[bool]) -> List[dict]:
+        def run(shard, s, part, idx):
+            results = shard.submit_encrypted_ballots(part, [verified[i] for i in idx])
+            for r in results:
+                if "ballot_index" in r:
+                    r["ballot_index"] = self._ballot_index(s, r["ballot_index"])
+            return results
+        return self._grouped(ballots, run)
+
+    # Reads
+    def get_voter(self, voter_id: str) -> Optional[dict]:
+        return self._shard(voter_id).get_voter(voter_id)
+
+    def voter_exists(self, voter_id: str) -> bool:
+        return self._shard(voter_id).voter_exists(voter_id)
+
+    def get_voter_json(self, voter_id: str) -> Optional[bytes]:
+        return self._shard(voter_id).get_voter_json(voter_id)
+
+    def has_standard_vote(self, voter_id: str) -> bool:
+        return self._shard(voter_id).has_standard_vote(voter_id)
+
+    def list_voters(self, district: Optional[str] = None) -> List[dict]:
+        return [v for shard in self._shards for v in shard.list_voters(district)]
+
+    def _paged(self, fetch, after: Optional[int], limit: Optional[int]) -> Tuple[List, Optional[int]]:
+        """Shard-major paging: a shard's local cursor, offset by the shard index."""
+        s, local = divmod(after, CURSOR_SPAN) if after is not None else (0, 0)
+        local_after = local - 1 if local else None
+        out: List = []
+        while s < self.n and (limit is None or len(out) < limit):
+            items, cursor = fetch(self._shards[s], local_after, None if limit is None else limit - len(out))
+            out += items
+            if cursor is not None:
+                return out, s * CURSOR_SPAN + cursor + 1
+            s, local_after = s + 1, None
+        return out, (s * CURSOR_SPAN if s < self.n else None)
+
+    def voters_page(self, after: Optional[int], limit: int, district: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        return self._paged(lambda shard, a, lim: shard.voters_page(a, lim, district), after, limit)
+
+    def voters_json_page(
+        self, after: Optional[int] = None, limit: Optional[int] = None, district: Optional[str] = None
+    ) -> Tuple[List[bytes], Optional[int]]:
+        return self._paged(lambda shard, a, lim: shard.voters_json_page(a, lim, district), after, limit)
+
+    def district_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for shard in self._shards:
+            for d, k in shard.district_counts().items():
+                counts[d] = counts.get(d, 0) + k
+        return counts
+
+    def get_candidate(self, candidate_id: str) -> Optional[dict]:
+        return self._primary.get_candidate(candidate_id)
+
+    def list_candidates(self, party: Optional[str] = None) -> List[dict]:
+        return self._primary.list_candidates(party)
+
+    def candidates_page(
+        self, after: Optional[int], limit: int, party: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[int]]:
+        return self._primary.candidates_page(after, limit, party)
+
+    def get_candidate_json(self, candidate_id: str) -> Optional[bytes]:
+        return self._primary.get_candidate_json(candidate_id)
+
+    def candidates_json_page(
+        self, after: Optional[int] = None, limit: Optional[int] = None, party: Optional[str] = None
+    ) -> Tuple[List[bytes], Optional[int]]:
+        return self._primary.candidates_json_page(after, limit, party)
+
+    def turnout(self) -> int:
+        # a voter's votes all live on its shard, so distinct voters add up
+        with self._hold("votes"):
+            return sum(shard.turnout() for shard in self._shards)
+
+    def votes_in_range(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[int, List[dict], Optional[Tuple[int, int]]]:
+        """
+        Per-shard time ranges merged by (timestamp, position); a vote's global position
+        is local position * n + shard, so cursors resume exactly as on one store.
+        """
+        want = None if limit is None else offset + limit
+        total, runs, more = 0, [], False
+        with self._hold("votes"):
+            for s, shard in enumerate(self._shards):
+                local = None if after is None else (after[0], (after[1] - s) // self.n)
+                count, page, rest = shard._votes_range(start, end, want, 0, local)
+                total += count
+                more = more or rest
+                runs.append([(key, pos * self.n + s, row) for key, pos, row in page])
+        merged = list(heapq.merge(*runs))
+        page = merged[offset:want]
+        more = more or (want is not None and len(merged) > want)
+        cursor = page[-1][:2] if page and more else None
+        return total, [row for _, _, row in page], cursor
+
+    def encrypted_tally(self, group_by: Optional[str] = None) -> dict:
+        out = {"ballots": 0, "skipped": 0, "sum": 0}
+        groups: Dict[str, Dict[str, int]] = {}
+        with self._hold("ballots"):
+            parts = [shard.encrypted_tally(group_by) for shard in self._shards]
+        for part in parts:
+            out["ballots"] += part["ballots"]
+            out["skipped"] += part["skipped"]
+            out["sum"] = (out["sum"] + part["sum"]) % MODULUS
+            for label, g in part.get("groups", {}).items():
+                merged = groups.setdefault(label, {"ballots": 0, "sum": 0})
+                merged["ballots"] += g["ballots"]
+                merged["sum"] = (merged["sum"] + g["sum"]) % MODULUS
+        if group_by is not None:
+            out["groups"] = groups
+        return out
+
+    def candidate_totals(self) -> Dict[str, float]:
+        with self._hold("candidates", "votes"):
+            totals = self._primary.candidate_totals()
+            for shard in self._shards[1:]:
+                for cid, t in shard.candidate_totals().items():
+                    totals[cid] += t
+            return totals
+
+    def leaderboard(self) -> List[dict]:
+        return InMemoryStore._ranked(self.candidate_totals())
+
+    def generation(self, *collections: str) -> int:
+        return sum(shard.generation(*collections) for shard in self._shards)
+
+    def version(self, *collections: str) -> str:
+        return f"{self._epoch}-{self.generation(*collections)}"
+
+    def versioned_leaderboard(self) -> Tuple[str, List[dict]]:
+        with self._hold("candidates", "votes"):
+            return self.version("candidates", "votes"), self.leaderboard()
+
+    def versioned_results(self) -> Tuple[str, dict]:
+        with self._hold("candidates", "votes"):
+            return self.version("candidates", "votes"), {"leaderboard": self.leaderboard(), "turnout": self.turnout()}
+
+    def dp_release(self, metric: str, epsilon: float, sensitivity: float) -> dict:
+        """InMemoryStore.dp_release() over the merged aggregates, with one budget for all shards."""
+        if metric not in privacy.METRICS:
+            raise StoreError(422, "Unknown metric")
+        method, collections = privacy.METRICS[metric]
+
+        def measure():
+            with self._hold(*collections):
+                return self.version(*collections), getattr(self, method)()
+        try:
+            return self._dp.release(metric, epsilon, sensitivity, lambda: self.version(*collections), measure)
+        except privacy.BudgetExhausted as e:
+            raise StoreError(403, str(e))
+
+    # Metrics and config
+    def count_request(self, n: int = 1):
+        self._primary.count_request(n)
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        return self._primary.metrics_snapshot()
+
+    def collection_sizes(self) -> Dict[str, int]:
+        sizes = [shard.collection_sizes() for shard in self._shards]
+        out = {name: sum(s[name] for s in sizes) for name in sizes[0]}
+        # replicated / primary-only collections count once
+        out["candidates"] = sizes[0]["candidates"]
+        out["contests"] = sizes[0]["contests"]
+        return out
+
+    def metrics_exposition(self) -> str:
+        sizes = telemetry.Gauge("store_collection_size", "Rows per store collection.", ("collection",))
+        for name, n in self.collection_sizes().items():
+            sizes.set(n, name)
+        return telemetry.render(telemetry.STORE_FAMILIES + (sizes,))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            **self._primary.config(),
+            "persist_path": str(self.persist_path) if self.persist_path else None,
+            "dp_epsilon_budget": self._dp.budget,
+            "shards": self.n,
+        }
+
+    def call_nowait(self, method: str, *args, **kwargs):
+        """InMemoryStore.call_nowait(); calls that write to several shards always WouldBlock."""
+        if method in self._SPANNING_WRITES:
+            raise WouldBlock()
+        with nonblocking():
+            return getattr(self, method)(*args, **kwargs)
+
+    # State
+    def save(self, fmt: Optional[str] = None):
+        for shard in self._shards:
+            shard.save(fmt)
+
+    def reload(self) -> bool:
+        with self._status_lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+        threading.Thread(target=self._background_reload, daemon=True).start()
+        return True
+
+    def _background_reload(self):
+        """
+        InMemoryStore._background_reload() for every shard at once: all shards are
+        loaded in the background, then swapped in under every shard's locks.
+        """
+        started = time.time()
+        try:
+            with ExitStack() as saves:
+                for shard in self._shards:
+                    saves.enter_context(shard._save_lock)
+                fresh = [shard._load_fresh() for shard in self._shards]
+                with self._hold(*InMemoryStore._LOCK_ORDER, write=True), ExitStack() as journals:
+                    for shard in self._shards:
+                        journals.enter_context(shard._journal_lock)
+                    for shard, (store, offset) in zip(self._shards, fresh):
+                        shard._swap_in(store, offset)
+                    self._epoch = secrets.token_hex(4)
+            self._sync_candidates()
+            self._last_load = {"ok": True, "started": started, "seconds": time.time() - started}
+        except Exception as e:
+            self._last_load = {"ok": False, "started": started, "seconds": time.time() - started, "error": str(e)}
+        finally:
+            self._reloading = False
+
+    def load_status(self) -> dict:
+        return {"state": "loading" if self._reloading else "ready", "last_load": self._last_load}
+
+    def reset(self):
+        with self._hold(*InMemoryStore._LOCK_ORDER, write=True):
+            for shard in self._shards:
+                shard.reset()
+
+    def close(self):
+        for shard in self._shards:
+            shard.close()
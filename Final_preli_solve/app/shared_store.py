@@ -0,0 +1,140 @@
+"""
+Cross-process store for multi-worker deployments (STORE_MODE=shared).
+
+One daemon process owns the InMemoryStore (and its journal). Workers reach it over a
+local unix socket through multiprocessing.managers: each store method call is one
+round trip and runs inside the daemon under the store's locks, so duplicate-vote checks
+and tallies stay atomic across workers, while request parsing, validation and
+serialization run in parallel in the workers.
+"""
+from __future__ import annotations
+import os
+import secrets
+import stat
+import tempfile
+import threading
+from multiprocessing.managers import BaseManager
+from typing import Optional
+
+# The store API the routes use; only these methods are reachable through the socket.
+STORE_METHODS = (
+    "put_voter", "remove_voter", "put_candidate", "remove_candidate",
+    "add_vote", "add_encrypted_ballot",
+    "register_voter", "update_voter", "delete_voter",
+    "register_candidate", "update_candidate", "delete_candidate",
+    "cast_vote", "submit_encrypted_ballot",
+    "register_voters", "register_candidates", "cast_votes", "submit_encrypted_ballots",
+    "create_contest", "add_contest_ballots", "contest_result",
+    "get_voter", "voter_exists", "list_voters", "get_candidate", "list_candidates",
+    "voters_page", "candidates_page", "district_counts",
+    "get_voter_json", "voters_json_page", "get_candidate_json", "candidates_json_page",
+    "has_standard_vote", "turnout", "votes_in_range", "candidate_totals", "leaderboard",
+    "generation", "version", "versioned_leaderboard", "versioned_results",
+    "encrypted_tally", "dp_release",
+    "count_request", "metrics_snapshot", "collection_sizes", "metrics_exposition", "config", "save", "reload", "load_status", "reset",
+)
+
+# a directory only this user can enter, so other local users can't reach the socket
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"election-store-{os.getuid()}", "store.sock")
+
+_daemon_store = None
+_daemon_lock = threading.Lock()
+
+def _get_daemon_store():
+    # runs inside the daemon process; manager server threads share one store
+    global _daemon_store
+    with _daemon_lock:
+        if _daemon_store is None:
+            from .data_store import local_store
+            _daemon_store = local_store()
+        return _daemon_store
+
+class StoreManager(BaseManager):
+    pass
+
+StoreManager.register("store", callable=_get_daemon_store, exposed=STORE_METHODS)
+
+def _address() -> str:
+    return os.environ.get("STORE_SOCKET", DEFAULT_SOCKET)
+
+def _authkey() -> bytes:
+    key = os.environ.get("STORE_AUTHKEY")
+    if not key:
+        raise RuntimeError("STORE_AUTHKEY is not set; start the store daemon first or set it explicitly")
+    return key.encode("utf-8")
+
+def _private_dir(path: str):
+    """Create `path` as 0700, or check that an existing one is ours and closed to others."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise RuntimeError(f"{path} belongs to another user; refusing to put the store socket there")
+    if stat.S_IMODE(st.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+
+def start_daemon(address: Optional[str] = None, authkey: Optional[bytes] = None) -> StoreManager:
+    """
+    Start the store daemon (call once, e.g. from the gunicorn master before forking).
+    Without an authkey (argument or STORE_AUTHKEY) a random one is generated and
+    exported to STORE_AUTHKEY, which the workers forked afterwards inherit.
+    """
+    address = address or _address()
+    if address == DEFAULT_SOCKET:
+        _private_dir(os.path.dirname(address))
+    if authkey is None:
+        if not os.environ.get("STORE_AUTHKEY"):
+            os.environ["STORE_AUTHKEY"] = secrets.token_hex(32)
+        authkey = _authkey()
+    if os.path.exists(address):
+        os.unlink(address)  # stale socket from an unclean shutdown
+    manager = StoreManager(address=address, authkey=authkey)
+    manager.start()
+    os.chmod(address, 0o600)
+    manager.store()  # build the store (load snapshot + journal) before workers connect
+    return manager
+
+class SharedStoreClient:
+    """
+    Worker-side handle with the same interface as InMemoryStore.
+    Connects lazily, and again after a fork, so the gunicorn master never holds a live connection.
+    Request counts are batched locally to avoid a round trip per request.
+    """
+    FLUSH_EVERY = 64
+
+    def __init__(self, address: Optional[str] = None, authkey: Optional[bytes] = None):
+        self._address = address or _address()
+        self._authkey = authkey  # else STORE_AUTHKEY, read on connect: the master may set it after import
+        self._conn_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._remote = None
+        self._pending_requests = 0
+
+    def _proxy(self):
+        if self._remote is None or self._pid != os.getpid():
+            with self._conn_lock:
+                if self._remote is None or self._pid != os.getpid():
+                    manager = StoreManager(address=self._address, authkey=self._authkey or _authkey())
+                    manager.connect()
+                    self._remote = manager.store()
+                    self._pid = os.getpid()
+        return self._remote
+
+    def count_request(self, n: int = 1):
+        with self._conn_lock:
+            self._pending_requests += n
+            if self._pending_requests < self.FLUSH_EVERY:
+                return
+            n, self._pending_requests = self._pending_requests, 0
+        self._proxy().count_request(n)
+
+    def metrics_snapshot(self):
+        with self._conn_lock:
+            n, self._pending_requests = self._pending_requests, 0
+        if n:
+            self._proxy().count_request(n)
+        return self._proxy().metrics_snapshot()
+
+    def __getattr__(self, name):
+        if name not in STORE_METHODS:
+            raise AttributeError(name)
+        return getattr(self._proxy(), name)
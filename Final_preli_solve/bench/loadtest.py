@@ -0,0 +1,351 @@
+"""
+Load-test harness for the API's hot paths.
+
+For every (store size, concurrency) pair it seeds a snapshot, starts the app under
+uvicorn or gunicorn, drives a weighted mix of requests for a fixed time and reports
+req/s and latency percentiles per operation as JSON, so runs can be diffed between
+commits:
+
+    python bench/loadtest.py --votes 10k,1m --concurrency 16,64 --duration 20 --out run.json
+    python bench/loadtest.py --votes 10k --server gunicorn --workers 4 --compare run.json
+
+Seeds are deterministic (fixed RNG seed) and cached under --seed-dir, since writing
+the 10M-vote snapshot takes a while. Each run works on a hard link of the cached
+snapshot, so the server's saves and journal never touch the cache.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MIX = "register=10,vote=35,leaderboard=35,range=15,schulze=5"
+SEED_RNG = 20240101
+CANDIDATES = 20
+SEED_START = datetime(2024, 1, 1)
+SEED_SPAN_S = 24 * 3600
+WEIGHTED_PER_VOTER = 9  # each seeded voter casts one standard vote and this many weighted ones
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+def parse_count(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+def parse_mix(s: str) -> Dict[str, float]:
+    mix = {}
+    for part in s.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPS:
+            raise SystemExit(f"unknown op in --mix: {name} (known: {', '.join(OPS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+# Seeding
+
+def seed_snapshot(votes: int, seed_dir: Path) -> Path:
+    """Write (once) a snapshot with `votes` votes, streamed so memory stays flat."""
+    path = seed_dir / f"seed-{votes}.json"
+    if path.exists():
+        return path
+    seed_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(SEED_RNG)
+    voters = max(votes // (WEIGHTED_PER_VOTER + 1), 1)
+    tmp = path.with_suffix(".tmp")
+    dumps = lambda o: json.dumps(o, separators=(",", ":"))
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write('{"voters":{')
+        for i in range(voters):
+            f.write(("," if i else "") + dumps(f"s{i}") + ":" + dumps({"voter_id": f"s{i}", "name": "Seed", "age": 18 + i % 60, "district": f"d{i % 50}"}))
+        f.write('},"candidates":{')
+        for i in range(CANDIDATES):
+            f.write(("," if i else "") + dumps(f"c{i}") + ":" + dumps({"candidate_id": f"c{i}", "name": f"Candidate {i}", "party": f"p{i % 4}"}))
+        f.write('},"votes":[')
+        step = SEED_SPAN_S / votes
+        for i in range(votes):
+            ts = (SEED_START + timedelta(seconds=i * step)).isoformat()
+            weighted = i % (WEIGHTED_PER_VOTER + 1) != 0
+            row = {
+                "voter_id": f"s{(i // (WEIGHTED_PER_VOTER + 1)) % voters}",
+                "candidate_id": f"c{int(rng.paretovariate(1.2)) % CANDIDATES}",
+                "weight": round(rng.uniform(0.5, 3.0), 2) if weighted else 1.0,
+                "timestamp": ts,
+                "weighted": weighted,
+            }
+            f.write(("," if i else "") + dumps(row))
+        f.write('],"encrypted_ballots":[],"contests":{},"journal_seq":0}')
+    os.replace(tmp, path)
+    return path
+
+# Server
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args, snapshot: Path, workdir: Path) -> Tuple[subprocess.Popen, str]:
+    state = workdir / "state.json"
+    try:
+        os.link(snapshot, state)
+    except OSError:
+        shutil.copyfile(snapshot, state)
+    port = free_port()
+    env = dict(os.environ, STATE_PATH=str(state), STATE_FSYNC=args.fsync, STATE_SNAPSHOT_EVERY=str(10 ** 12))
+    if args.server == "gunicorn":
+        env.update(STORE_MODE="shared", STORE_SOCKET=str(workdir / "store.sock"))
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+               "app.main:app", "--bind", f"127.0.0.1:{port}", "--timeout", "600", "--log-level", "warning"]
+    else:
+        env["STORE_MODE"] = "memory"
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--no-access-log", "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, start_new_session=True)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode} during startup")
+        try:
+            if httpx.get(base + "/health", timeout=1.0).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    stop_server(proc)
+    raise SystemExit(f"server not ready after {args.startup_timeout}s")
+
+def stop_server(proc: subprocess.Popen):
+    if proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+
+# Traffic
+
+class Driver:
+    """One client process: `concurrency` closed-loop workers sharing one connection pool."""
+    def __init__(self, base: str, proc_id: int, seeded_voters: int, fresh: List[str], rng: random.Random):
+        self.base = base
+        self.proc_id = proc_id
+        self.seeded_voters = seeded_voters
+        self.fresh = fresh  # pre-registered voters that haven't voted yet
+        self.rng = rng
+        self.next_id = 0
+        ranked = [f"r{i}" for i in range(5)]
+        self.schulze_body = {"candidates": ranked, "ballots": [rng.sample(ranked, rng.randint(1, 5)) for _ in range(200)]}
+
+    async def register(self, client):
+        self.next_id += 1
+        return await client.post("/api/voters", json={"voter_id": f"b{self.proc_id}-{self.next_id}", "name": "Bench", "age": 30})
+
+    async def vote(self, client):
+        cid = f"c{self.rng.randrange(CANDIDATES)}"
+        if self.fresh:
+            return await client.post("/api/votes", json={"voter_id": self.fresh.pop(), "candidate_id": cid})
+        # pool used up: weighted votes go through the same cast_vote path
+        voter = f"s{self.rng.randrange(self.seeded_voters)}"
+        return await client.post("/api/votes/weighted", json={"voter_id": voter, "candidate_id": cid, "weight": 1.5})
+
+    async def leaderboard(self, client):
+        return await client.get("/api/results/leaderboard")
+
+    async def range(self, client):
+        start = SEED_START + timedelta(seconds=self.rng.uniform(0, SEED_SPAN_S - 60))
+        params = {"start": start.isoformat(), "end": (start + timedelta(seconds=60)).isoformat(), "limit": 100}
+        return await client.get("/api/votes", params=params)
+
+    async def schulze(self, client):
+        return await client.post("/api/votes/rcv/schulze", json=self.schulze_body)
+
+OPS = ("register", "vote", "leaderboard", "range", "schulze")
+OK_STATUS = {"register": 218, "vote": 218, "leaderboard": 200, "range": 222, "schulze": 200}
+
+async def _drive(base, proc_id, concurrency, duration, warmup, mix, seeded_voters, fresh):
+    rng = random.Random(SEED_RNG + proc_id)
+    driver = Driver(base, proc_id, seeded_voters, fresh, rng)
+    names, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = {op: [] for op in names}
+    errors: Dict[str, Dict[str, int]] = {op: {} for op in names}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60.0) as client:
+        t0 = time.perf_counter()
+        measure_from, stop_at = t0 + warmup, t0 + warmup + duration
+
+        async def worker():
+            while True:
+                op = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                if started >= stop_at:
+                    return
+                try:
+                    r = await getattr(driver, op)(client)
+                    status = str(r.status_code) if r.status_code != OK_STATUS[op] else None
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if started < measure_from:
+                    continue
+                if status is None:
+                    latencies[op].append(time.perf_counter() - started)
+                else:
+                    errors[op][status] = errors[op].get(status, 0) + 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+def _drive_process(a):
+    return asyncio.run(_drive(*a))
+
+def prepare_fresh_voters(base: str, count: int, procs: int) -> List[List[str]]:
+    """Register the voters the `vote` op will use (outside the measured window)."""
+    ids = [f"f{i}" for i in range(count)]
+    for start in range(0, count, 10_000):
+        rows = [{"voter_id": v, "name": "Fresh", "age": 30} for v in ids[start:start + 10_000]]
+        httpx.post(base + "/api/voters/bulk", json=rows, timeout=600.0).raise_for_status()
+    return [ids[p::procs] for p in range(procs)]
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> dict:
+    latencies.sort()
+    n = len(latencies)
+    pick = lambda p: round(latencies[min(n - 1, int(p / 100 * n))] * 1000.0, 3) if n else None
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / seconds, 1),
+        "latency_ms": {**{f"p{p:g}": pick(p) for p in PERCENTILES}, "max": pick(100), "mean": round(sum(latencies) / n * 1000.0, 3) if n else None},
+    }
+
+def run_case(args, votes: int, concurrency: int, mix: Dict[str, float]) -> dict:
+    snapshot = seed_snapshot(votes, Path(args.seed_dir))
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        started = time.monotonic()
+        proc, base = start_server(args, snapshot, Path(workdir))
+        load_s = time.monotonic() - started
+        try:
+            procs = max(1, min(args.client_procs, concurrency))
+            fresh = prepare_fresh_voters(base, args.vote_pool, procs)
+            seeded_voters = max(votes // (WEIGHTED_PER_VOTER + 1), 1)
+            share = [concurrency // procs + (1 if p < concurrency % procs else 0) for p in range(procs)]
+            jobs = [(base, p, share[p], args.duration, args.warmup, mix, seeded_voters, fresh[p]) for p in range(procs)]
+            if procs == 1:
+                results = [_drive_process(jobs[0])]
+            else:
+                with multiprocessing.get_context("spawn").Pool(procs) as pool:
+                    results = pool.map(_drive_process, jobs)
+        finally:
+            stop_server(proc)
+    ops = {}
+    all_lat: List[float] = []
+    all_err = 0
+    for op in mix:
+        lat = [x for lats, _ in results for x in lats[op]]
+        err: Dict[str, int] = {}
+        for _, errs in results:
+            for status, n in errs[op].items():
+                err[status] = err.get(status, 0) + n
+        all_lat.extend(lat)
+        all_err += sum(err.values())
+        ops[op] = {**summarize(lat, sum(err.values()), args.duration), "error_status": err}
+    return {
+        "votes": votes,
+        "concurrency": concurrency,
+        "startup_s": round(load_s, 2),
+        "total": summarize(all_lat, all_err, args.duration),
+        "ops": ops,
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """One line per matching case/op: req/s and p99 change against the baseline run."""
+    key = lambda c: (c["votes"], c["concurrency"])
+    base = {key(c): c for c in baseline["cases"]}
+    lines = []
+    for case in current["cases"]:
+        old = base.get(key(case))
+        if old is None:
+            continue
+        for op, cur in [("total", case["total"]), *case["ops"].items()]:
+            prev = old["total"] if op == "total" else old["ops"].get(op)
+            if not prev or not prev["rps"] or prev["latency_ms"]["p99"] is None or cur["latency_ms"]["p99"] is None:
+                continue
+            rps = (cur["rps"] / prev["rps"] - 1) * 100
+            p99 = (cur["latency_ms"]["p99"] / prev["latency_ms"]["p99"] - 1) * 100
+            lines.append(f"votes={case['votes']} c={case['concurrency']} {op:<11} rps {rps:+6.1f}%  p99 {p99:+6.1f}%")
+    return lines
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--votes", default="10k,1m,10m", help="comma-separated seeded store sizes (k/m suffixes)")
+    p.add_argument("--concurrency", default="64", help="comma-separated numbers of concurrent clients")
+    p.add_argument("--duration", type=float, default=30.0, help="measured seconds per case")
+    p.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before each case")
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"op=weight list over {', '.join(OPS)}")
+    p.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    p.add_argument("--workers", type=int, default=4, help="gunicorn workers (STORE_MODE=shared)")
+    p.add_argument("--client-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="load generator processes")
+    p.add_argument("--vote-pool", type=int, default=100_000, help="voters pre-registered for the vote op")
+    p.add_argument("--fsync", default="interval", help="STATE_FSYNC for the server")
+    p.add_argument("--seed-dir", default=str(Path(tempfile.gettempdir()) / "election-bench-seeds"))
+    p.add_argument("--startup-timeout", type=float, default=1800.0, help="seconds to wait for the snapshot to load")
+    p.add_argument("--out", help="write the JSON report here (default: stdout)")
+    p.add_argument("--compare", help="baseline JSON report to diff against (printed to stderr)")
+    args = p.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    cases = []
+    for votes in map(parse_count, args.votes.split(",")):
+        for concurrency in map(int, args.concurrency.split(",")):
+            print(f"votes={votes} concurrency={concurrency} ...", file=sys.stderr, flush=True)
+            cases.append(run_case(args, votes, concurrency, mix))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "workers": args.workers if args.server == "gunicorn" else 1,
+            "client_procs": args.client_procs,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "fsync": args.fsync,
+            "mix": mix,
+        },
+        "cases": cases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        for line in compare(report, json.loads(Path(args.compare).read_text())):
+            print(line, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# Picked up automatically by gunicorn from the working directory.
+import os
+
+def on_starting(server):
+    # STORE_MODE=shared: one store daemon for all workers, started before they fork
+    if os.environ.get("STORE_MODE") == "shared":
+        from app.shared_store import start_daemon
+        server.store_daemon = start_daemon()
+
+def on_exit(server):
+    daemon = getattr(server, "store_daemon", None)
+    if daemon is not None:
+        daemon.shutdown()
@@ -64,3 +64,837 @@ def test_encrypted_and_tally():
     r = client.post("/api/votes/homomorphic_tally", json={"ciphertexts": ["0x10","0x20"], "secret": "s3cr3t"})
     assert r.status_code == 200
     assert "combined_ciphertext" in r.json()
+
+def test_duplicate_vote_index_survives_save_and_load(tmp_path):
+    from app.data_store import InMemoryStore
+    s = InMemoryStore(persist_path=str(tmp_path / "state.json"))
+    s.voters["v1"] = {"voter_id": "v1", "name": "A", "age": 30, "district": None}
+    s.add_vote({"voter_id": "v1", "candidate_id": "c1", "weight": 2.0, "timestamp": "2024-01-01T00:00:00", "weighted": True})
+    assert not s.has_standard_vote("v1")
+    s.add_vote({"voter_id": "v1", "candidate_id": "c1", "weight": 1.0, "timestamp": "2024-01-01T00:00:01", "weighted": False})
+    assert s.has_standard_vote("v1")
+    s.save()
+
+    reloaded = InMemoryStore(persist_path=str(tmp_path / "state.json"))
+    assert reloaded.has_standard_vote("v1")
+    reloaded.reset()
+    assert not reloaded.has_standard_vote("v1")
+
+def test_running_tallies_follow_candidate_roster():
+    client.delete("/api/state/reset")
+    client.post("/api/voters", json={"voter_id": "t1", "name": "T", "age": 40})
+    client.post("/api/voters", json={"voter_id": "t2", "name": "U", "age": 41})
+    client.post("/api/candidates", json={"candidate_id": "ca", "name": "A"})
+    client.post("/api/candidates", json={"candidate_id": "cb", "name": "B"})
+    client.post("/api/votes", json={"voter_id": "t1", "candidate_id": "ca"})
+    client.post("/api/votes", json={"voter_id": "t2", "candidate_id": "cb"})
+    client.post("/api/votes/weighted", json={"voter_id": "t2", "candidate_id": "cb", "weight": 1.5})
+
+    board = client.get("/api/results/leaderboard").json()["leaderboard"]
+    assert board == [{"candidate_id": "cb", "votes": 2.5}, {"candidate_id": "ca", "votes": 1.0}]
+    assert client.get("/api/results/winner").json()["winner"] == "cb"
+
+    client.delete("/api/candidates/cb")
+    assert client.get("/api/votes/summary").json()["leaderboard"] == [{"candidate_id": "ca", "votes": 1.0}]
+    client.delete("/api/state/reset")
+    assert client.get("/api/results/leaderboard").json()["leaderboard"] == []
+
+def test_votes_in_range_uses_time_order_and_paging():
+    client.delete("/api/state/reset")
+    client.post("/api/candidates", json={"candidate_id": "c1", "name": "Carol"})
+    for i, ts in enumerate(["2024-01-03T00:00:00", "2024-01-01T00:00:00", "2024-01-02T00:00:00+00:00", "2024-01-05T00:00:00"]):
+        client.post("/api/voters", json={"voter_id": f"r{i}", "name": "R", "age": 30})
+        assert client.post("/api/votes", json={"voter_id": f"r{i}", "candidate_id": "c1", "timestamp": ts}).status_code == 218
+
+    r = client.get("/api/votes", params={"start": "2024-01-01T12:00:00", "end": "2024-01-04T00:00:00"})
+    assert r.status_code == 222
+    assert [v["voter_id"] for v in r.json()["votes"]] == ["r2", "r0"]
+
+    r = client.get("/api/votes", params={"limit": 2, "offset": 1}).json()
+    assert r["total"] == 4 and r["count"] == 2
+    assert [v["voter_id"] for v in r["votes"]] == ["r2", "r0"]
+    client.delete("/api/state/reset")
+
+def test_journal_replays_mutations_after_snapshot(tmp_path):
+    from app.data_store import InMemoryStore
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path, fsync="always")
+    s.put_voter({"voter_id": "j1", "name": "J", "age": 30, "district": None})
+    s.put_candidate({"candidate_id": "c1", "name": "C", "party": None})
+    s.save()
+    s.put_voter({"voter_id": "j2", "name": "K", "age": 31, "district": None})
+    s.add_vote({"voter_id": "j1", "candidate_id": "c1", "weight": 1.0, "timestamp": "2024-01-01T00:00:00", "weighted": False})
+    s.remove_voter("j2")
+    s.close()
+    # simulate a crash mid-append
+    with open(tmp_path / "state.wal", "ab") as f:
+        f.write(b'{"seq": 99, "op": "put_vo')
+
+    r = InMemoryStore(persist_path=path)
+    assert set(r.voters) == {"j1"}
+    assert r.has_standard_vote("j1")
+    assert r.candidate_totals() == {"c1": 1.0}
+    r.add_encrypted_ballot({"voter_id": "j1", "ciphertext": "0x1", "proof": "p", "metadata": None})
+    r.close()
+
+    again = InMemoryStore(persist_path=path)
+    assert len(again.votes) == 1 and len(again.encrypted_ballots) == 1
+    again.close()
+
+def test_interval_fsync_runs_off_the_appending_thread(tmp_path, monkeypatch):
+    import os, threading, time
+    from app.services.journal import Journal
+    synced = []
+    real = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (synced.append(threading.current_thread().name), real(fd)))
+    j = Journal(tmp_path / "j.wal", fsync="interval", fsync_interval=0.01)
+    j.append({"seq": 1, "op": "reset"})
+    assert synced == []  # the append itself never waits on the disk
+    deadline = time.monotonic() + 2
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert synced and synced[0].startswith("journal-flush")
+    j.close()
+
+def test_shared_store_daemon_is_atomic_across_clients(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.data_store import StoreError
+    from app.shared_store import start_daemon, SharedStoreClient
+    monkeypatch.setenv("STATE_PATH", str(tmp_path / "state.json"))
+    sock = str(tmp_path / "store.sock")
+    daemon = start_daemon(address=sock, authkey=b"test")
+    try:
+        a = SharedStoreClient(address=sock, authkey=b"test")
+        b = SharedStoreClient(address=sock, authkey=b"test")
+        a.register_voter({"voter_id": "s1", "name": "S", "age": 30, "district": None})
+        b.register_candidate({"candidate_id": "c1", "name": "C", "party": None})
+        with pytest.raises(StoreError) as err:
+            b.register_voter({"voter_id": "s1", "name": "S", "age": 30, "district": None})
+        assert err.value.status_code == 409
+
+        def cast(client):
+            try:
+                client.cast_vote({"voter_id": "s1", "candidate_id": "c1", "weight": 1.0,
+                                  "timestamp": "2024-01-01T00:00:00", "weighted": False})
+                return 218
+            except StoreError as e:
+                return e.status_code
+
+        with ThreadPoolExecutor(8) as pool:
+            codes = list(pool.map(cast, [a, b] * 8))
+        assert codes.count(218) == 1 and codes.count(409) == 15
+        assert a.leaderboard() == [{"candidate_id": "c1", "votes": 1.0}]
+        assert (tmp_path / "state.wal").exists()
+    finally:
+        daemon.shutdown()
+
+def test_vote_log_round_trips_dict_rows():
+    from app.services.vote_log import VoteLog
+    rows = [
+        {"voter_id": "a", "candidate_id": "c1", "weight": 1.0, "timestamp": "2024-01-01T10:00:00", "weighted": False},
+        {"voter_id": "b", "candidate_id": "c2", "weight": 2.5, "timestamp": "2024-01-01T10:00:00.123456+05:30", "weighted": True},
+        {"voter_id": "a", "candidate_id": "c2", "weight": None, "timestamp": "2023-12-31T23:59:59+00:00", "weighted": False},
+    ]
+    log = VoteLog(rows)
+    assert list(log) == rows
+    assert log[-1] == rows[-1] and log[1:] == rows[1:]
+    assert log.tallies() == ({"c1": 1.0, "c2": 3.5}, {"c1": 1, "c2": 2})
+    assert log.standard_voters() == {"a"} and log.distinct_voters() == 2
+
+def test_bulk_ingest_json_and_ndjson():
+    client.delete("/api/state/reset")
+    r = client.post("/api/voters/bulk", json=[
+        {"voter_id": "b1", "name": "A", "age": 30},
+        {"voter_id": "b2", "name": "B", "age": 17},
+        {"voter_id": "b1", "name": "A", "age": 30},
+    ])
+    assert r.status_code == 200
+    assert [x["status_code"] for x in r.json()["results"]] == [218, 422, 409]
+    client.post("/api/candidates/bulk", json=[{"candidate_id": "c1", "name": "C"}])
+
+    body = "\n".join([
+        '{"voter_id": "b1", "candidate_id": "c1"}',
+        '{"voter_id": "b1", "candidate_id": "c1"}',
+        '{"voter_id": "b1", "candidate_id": "c1", "weight": 2, "weighted": true}',
+        '{"voter_id": "nobody", "candidate_id": "c1"}',
+        'not json',
+    ])
+    r = client.post("/api/votes/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    out = r.json()
+    assert [x["status_code"] for x in out["results"]] == [218, 409, 218, 404, 422]
+    assert out["accepted"] == 2 and out["rejected"] == 3
+    assert client.get("/api/results/leaderboard").json()["leaderboard"] == [{"candidate_id": "c1", "votes": 3.0}]
+    assert client.get("/openapi.json").status_code == 200
+    client.delete("/api/state/reset")
+
+def test_cursor_pagination_and_ndjson_streams():
+    import json
+    client.delete("/api/state/reset")
+    client.post("/api/voters/bulk", json=[{"voter_id": f"p{i}", "name": "P", "age": 30} for i in range(5)])
+    r = client.get("/api/voters", params={"limit": 2})
+    assert [v["voter_id"] for v in r.json()] == ["p0", "p1"]
+    cursor = r.headers["x-next-cursor"]
+    client.delete("/api/voters/p2")
+    r = client.get("/api/voters", params={"limit": 2, "cursor": cursor})
+    assert [v["voter_id"] for v in r.json()] == ["p3", "p4"]
+    assert "x-next-cursor" not in r.headers
+
+    r = client.get("/api/voters", params={"stream": True})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["voter_id"] for line in r.text.splitlines()] == ["p0", "p1", "p3", "p4"]
+
+    client.post("/api/candidates", json={"candidate_id": "c1", "name": "C"})
+    client.post("/api/votes/bulk", json=[
+        {"voter_id": f"p{i}", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:00"} for i in (0, 1, 3, 4)
+    ])
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/votes", params=params).json()
+        seen += [v["voter_id"] for v in page["votes"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["p0", "p1", "p3", "p4"]
+    assert client.get("/api/votes", params={"cursor": "bogus"}).status_code == 422
+    r = client.get("/api/votes", params={"stream": True})
+    assert r.status_code == 222 and len(r.text.splitlines()) == 4
+    client.delete("/api/state/reset")
+
+def _reference_schulze(C, ballots):
+    # the original pure-Python implementation, kept as an oracle
+    idx = {c: i for i, c in enumerate(C)}
+    n = len(C)
+    d = [[0] * n for _ in range(n)]
+    for ballot in ballots:
+        rank = {cand: i for i, cand in enumerate(ballot)}
+        for a in C:
+            for b in C:
+                if a == b: continue
+                if rank.get(a, 10**9) < rank.get(b, 10**9):
+                    d[idx[a]][idx[b]] += 1
+    p = [[d[i][j] if i != j and d[i][j] > d[j][i] else 0 for j in range(n)] for i in range(n)]
+    for i in range(n):
+        for j in range(n):
+            if i == j: continue
+            for k in range(n):
+                if i == k or j == k: continue
+                p[j][k] = max(p[j][k], min(p[j][i], p[i][k]))
+    winners = [C[i] for i in range(n) if all(p[i][j] >= p[j][i] for j in range(n) if i != j)]
+    return {"winners": winners, "matrix": p}
+
+def test_schulze_matches_reference_implementation():
+    import random
+    rng = random.Random(7)
+    for _ in range(200):
+        names = [chr(65 + i) for i in range(rng.randint(1, 6))]
+        candidates = names + ([rng.choice(names)] if rng.random() < 0.2 else [])
+        ballots = []
+        for _ in range(rng.randint(0, 25)):
+            b = rng.sample(names + ["Z"], rng.randint(0, len(names)))
+            if b and rng.random() < 0.2:
+                b.append(rng.choice(b))
+            ballots.append(b)
+        r = client.post("/api/votes/rcv/schulze", json={"candidates": candidates, "ballots": ballots})
+        assert r.json() == _reference_schulze(candidates, ballots)
+
+def test_stored_rcv_contest_matches_stateless_schulze(tmp_path):
+    from app.data_store import InMemoryStore
+    candidates = ["A", "B", "C"]
+    batches = [[["A", "B", "C"], ["B", "C", "A"]], [["A", "C", "B"], ["C", "A", "B"], ["C", "B"]]]
+    r = client.post("/api/votes/rcv/contests", json={"contest_id": "k1", "candidates": candidates})
+    assert r.status_code == 218
+    assert client.post("/api/votes/rcv/contests", json={"contest_id": "k1", "candidates": candidates}).status_code == 409
+    for batch in batches:
+        r = client.post("/api/votes/rcv/contests/k1/ballots", json={"ballots": batch})
+    assert r.json()["ballots"] == 5
+    result = client.get("/api/votes/rcv/contests/k1/schulze").json()
+    expected = _reference_schulze(candidates, batches[0] + batches[1])
+    assert (result["winners"], result["matrix"]) == (expected["winners"], expected["matrix"])
+    assert client.get("/api/votes/rcv/contests/nope/schulze").status_code == 404
+
+    s = InMemoryStore(persist_path=str(tmp_path / "state.json"))
+    s.create_contest({"contest_id": "k2", "candidates": candidates})
+    s.add_contest_ballots("k2", batches[0])
+    s.save()
+    s.add_contest_ballots("k2", batches[1])
+    s.close()
+    reloaded = InMemoryStore(persist_path=str(tmp_path / "state.json"))
+    assert reloaded.contest_result("k2")["matrix"] == expected["matrix"]
+    reloaded.close()
+
+def test_encrypted_ballot_batch_reports_per_ballot():
+    import hashlib
+    client.post("/api/voters", json={"voter_id": "eb1", "name": "E", "age": 30})
+    proof = lambda v, c: hashlib.sha256((v + "|" + c).encode()).hexdigest()[:16]
+    ballots = [{"voter_id": "eb1", "ciphertext": hex(i), "proof": proof("eb1", hex(i))} for i in range(600)]
+    ballots.append({"voter_id": "eb1", "ciphertext": "0x1", "proof": "bad"})
+    ballots.append({"voter_id": "ghost", "ciphertext": "0x1", "proof": "bad"})
+    r = client.post("/api/votes/encrypted/batch", json=ballots)
+    out = r.json()
+    assert out["accepted"] == 600 and out["rejected"] == 2
+    assert [x["status_code"] for x in out["results"][-2:]] == [400, 404]
+    indexes = [x["ballot_index"] for x in out["results"][:600]]
+    assert indexes == sorted(indexes) and len(set(indexes)) == 600
+
+def test_stored_encrypted_tally_reads_running_sum():
+    import hashlib
+    from app.services import encryption
+    client.delete("/api/state/reset")
+    client.post("/api/voters", json={"voter_id": "h1", "name": "H", "age": 30})
+    proof = lambda c: hashlib.sha256(("h1|" + c).encode()).hexdigest()[:16]
+    plan = [(1, "north"), (0, "south"), (1, "north"), (1, "south")]
+    for x, district in plan:
+        ct = encryption.encrypt_plaintext(x, "s3cr3t")
+        client.post("/api/votes/encrypted", json={"voter_id": "h1", "ciphertext": ct, "proof": proof(ct), "metadata": {"district": district}})
+    client.post("/api/votes/encrypted", json={"voter_id": "h1", "ciphertext": "zz", "proof": proof("zz")})
+
+    r = client.post("/api/votes/encrypted/tally", json={"group_by": "district"}).json()
+    assert r["ballots"] == 4 and r["skipped"] == 1
+    assert r["groups"]["north"]["ballots"] == 2 and r["decrypted_sum_mod_p"] is None
+    key = encryption.derive_key("s3cr3t")
+    r = client.post("/api/votes/encrypted/tally", json={"group_by": "district", "secret": "s3cr3t"}).json()
+    # each toy ciphertext carries one key share, so subtract the extra (n - 1) shares
+    assert (r["groups"]["north"]["decrypted_sum_mod_p"] - key) % encryption.MODULUS == 2
+    assert (r["decrypted_sum_mod_p"] - 3 * key) % encryption.MODULUS == 3
+    client.delete("/api/state/reset")
+    assert client.post("/api/votes/encrypted/tally", json={}).json()["ballots"] == 0
+
+def test_streaming_homomorphic_tally_matches_in_memory_tally(monkeypatch):
+    from app.services import encryption
+    monkeypatch.setattr(encryption, "TALLY_BLOCK_BYTES", 64)  # force many blocks
+    cts = [hex((i * 7919) ** 3) for i in range(500)]
+    expected = encryption.homomorphic_add(cts)
+    body = "\n".join(f'"{c}"' if i % 2 else c for i, c in enumerate(cts)) + "\n"
+    for parallel in ("false", "true"):
+        r = client.post(f"/api/votes/homomorphic_tally/stream?parallel={parallel}", content=body,
+                        headers={"content-type": "application/x-ndjson", "x-tally-secret": "s3cr3t"})
+        out = r.json()
+        assert out["count"] == 500 and out["combined_ciphertext"] == expected
+        assert out["decrypted_sum_mod_p"] == encryption.decrypt_ciphertext(expected, "s3cr3t")
+    r = client.post("/api/votes/homomorphic_tally/stream", content="0x10\nnope\n")
+    assert r.status_code == 422
+    # a line with no end in sight is refused instead of buffered without limit
+    monkeypatch.setattr(encryption, "TALLY_MAX_LINE_BYTES", 1000)
+    for body in ("0x10\n" + "f" * 5000, "0x10\n" + "f" * 5000 + "\n0x1\n"):
+        assert client.post("/api/votes/homomorphic_tally/stream?parallel=false", content=body).status_code == 413
+
+def test_fine_grained_locks_keep_lookups_off_the_vote_path(tmp_path):
+    import threading
+    from app.data_store import InMemoryStore
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path)
+    for i in range(40):
+        s.register_voter({"voter_id": f"v{i}", "name": "V", "age": 30, "district": None})
+    s.register_candidate({"candidate_id": "c1", "name": "C", "party": "P"})
+    s.register_candidate({"candidate_id": "c2", "name": "D", "party": None})
+
+    # a long vote-side operation doesn't hold up candidate or voter reads
+    done = threading.Event()
+    def lookups():
+        assert s.get_candidate("c1")["party"] == "P"
+        assert len(s.list_candidates("P")) == 1 and len(s.list_voters()) == 40
+        assert s.candidates_page(None, 10)[0][0]["candidate_id"] == "c1"
+        done.set()
+    with s._votes_lock.write():
+        t = threading.Thread(target=lookups)
+        t.start()
+        t.join(5)
+    assert done.is_set()
+
+    # concurrent casts, registrations and a save still add up, and replay to the same state
+    def cast(lo):
+        for i in range(lo, 40, 4):
+            s.cast_vote({"voter_id": f"v{i}", "candidate_id": "c1" if i % 2 else "c2", "weight": 1.0,
+                         "timestamp": "2024-01-01T00:00:00", "weighted": False})
+    workers = [threading.Thread(target=cast, args=(k,)) for k in range(4)]
+    workers.append(threading.Thread(target=s.register_voters, args=([{"voter_id": f"w{i}", "name": "W", "age": 20, "district": None} for i in range(50)],)))
+    workers.append(threading.Thread(target=s.save))
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(10)
+    assert s.candidate_totals() == {"c1": 20.0, "c2": 20.0} and s.turnout() == 40
+    s.close()
+    again = InMemoryStore(persist_path=path)
+    assert again.candidate_totals() == {"c1": 20.0, "c2": 20.0} and len(again.voters) == 90
+    again.close()
+
+def test_async_store_runs_inline_and_falls_back_when_contended():
+    import asyncio, threading
+    from app.data_store import AsyncStore, InMemoryStore, StoreError
+    s = InMemoryStore()
+    a = AsyncStore(s)
+    vote = {"voter_id": "a1", "candidate_id": "c1", "weight": 1.0, "timestamp": "2024-01-01T00:00:00", "weighted": False}
+
+    async def flow():
+        await a.register_voter({"voter_id": "a1", "name": "A", "age": 30, "district": None})
+        await a.register_candidate({"candidate_id": "c1", "name": "C", "party": None})
+        # another thread holds the vote indexes: the call waits in the threadpool, not on the loop
+        held, release = threading.Event(), threading.Event()
+        def holder():
+            with s._votes_lock.write():
+                held.set()
+                release.wait(5)
+        threading.Thread(target=holder).start()
+        held.wait(5)
+        pending = asyncio.ensure_future(a.cast_vote(vote))
+        await asyncio.sleep(0.05)  # the loop keeps running meanwhile
+        assert not pending.done()
+        release.set()
+        await pending
+        with pytest.raises(StoreError):
+            await a.cast_vote(vote)
+        return await a.leaderboard()
+
+    assert asyncio.run(flow()) == [{"candidate_id": "c1", "votes": 1.0}]
+
+    # a WouldBlock halfway through a multi-lock call releases the locks it already took
+    from app.services.rwlock import WouldBlock
+    held, release, written = threading.Event(), threading.Event(), threading.Event()
+    def holder():
+        with s._votes_lock.write():
+            held.set()
+            release.wait(5)
+    threading.Thread(target=holder, daemon=True).start()
+    held.wait(5)
+    with pytest.raises(WouldBlock) as blocked:
+        s.call_nowait("dp_release", "per_candidate", 1.0, 1.0)
+    def writer():
+        with s._candidates_lock.write():
+            written.set()
+    t = threading.Thread(target=writer, daemon=True)  # stuck if the read locks leaked
+    t.start()
+    t.join(2)
+    release.set()
+    assert written.is_set() and blocked.value is not None
+
+def test_prometheus_metrics_exposition(tmp_path):
+    import re, threading
+    from app.data_store import InMemoryStore
+    client.delete("/api/state/reset")
+    client.post("/api/voters", json={"voter_id": "m1", "name": "M", "age": 30})
+    client.get("/api/voters/m1")
+    client.get("/api/voters/missing")
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    assert 'http_requests_total{method="GET",route="/api/voters/{voter_id}",status="404"}' in text
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/api/voters",le="+Inf"}' in text
+    assert 'http_request_duration_quantile_seconds{method="GET",route="/api/voters/{voter_id}",quantile="0.99"}' in text
+    assert 'http_request_handler_seconds_total{method="GET",route="/api/voters/{voter_id}"}' in text
+    assert 'store_collection_size{collection="voters"} 1' in text
+    assert "X-Response-Time" in client.get("/health").headers
+
+    # contended lock waits and snapshot timings land in the store families
+    s = InMemoryStore(persist_path=str(tmp_path / "state.json"))
+    s.register_candidate({"candidate_id": "c1", "name": "C", "party": None})
+    held = threading.Event()
+    def holder():
+        with s._candidates_lock.write():
+            held.set()
+            threading.Event().wait(0.05)
+    t = threading.Thread(target=holder)
+    t.start()
+    held.wait(5)
+    s.get_candidate("c1")  # lock-free: no wait recorded
+    s.list_candidates()
+    t.join()
+    s.save()
+    text = s.metrics_exposition()
+    assert 'store_lock_wait_seconds_count{lock="candidates",mode="read"} ' in text
+    assert re.search(r"^store_snapshot_seconds_count [1-9]", text, re.M)
+    assert re.search(r"^store_snapshot_bytes [1-9]", text, re.M)
+    assert "store_journal_append_seconds_count" in text
+    s.close()
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    from app.services.telemetry import Histogram
+    h = Histogram("t_seconds", "test", ("route",), buckets=(0.1, 0.2, 0.4))
+    for v in [0.05] * 50 + [0.15] * 45 + [0.3] * 5:
+        h.observe(v, "/x")
+    assert h.quantile(0.5, "/x") == pytest.approx(0.1)
+    assert 0.1 < h.quantile(0.95, "/x") <= 0.2
+    assert 0.2 < h.quantile(0.99, "/x") <= 0.4
+    assert h.quantile(0.5, "/y") is None
+
+def test_fast_json_read_paths_match_response_models():
+    from app.models.voter import VoterOut
+    client.delete("/api/state/reset")
+    client.post("/api/voters", json={"voter_id": "f1", "name": "Ä", "age": 30, "district": "d1"})
+    client.post("/api/voters", json={"voter_id": "f2", "name": "B", "age": 40})
+    client.post("/api/candidates", json={"candidate_id": "fc", "name": "C", "party": "P"})
+    r = client.get("/api/voters")
+    assert r.headers["content-type"] == "application/json"
+    assert r.json() == [VoterOut(voter_id="f1", name="Ä", age=30, district="d1").dict(), VoterOut(voter_id="f2", name="B", age=40).dict()]
+    assert client.get("/api/voters/f2").json() == {"voter_id": "f2", "name": "B", "age": 40, "district": None}
+    # the cached encoding follows updates
+    client.put("/api/voters/f2", json={"age": 41})
+    assert client.get("/api/voters/f2").json()["age"] == 41
+    assert client.get("/api/voters", params={"limit": 1}).headers["X-Next-Cursor"]
+    assert client.get("/api/candidates", params={"party": "P"}).json() == [{"candidate_id": "fc", "name": "C", "party": "P"}]
+    assert client.get("/api/candidates/nope").status_code == 404
+
+    # the documented schemas still come from the response models
+    paths = app.openapi()["paths"]
+    assert paths["/api/voters"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["items"]["$ref"].endswith("/VoterOut")
+    assert paths["/api/candidates/{candidate_id}"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["$ref"].endswith("/CandidateOut")
+
+def test_district_and_party_indexes_stay_consistent(tmp_path):
+    import random
+    from app.data_store import InMemoryStore
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path)
+    rng = random.Random(7)
+    districts = ["north", "south", "east", None]
+
+    def check(store):
+        for d in districts[:-1]:
+            expected = [v for v in store.voters.values() if v.get("district") == d]
+            assert store.list_voters(d) == expected
+            # paging through the index visits the same voters, in order
+            paged, cursor = [], None
+            while True:
+                page, cursor = store.voters_page(cursor, 3, d)
+                paged += page
+                if cursor is None:
+                    break
+            assert paged == expected
+        assert store.district_counts() == {
+            d: n for d in districts[:-1] if (n := sum(v.get("district") == d for v in store.voters.values()))
+        }
+        for p in ("red", "blue"):
+            assert store.list_candidates(p) == [c for c in store.candidates.values() if c.get("party") == p]
+
+    for step in range(300):
+        vid = f"v{rng.randrange(40)}"
+        op = rng.random()
+        if step == 150:
+            s.save()
+        if op < 0.5:
+            if s.voter_exists(vid):
+                s.update_voter(vid, {"district": rng.choice(districts)})
+            else:
+                s.register_voter({"voter_id": vid, "name": "V", "age": 30, "district": rng.choice(districts)})
+        elif op < 0.7 and s.voter_exists(vid):
+            s.delete_voter(vid)
+        else:
+            cid = f"c{rng.randrange(8)}"
+            party = rng.choice(["red", "blue", None])
+            if s.get_candidate(cid):
+                s.update_candidate(cid, {"party": party})
+            else:
+                s.register_candidate({"candidate_id": cid, "name": "C", "party": party})
+    check(s)
+    s.close()
+    reloaded = InMemoryStore(persist_path=path)
+    check(reloaded)
+    reloaded.reset()
+    assert reloaded.district_counts() == {} and reloaded.list_voters("north") == []
+    reloaded.close()
+
+    client.delete("/api/state/reset")
+    client.post("/api/voters", json={"voter_id": "d1", "name": "A", "age": 30, "district": "north"})
+    client.post("/api/voters", json={"voter_id": "d2", "name": "B", "age": 30, "district": "south"})
+    client.post("/api/voters", json={"voter_id": "d3", "name": "C", "age": 30, "district": "north"})
+    assert [v["voter_id"] for v in client.get("/api/voters", params={"district": "north"}).json()] == ["d1", "d3"]
+    assert client.get("/api/results/districts").json() == {"districts": {"north": 2, "south": 1}}
+    # "districts" is an ordinary voter id
+    client.post("/api/voters", json={"voter_id": "districts", "name": "D", "age": 30, "district": None})
+    assert client.get("/api/voters/districts").json()["voter_id"] == "districts"
+
+def test_results_etags_and_not_modified():
+    client.delete("/api/state/reset")
+    client.post("/api/candidates", json={"candidate_id": "ec1", "name": "A", "party": "P"})
+    client.post("/api/voters", json={"voter_id": "ev1", "name": "V", "age": 30})
+    r = client.get("/api/results/leaderboard")
+    tag = r.headers["ETag"]
+    assert tag.startswith('"') and not tag.startswith("W/")
+    assert r.json() == {"leaderboard": [{"candidate_id": "ec1", "votes": 0.0}]}
+    assert client.get("/api/votes/summary").headers["ETag"] == tag
+
+    r = client.get("/api/results/leaderboard", headers={"If-None-Match": tag})
+    assert r.status_code == 304 and r.headers["ETag"] == tag and not r.content
+    # voter registrations don't touch results
+    client.post("/api/voters", json={"voter_id": "ev2", "name": "W", "age": 31})
+    assert client.get("/api/results/leaderboard", headers={"If-None-Match": f'"x", W/{tag}'}).status_code == 304
+
+    winner_tag = client.get("/api/results/winner").headers["ETag"]
+    client.post("/api/votes", json={"voter_id": "ev1", "candidate_id": "ec1"})
+    r = client.get("/api/results/leaderboard", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and r.headers["ETag"] != tag
+    assert r.json()["leaderboard"][0]["votes"] == 1.0
+    r = client.get("/api/results/winner", headers={"If-None-Match": winner_tag})
+    assert r.status_code == 200 and r.json()["winner"] == "ec1"
+
+def test_live_results_stream_coalesces_bursts():
+    import asyncio
+    import json
+    from app.data_store import store
+    from app.routes import results
+    client.delete("/api/state/reset")
+    client.post("/api/candidates", json={"candidate_id": "lc", "name": "L", "party": "P"})
+    for i in range(50):
+        client.post("/api/voters", json={"voter_id": f"lv{i}", "name": "V", "age": 30})
+
+    async def run():
+        results.live.tick = 0.01
+        frames, gone = [], asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                frames.append(dict(message["headers"])[b"content-type"])
+            elif message.get("body"):
+                frames.append(message["body"])
+
+        async def frames_at_least(n):
+            while len(frames) < n:
+                await asyncio.sleep(0.005)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/api/results/live", "raw_path": b"/api/results/live",
+            "query_string": b"", "root_path": "", "headers": [], "client": ("t", 1), "server": ("t", 80),
+        }
+        task = asyncio.create_task(app(scope, receive, send))
+        await asyncio.wait_for(frames_at_least(2), 5)
+        assert results.live.subscribers == 1
+        for i in range(50):  # one burst within a tick
+            store.cast_vote({"voter_id": f"lv{i}", "candidate_id": "lc", "timestamp": "2024-01-01T00:00:00", "weighted": False})
+        await asyncio.wait_for(frames_at_least(3), 5)
+        await asyncio.sleep(0.1)  # several more ticks, nothing changed
+        gone.set()
+        await asyncio.wait_for(task, 5)
+        return frames
+
+    content_type, first, update, *rest = asyncio.run(run())
+    assert content_type.startswith(b"text/event-stream")
+    assert not rest and results.live.subscribers == 0
+    assert first.startswith(b"id: ") and b"event: results\n" in first
+    data = json.loads(update.split(b"data: ", 1)[1])
+    assert data == {"leaderboard": [{"candidate_id": "lc", "votes": 50.0}], "turnout": 50}
+
+def test_reload_builds_in_background_and_swaps_atomically(tmp_path, monkeypatch):
+    import threading
+    import time
+    from app.data_store import InMemoryStore
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path)
+    s.register_candidate({"candidate_id": "rc", "name": "C", "party": "P"})
+    s.register_voter({"voter_id": "r1", "name": "A", "age": 30})
+    s.save()
+    s.cast_vote({"voter_id": "r1", "candidate_id": "rc", "timestamp": "2024-01-01T00:00:00", "weighted": False})
+    version = s.version("candidates", "votes")
+
+    gate = threading.Event()
+    load_snapshot = InMemoryStore._load_snapshot
+    monkeypatch.setattr(InMemoryStore, "_load_snapshot", lambda self: (gate.wait(5), load_snapshot(self)))
+    assert s.reload() and not s.reload()
+    assert s.load_status()["state"] == "loading"
+    # the old state keeps serving reads and writes while the snapshot loads
+    assert s.get_voter("r1")["name"] == "A"
+    s.register_voter({"voter_id": "late", "name": "L", "age": 40})
+    gate.set()
+    for _ in range(500):
+        if s.load_status()["state"] == "ready":
+            break
+        time.sleep(0.01)
+    status = s.load_status()
+    assert status["state"] == "ready" and status["last_load"]["ok"]
+    # the write made during the load was caught up from the journal
+    assert [v["voter_id"] for v in s.list_voters()] == ["r1", "late"]
+    assert s.leaderboard() == [{"candidate_id": "rc", "votes": 1.0}] and s.has_standard_vote("r1")
+    assert s.version("candidates", "votes") != version
+    s.cast_vote({"voter_id": "late", "candidate_id": "rc", "timestamp": "2024-01-01T00:00:01", "weighted": False})
+    s.close()
+    monkeypatch.undo()
+    again = InMemoryStore(persist_path=path)
+    assert again.leaderboard() == [{"candidate_id": "rc", "votes": 2.0}]
+
+    r = client.post("/api/state/load")
+    assert r.status_code == 202
+    assert client.get("/health").json()["state"] in ("loading", "ready")
+    while client.get("/health").json()["state"] == "loading":
+        time.sleep(0.01)
+
+def test_binary_snapshot_loads_lazily_and_matches_json(tmp_path):
+    from app.data_store import InMemoryStore
+    from app.services.snapshot import MappedDict
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path, snapshot_format="binary")
+    for i in range(40):
+        s.register_voter({"voter_id": f"b{i}", "name": f"Ñ{i}", "age": 30, "district": ["n", "s", None][i % 3]})
+    s.register_candidate({"candidate_id": "bc", "name": "C", "party": "P"})
+    for i in range(0, 40, 2):
+        s.cast_vote({"voter_id": f"b{i}", "candidate_id": "bc", "timestamp": f"2024-01-01T00:00:{i:02d}", "weighted": False})
+    s.delete_voter("b1")
+    s.submit_encrypted_ballot({"voter_id": "b0", "ciphertext": "1f", "metadata": {"m": "x"}})
+    s.save()
+    s.close()
+    assert (tmp_path / "state.snap").exists() and not (tmp_path / "state.json").exists()
+
+    def view(st):
+        return (
+            st.list_voters(), st.voters_page(None, 5, "n"), st.candidates_page(None, 5), st.leaderboard(),
+            st.district_counts(), st.votes_in_range(None, None, 3, 0, None), st.encrypted_tally(),
+            [st.has_standard_vote(f"b{i}") for i in range(4)], st.turnout(),
+        )
+
+    b = InMemoryStore(persist_path=path)
+    assert isinstance(b.voters, MappedDict) and not b.voters._live  # nothing decoded yet
+    assert b.get_voter("b2") == {"voter_id": "b2", "name": "Ñ2", "age": 30, "district": None}
+    assert b.get_voter("b1") is None and len(b.voters._live) == 1
+    # JSON stays available as an export, and then is the newer snapshot
+    b.save("json")
+    b.close()
+    (tmp_path / "j").mkdir()
+    (tmp_path / "j" / "state.json").write_bytes((tmp_path / "state.json").read_bytes())
+    j = InMemoryStore(persist_path=str(tmp_path / "j" / "state.json"))
+    assert isinstance(j.voters, dict) and isinstance(InMemoryStore(persist_path=path).voters, dict)
+    assert view(j) == view(b)
+
+    # writes on top of a mapped load: updates, deletes, re-adds, duplicate checks
+    for st in (b, j):
+        st.update_voter("b4", {"district": "n"})
+        st.delete_voter("b6")
+        st.register_voter({"voter_id": "b6", "name": "again", "age": 50, "district": "n"})
+        st.cast_vote({"voter_id": "b3", "candidate_id": "bc", "timestamp": "2024-01-01T00:01:00", "weighted": False})
+        with pytest.raises(Exception):
+            st.cast_vote({"voter_id": "b2", "candidate_id": "bc", "timestamp": "2024-01-01T00:01:00", "weighted": False})
+    assert view(b) == view(j)
+
+def test_sharded_store_matches_single_store_and_isolates_shards(tmp_path):
+    import threading
+    from app.data_store import InMemoryStore
+    from app.sharded_store import ShardedStore
+    path = str(tmp_path / "state.json")
+    one, sh = InMemoryStore(), ShardedStore(4, path)
+    for st in (one, sh):
+        for c in ("c1", "c2", "c3"):
+            st.register_candidate({"candidate_id": c, "name": c, "party": "P" if c != "c3" else None})
+        st.register_voters([{"voter_id": f"v{i}", "name": "V", "age": 30, "district": f"d{i % 3}"} for i in range(60)])
+        st.cast_votes([{"voter_id": f"v{i}", "candidate_id": f"c{i % 3 + 1}", "timestamp": f"2024-01-01T00:00:{i % 7:02d}",
+                        "weighted": i % 5 == 0, "weight": 2.5} for i in range(60)])
+        st.submit_encrypted_ballots([{"voter_id": f"v{i}", "ciphertext": f"{i + 1:x}", "metadata": {"m": i % 2}} for i in range(9)], [True] * 9)
+        st.update_candidate("c3", {"party": "Q"})
+        st.delete_voter("v7")
+        assert st.cast_votes([{"voter_id": "v1", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:00", "weighted": False},
+                              {"voter_id": "nobody", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:00", "weighted": False}]) \
+            == [{"status_code": 409, "detail": "Duplicate vote from this voter"}, {"status_code": 404, "detail": "Voter does not exist"}]
+
+    def paged(fetch, limit):
+        out, cursor = [], None
+        while True:
+            items, cursor = fetch(cursor, limit)
+            out += items
+            if cursor is None:
+                return out
+
+    assert len({sh._index(f"v{i}") for i in range(60)}) == 4
+    assert sh.leaderboard() == one.leaderboard() and sh.turnout() == one.turnout()
+    assert sh.district_counts() == one.district_counts() and sh.list_candidates("Q") == one.list_candidates("Q")
+    assert sh.encrypted_tally("m") == one.encrypted_tally("m")
+    assert sorted(v["voter_id"] for v in paged(lambda a, n: sh.voters_page(a, n, "d1"), 7)) \
+        == sorted(v["voter_id"] for v in one.list_voters("d1"))
+    # merged in time order (ties by position, which differs from one store's), cursors resume exactly
+    merged = paged(lambda a, n: sh.votes_in_range(None, None, n, 0, a)[1:], 8)
+    assert [v["timestamp"] for v in merged] == [v["timestamp"] for v in one.votes_in_range()[1]]
+    assert sorted(merged, key=str) == sorted(one.votes_in_range()[1], key=str)
+    assert sh.votes_in_range()[0] == one.votes_in_range()[0] == 60
+
+    # a cast touches only its voter's shard: another shard's votes lock doesn't hold it up
+    busy = sh._shards[sh._index("v0")]
+    other = next(f"v{i}" for i in range(60) if sh._index(f"v{i}") != sh._index("v0"))
+    done = threading.Event()
+    def cast():
+        sh.cast_vote({"voter_id": other, "candidate_id": "c1", "timestamp": "2024-01-01T00:01:00", "weighted": True, "weight": 1.0})
+        done.set()
+    with busy._votes_lock.write():
+        t = threading.Thread(target=cast)
+        t.start()
+        t.join(5)
+        assert done.is_set()
+
+    # every shard persists on its own and comes back merged; the shard count is pinned
+    totals = sh.candidate_totals()
+    sh.save("binary")
+    sh.close()
+    again = ShardedStore(4, path)
+    assert again.candidate_totals() == totals and again.get_candidate("c3")["party"] == "Q"
+    again.close()
+    with pytest.raises(ValueError):
+        ShardedStore(3, path)
+
+def test_dp_releases_are_cached_per_version_and_charged_to_a_budget():
+    from app.data_store import InMemoryStore, StoreError
+    s = InMemoryStore(dp_budget=2.5)
+    s.register_candidate({"candidate_id": "c1", "name": "C", "party": "P"})
+    for i in range(5):
+        s.register_voter({"voter_id": f"p{i}", "name": "V", "age": 30, "district": "n" if i % 2 else "s"})
+    s.cast_vote({"voter_id": "p0", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:00", "weighted": False})
+
+    first = s.dp_release("per_candidate", 1.0, 1.0)
+    assert not first["cached"] and set(first["value"]) == {"c1"} and first["epsilon_spent"] == 1.0
+    # same data, same parameters: the same noisy answer, no new spend
+    again = s.dp_release("per_candidate", 1.0, 1.0)
+    assert again["cached"] and again["value"] == first["value"] and again["epsilon_spent"] == 1.0
+    # a registration doesn't touch per-candidate results, a vote does
+    s.register_voter({"voter_id": "p9", "name": "V", "age": 30, "district": None})
+    assert s.dp_release("per_candidate", 1.0, 1.0)["cached"]
+    s.cast_vote({"voter_id": "p1", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:01", "weighted": False})
+    fresh = s.dp_release("per_candidate", 1.0, 1.0)
+    assert not fresh["cached"] and fresh["epsilon_spent"] == 2.0
+    s.cast_vote({"voter_id": "p2", "candidate_id": "c1", "timestamp": "2024-01-01T00:00:02", "weighted": False})
+    with pytest.raises(StoreError) as e:
+        s.dp_release("per_candidate", 1.0, 1.0)  # 2.0 + 1.0 > 2.5
+    assert e.value.status_code == 403
+    # budgets are per metric; keyed metrics get one draw per key
+    districts = s.dp_release("per_district", 0.5, 1.0)
+    assert set(districts["value"]) == {"n", "s"} and districts["epsilon_spent"] == 0.5
+
+    r = client.post("/api/votes/analytics/dp", json={"metric": "turnout", "epsilon": 0.5})
+    assert r.status_code == 200 and r.json()["metric"] == "turnout" and isinstance(r.json()["value"], float)
+    assert client.post("/api/votes/analytics/dp", json={"metric": "turnout", "epsilon": 0.5}).json()["value"] == r.json()["value"]
+    assert client.post("/api/votes/analytics/dp", json={"metric": "nope"}).status_code == 422
+
+def test_snapshot_choice_follows_journal_seq_not_mtime(tmp_path):
+    import os
+    from app.data_store import InMemoryStore
+    path = str(tmp_path / "state.json")
+    s = InMemoryStore(persist_path=path)
+    s.register_voter({"voter_id": "m1", "name": "M", "age": 30, "district": None})
+    s.save("binary")
+    s.register_voter({"voter_id": "m2", "name": "M", "age": 30, "district": None})
+    s.save("json")
+    s.close()
+    # a restore or copy makes the older binary snapshot look newer
+    snap, js = tmp_path / "state.snap", tmp_path / "state.json"
+    os.utime(snap, ns=(js.stat().st_mtime_ns + 10**9,) * 2)
+    again = InMemoryStore(persist_path=path)
+    assert set(again.voters) == {"m1", "m2"}
+    again.close()
+
+def test_shared_store_socket_is_private_and_keyed(tmp_path, monkeypatch):
+    import os, stat
+    from multiprocessing import AuthenticationError
+    from app import shared_store
+    monkeypatch.setenv("STATE_PATH", str(tmp_path / "state.json"))
+    monkeypatch.delenv("STORE_AUTHKEY", raising=False)
+    sock = str(tmp_path / "priv" / "store.sock")
+    monkeypatch.setattr(shared_store, "DEFAULT_SOCKET", sock)
+    daemon = shared_store.start_daemon()
+    try:
+        key = os.environ["STORE_AUTHKEY"]  # generated per start, inherited by forked workers
+        assert len(key) == 64
+        assert stat.S_IMODE(os.stat(os.path.dirname(sock)).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(sock).st_mode) == 0o600
+        assert shared_store.SharedStoreClient(address=sock).config()["persist_enabled"]
+        with pytest.raises(AuthenticationError):
+            shared_store.SharedStoreClient(address=sock, authkey=b"election-store").config()
+    finally:
+        daemon.shutdown()
+        os.environ.pop("STORE_AUTHKEY", None)